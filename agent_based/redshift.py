@@ -9,36 +9,61 @@ CheckMK agent based checks for Redshift Networks UCTM
 """
 
 import json
-from typing import Any, Mapping
+import re
+import time
+from typing import Any, Mapping, MutableMapping
 from cmk.agent_based.v2 import (
     AgentSection,
+    Attributes,
     CheckPlugin,
     CheckResult,
     DiscoveryResult,
+    get_value_store,
+    InventoryPlugin,
+    InventoryResult,
     Metric,
     Result,
     Service,
     State,
+    TableRow,
     render,
 )
 
-from .redshift_common import parse_json_section
+from .redshift_common import (
+    cached_parse,
+    check_cluster,
+    check_fill_rate,
+    check_levels_from_params,
+    check_usage_levels,
+    discovery_item_matches,
+    instrumented,
+    parse_json_section,
+    render_percent,
+)
+from .redshift_metrics import (
+    hdd_usage,
+    interface_counters,
+    memory_entry,
+    parse_percent,
+    stats_mapping,
+    system_stats_memory,
+    used_percent,
+)
 
 
 # ============================================================================
 # System Statistics Section
 # ============================================================================
 
+@instrumented
+@cached_parse
 def parse_redshift_system_stats(string_table):
     """Parse system statistics section"""
     if not string_table:
         return None
     try:
-        data_list = json.loads(string_table[0][0])
         # Convert list of dicts to a single dict for easier access
-        if isinstance(data_list, list):
-            return {item["type"]: item["value"] for item in data_list if "type" in item and "value" in item}
-        return data_list
+        return stats_mapping(json.loads(string_table[0][0]))
     except (json.JSONDecodeError, IndexError, KeyError):
         return None
 
@@ -49,51 +74,67 @@ agent_section_redshift_system_stats = AgentSection(
 )
 
 
-def discover_redshift_system_stats(section) -> DiscoveryResult:
+@instrumented
+def discover_redshift_system_stats(section_redshift_system_stats, section_redshift_memory) -> DiscoveryResult:
     """Discover system stats service"""
-    if section:
+    if section_redshift_system_stats:
         yield Service()
 
 
-def check_redshift_system_stats(section) -> CheckResult:
-    """Check system statistics"""
+def _memory_service_records_metrics(params: Mapping[str, Any], section_redshift_memory) -> bool:
+    """Whether the Memory service owns the memory metrics of this host"""
+    if params.get("memory_metrics", "memory") != "memory":
+        return False
+    return memory_entry(section_redshift_memory) is not None
+
+
+@instrumented
+def check_redshift_system_stats(
+    params: Mapping[str, Any], section_redshift_system_stats, section_redshift_memory
+) -> CheckResult:
+    """Check system statistics with configurable thresholds"""
+    section = section_redshift_system_stats
     if not section:
         yield Result(state=State.UNKNOWN, summary="No data received")
         return
 
     # Memory metrics
-    if "Total Memory" in section and "Used Memory" in section:
-        total_mem_str = section["Total Memory"]
-        used_mem_str = section["Used Memory"]
-
-        # Parse memory values (e.g., "16173828 kB" or "3747460 kB (23.0%)")
-        try:
-            total_mem = int(total_mem_str.split()[0])
-            used_mem_parts = used_mem_str.split()
-            used_mem = int(used_mem_parts[0])
-
-            used_percent = (used_mem / total_mem * 100) if total_mem > 0 else 0
-
-            yield Metric("memory_used", used_mem * 1024)  # Convert kB to bytes
-            yield Metric("memory_total", total_mem * 1024)
-            yield Metric("memory_used_percent", used_percent)
-
-            yield Result(
-                state=State.OK if used_percent < 90 else State.WARN if used_percent < 95 else State.CRIT,
-                summary=f"Memory: {render.bytes(used_mem * 1024)} of {render.bytes(total_mem * 1024)} ({used_percent:.1f}%)"
-            )
-        except (ValueError, IndexError):
-            pass
+    # Parse memory values (e.g., "16173828 kB" or "3747460 kB (23.0%)")
+    try:
+        memory = system_stats_memory(section)
+    except (ValueError, IndexError):
+        memory = None
+    if memory is not None:
+        used_mem, total_mem = memory
+        record_metrics = not _memory_service_records_metrics(params, section_redshift_memory)
+        memory_levels = params.get("memory_levels")
+        # Predictive levels learn from this service's own memory_used_percent
+        predictive = bool(memory_levels) and memory_levels[0] == "predictive"
+
+        if record_metrics:
+            yield Metric("memory_used", used_mem)
+            yield Metric("memory_total", total_mem)
+        yield from check_levels_from_params(
+            used_percent(used_mem, total_mem),
+            levels_upper=memory_levels,
+            metric_name="memory_used_percent" if record_metrics or predictive else None,
+            render_func=render_percent,
+            label="Memory",
+        )
+        yield Result(state=State.OK, summary=f"{render.bytes(used_mem)} of {render.bytes(total_mem)}")
+        if not record_metrics:
+            yield Result(state=State.OK, notice="Memory metrics are recorded by the Memory service")
 
     # CPU usage
     if "CPU Usage" in section:
-        cpu_usage_str = section["CPU Usage"]
         try:
-            cpu_usage = float(cpu_usage_str.rstrip('%'))
-            yield Metric("cpu_percent", cpu_usage)
-            yield Result(
-                state=State.OK if cpu_usage < 80 else State.WARN if cpu_usage < 90 else State.CRIT,
-                summary=f"CPU: {cpu_usage:.1f}%"
+            cpu_usage = parse_percent(section["CPU Usage"])
+            yield from check_levels_from_params(
+                cpu_usage,
+                levels_upper=params.get("cpu_levels"),
+                metric_name="cpu_percent",
+                render_func=render_percent,
+                label="CPU",
             )
         except ValueError:
             pass
@@ -106,9 +147,16 @@ def check_redshift_system_stats(section) -> CheckResult:
 
 check_plugin_redshift_system_stats = CheckPlugin(
     name="redshift_system_stats",
+    sections=["redshift_system_stats", "redshift_memory"],
     service_name="System Stats",
     discovery_function=discover_redshift_system_stats,
     check_function=check_redshift_system_stats,
+    check_default_parameters={
+        "memory_levels": ("fixed", (90.0, 95.0)),
+        "cpu_levels": ("fixed", (80.0, 90.0)),
+        "memory_metrics": "memory",
+    },
+    check_ruleset_name="redshift_system_stats",
 )
 
 
@@ -116,6 +164,7 @@ check_plugin_redshift_system_stats = CheckPlugin(
 # HDD and Ethernet Section
 # ============================================================================
 
+@instrumented
 def parse_redshift_hdd_ethernet(string_table):
     """Parse HDD and Ethernet usage section"""
     return parse_json_section(string_table)
@@ -127,59 +176,55 @@ agent_section_redshift_hdd_ethernet = AgentSection(
 )
 
 
+@instrumented
 def discover_redshift_hdd(section) -> DiscoveryResult:
     """Discover HDD service"""
     if section and "HDD Usage Details" in section:
         yield Service()
 
 
-def check_redshift_hdd(params: Mapping[str, Any], section) -> CheckResult:
-    """Check HDD aggregate usage with configurable thresholds"""
+def _check_redshift_hdd(
+    params: Mapping[str, Any], section, value_store: MutableMapping[str, Any], trend_key: str
+) -> CheckResult:
     if not section or "HDD Usage Details" not in section:
         yield Result(state=State.UNKNOWN, summary="No HDD data")
         return
 
     hdd = section["HDD Usage Details"]
 
-    if "Total Space" in hdd and "Used Space" in hdd and "Used Percentage" in hdd:
-        total_space = hdd["Total Space"]
-        used_space = hdd["Used Space"]
-        used_percent_str = hdd["Used Percentage"]
+    # Sizes are reported as e.g. "1238542 MB"
+    try:
+        usage = hdd_usage(hdd)
+    except (ValueError, IndexError):
+        yield Result(state=State.OK, summary=f"{hdd['Used Space']} of {hdd['Total Space']}")
+        return
+    if usage is None:
+        return
+
+    used_bytes, total_bytes, used_pct = usage
+    # Use standard filesystem metric names
+    yield Metric("fs_used", used_bytes)
+    yield Metric("fs_size", total_bytes)
+    yield from check_usage_levels(used_pct, total_bytes - used_bytes, params, "fs_used_percent")
+    yield Result(state=State.OK, summary=f"{render.bytes(used_bytes)} of {render.bytes(total_bytes)}")
+    yield from check_fill_rate(value_store, trend_key, used_bytes, total_bytes - used_bytes, params, time.time())
+
+
+@instrumented
+def check_redshift_hdd(params: Mapping[str, Any], section) -> CheckResult:
+    """Check HDD aggregate usage with configurable thresholds and fill rate forecast"""
+    yield from _check_redshift_hdd(params, section, get_value_store(), "trend")
 
-        try:
-            used_percent = float(used_percent_str.rstrip('%'))
-
-            # Parse sizes (format: "1238542 MB")
-            total_mb = float(total_space.split()[0])
-            used_mb = float(used_space.split()[0])
-
-            total_bytes = int(total_mb * 1024 * 1024)
-            used_bytes = int(used_mb * 1024 * 1024)
-
-            # Use standard filesystem metric names
-            yield Metric("fs_used", used_bytes)
-            yield Metric("fs_size", total_bytes)
-            yield Metric("fs_used_percent", used_percent)
-
-            # Check against configurable thresholds
-            levels = params.get("levels", (80, 90))
-            if isinstance(levels, tuple) and len(levels) == 2:
-                warn, crit = levels
-                if used_percent >= crit:
-                    state = State.CRIT
-                elif used_percent >= warn:
-                    state = State.WARN
-                else:
-                    state = State.OK
-            else:
-                state = State.OK
-
-            yield Result(
-                state=state,
-                summary=f"{used_percent:.1f}% used ({render.bytes(used_bytes)} of {render.bytes(total_bytes)})"
-            )
-        except (ValueError, IndexError):
-            yield Result(state=State.OK, summary=f"{used_space} of {total_space}")
+
+@instrumented
+def cluster_check_redshift_hdd(params: Mapping[str, Any], section: Mapping[str, Any]) -> CheckResult:
+    """Check HDD usage of the best or worst cluster node"""
+    value_store = get_value_store()
+    yield from check_cluster(
+        lambda node, node_section: _check_redshift_hdd(params, node_section, value_store, f"trend.{node}"),
+        section,
+        params.get("cluster_mode", "worst"),
+    )
 
 
 check_plugin_redshift_hdd = CheckPlugin(
@@ -188,23 +233,41 @@ check_plugin_redshift_hdd = CheckPlugin(
     service_name="HDD Total",
     discovery_function=discover_redshift_hdd,
     check_function=check_redshift_hdd,
-    check_default_parameters={"levels": (80, 90)},
+    cluster_check_function=cluster_check_redshift_hdd,
+    check_default_parameters={"levels": ("fixed", (80.0, 90.0))},
     check_ruleset_name="redshift_hdd",
 )
 
 
-def discover_redshift_interfaces(section) -> DiscoveryResult:
-    """Discover network interfaces"""
+def _interface_group(name: str, params: Mapping[str, Any]) -> str | None:
+    """Return the name of the first interface group matching an interface"""
+    for group in params.get("groups", []):
+        if re.match(group["pattern"], name):
+            return group["name"]
+    return None
+
+
+def _discovered_interfaces(params: Mapping[str, Any], section) -> list:
+    """Return the names of all interfaces passing the discovery filters"""
     if not section or "Ethernet usage" not in section:
-        return
+        return []
+    return [
+        interface["Iface"]
+        for interface in section["Ethernet usage"]
+        if "Iface" in interface and discovery_item_matches(interface["Iface"], params)
+    ]
 
-    interfaces = section["Ethernet usage"]
-    for interface in interfaces:
-        if "Iface" in interface:
-            yield Service(item=interface["Iface"])
 
+@instrumented
+def discover_redshift_interfaces(params: Mapping[str, Any], section) -> DiscoveryResult:
+    """Discover network interfaces not rolled up into an interface group"""
+    for name in _discovered_interfaces(params, section):
+        if _interface_group(name, params) is None:
+            yield Service(item=name)
 
-def check_redshift_interfaces(item: str, section) -> CheckResult:
+
+@instrumented
+def check_redshift_interfaces(item: str, params: Mapping[str, Any], section) -> CheckResult:
     """Check network interface"""
     if not section or "Ethernet usage" not in section:
         return
@@ -226,21 +289,20 @@ def check_redshift_interfaces(item: str, section) -> CheckResult:
 
     yield Result(state=State.OK, summary=f"Status: {met}, IP: {ip_addr}")
 
-    # Traffic counters
-    for key, metric_name, label in [
-        ("RX-OK", "if_in_pkts", "RX packets"),
-        ("TX-OK", "if_out_pkts", "TX packets"),
-        ("RX-ERR", "if_in_errors", "RX errors"),
-        ("TX-ERR", "if_out_errors", "TX errors"),
-        ("RX-DRP", "if_in_discards", "RX dropped"),
-        ("TX-DRP", "if_out_discards", "TX dropped"),
-    ]:
-        if key in iface_data:
-            try:
-                value = int(iface_data[key])
-                yield Metric(metric_name, value)
-            except ValueError:
-                pass
+    for metric_name, value in interface_counters(iface_data).items():
+        yield Metric(metric_name, value)
+
+
+@instrumented
+def cluster_check_redshift_interfaces(
+    item: str, params: Mapping[str, Any], section: Mapping[str, Any]
+) -> CheckResult:
+    """Check a network interface of the best or worst cluster node"""
+    yield from check_cluster(
+        lambda _node, node_section: check_redshift_interfaces(item, params, node_section),
+        section,
+        params.get("cluster_mode", "worst"),
+    )
 
 
 check_plugin_redshift_interfaces = CheckPlugin(
@@ -248,7 +310,122 @@ check_plugin_redshift_interfaces = CheckPlugin(
     sections=["redshift_hdd_ethernet"],
     service_name="Interface %s",
     discovery_function=discover_redshift_interfaces,
+    discovery_ruleset_name="redshift_interfaces_discovery",
+    discovery_default_parameters={},
     check_function=check_redshift_interfaces,
+    cluster_check_function=cluster_check_redshift_interfaces,
+    check_default_parameters={},
+    check_ruleset_name="redshift_interfaces",
+)
+
+
+@instrumented
+def discover_redshift_interface_groups(params: Mapping[str, Any], section) -> DiscoveryResult:
+    """Discover one aggregated service per interface group with members"""
+    groups = {group["name"]: group["pattern"] for group in params.get("groups", [])}
+    found = {_interface_group(name, params) for name in _discovered_interfaces(params, section)}
+    for name, pattern in groups.items():
+        if name in found:
+            yield Service(item=name, parameters={"pattern": pattern})
+
+
+@instrumented
+def check_redshift_interface_groups(item: str, params: Mapping[str, Any], section) -> CheckResult:
+    """Check the summed traffic counters of an interface group"""
+    if not section or "Ethernet usage" not in section or "pattern" not in params:
+        return
+
+    members = [
+        interface
+        for interface in section["Ethernet usage"]
+        if re.match(params["pattern"], interface.get("Iface", ""))
+    ]
+    if not members:
+        yield Result(state=State.UNKNOWN, summary="No member interfaces found")
+        return
+
+    names = [interface["Iface"] for interface in members]
+    yield Result(
+        state=State.OK,
+        summary=f"Members: {len(members)}",
+        details=f"Members: {', '.join(names)}",
+    )
+
+    totals: dict = {}
+    for interface in members:
+        for metric_name, value in interface_counters(interface).items():
+            totals[metric_name] = totals.get(metric_name, 0) + value
+    for metric_name, value in totals.items():
+        yield Metric(metric_name, value)
+
+
+@instrumented
+def cluster_check_redshift_interface_groups(
+    item: str, params: Mapping[str, Any], section: Mapping[str, Any]
+) -> CheckResult:
+    """Check an interface group of the best or worst cluster node"""
+    yield from check_cluster(
+        lambda _node, node_section: check_redshift_interface_groups(item, params, node_section),
+        section,
+        params.get("cluster_mode", "worst"),
+    )
+
+
+check_plugin_redshift_interface_groups = CheckPlugin(
+    name="redshift_interface_groups",
+    sections=["redshift_hdd_ethernet"],
+    service_name="Interface group %s",
+    discovery_function=discover_redshift_interface_groups,
+    discovery_ruleset_name="redshift_interfaces_discovery",
+    discovery_default_parameters={},
+    check_function=check_redshift_interface_groups,
+    cluster_check_function=cluster_check_redshift_interface_groups,
+    check_default_parameters={},
+    check_ruleset_name="redshift_interfaces",
+)
+
+
+@instrumented
+def inventory_redshift_interfaces(section) -> InventoryResult:
+    """
+    Inventory static network interface attributes
+
+    Interfaces are keyed by their position in the netstat table, like the
+    index of the standard interface inventory. The "Met" field of the
+    appliance holds the MTU of the interface.
+    """
+    if not section or "Ethernet usage" not in section:
+        return
+
+    for index, interface in enumerate(section["Ethernet usage"], start=1):
+        name = interface.get("Iface")
+        if not name:
+            continue
+
+        columns: dict[str, str | int] = {"description": name}
+        try:
+            columns["mtu"] = int(interface["Met"])
+        except (KeyError, ValueError):
+            pass
+        yield TableRow(
+            path=["networking", "interfaces"],
+            key_columns={"index": index},
+            inventory_columns=columns,
+        )
+
+        ip_addr = interface.get("IPAddress")
+        if ip_addr and ip_addr != "n/a":
+            yield TableRow(
+                path=["networking", "addresses"],
+                key_columns={"address": ip_addr, "device": name},
+                inventory_columns={"type": "IPv6" if ":" in ip_addr else "IPv4"},
+            )
+
+
+inventory_plugin_redshift_interfaces = InventoryPlugin(
+    name="redshift_interfaces",
+    sections=["redshift_hdd_ethernet"],
+    inventory_function=inventory_redshift_interfaces,
 )
 
 
@@ -256,6 +433,7 @@ check_plugin_redshift_interfaces = CheckPlugin(
 # Chassis Information Section
 # ============================================================================
 
+@instrumented
 def parse_redshift_chassis(string_table):
     """Parse chassis information section"""
     return parse_json_section(string_table)
@@ -267,96 +445,46 @@ agent_section_redshift_chassis = AgentSection(
 )
 
 
+@instrumented
 def discover_redshift_chassis(section) -> DiscoveryResult:
     """Discover chassis service"""
     if section:
         yield Service()
 
 
+# Chassis state fields with their display labels and expected values
+CHASSIS_STATES = {
+    "boot_upState": ("Boot-up State", "Safe"),
+    "powerSupplyState": ("Power Supply State", "Safe"),
+    "thermalState": ("Thermal State", "Safe"),
+    "securityStatus": ("Security Status", "None"),
+}
+
+
+@instrumented
 def check_redshift_chassis(section) -> CheckResult:
-    """Check chassis information"""
+    """Check chassis state fields"""
     if not section:
         yield Result(state=State.UNKNOWN, summary="No chassis data")
         return
 
-    # Helper function to get and clean values
-    def get_value(key):
-        value = section.get(key, "")
-        return str(value).strip() if value else ""
-
-    # Determine overall state based on critical status fields
+    # Static chassis details go to the HW/SW inventory, see inventory_redshift_chassis
     state = State.OK
-    not_ok_items = []
-
-    # Check critical state fields
-    status_checks = {
-        "boot_upState": "Safe",
-        "powerSupplyState": "Safe",
-        "thermalState": "Safe",
-        "securityStatus": "None"
-    }
-
-    for key, expected_value in status_checks.items():
-        actual_value = get_value(key)
-        if actual_value and actual_value != expected_value:
+    summary_parts = []
+    for key, (label, expected_value) in CHASSIS_STATES.items():
+        value = section.get(key)
+        actual_value = str(value).strip() if value else ""
+        if not actual_value:
+            continue
+        if actual_value != expected_value:
             state = State.CRIT
-            not_ok_items.append(f"{key}: {actual_value}")
+            summary_parts.append(f"{label}: {actual_value} (expected {expected_value})")
+        else:
+            summary_parts.append(f"{label}: {actual_value}")
 
-    # Build summary with type, manufacturer, serialNumber, and any not OK items
-    summary_parts = []
+    summary = ", ".join(summary_parts) if summary_parts else "No chassis state available"
 
-    chassis_type = get_value("type")
-    if chassis_type:
-        summary_parts.append(f"Type: {chassis_type}")
-
-    manufacturer = get_value("manufacturer")
-    if manufacturer:
-        summary_parts.append(f"Manufacturer: {manufacturer}")
-
-    serial = get_value("serialNumber")
-    if serial:
-        summary_parts.append(f"S/N: {serial}")
-
-    # Add any not OK items to summary
-    if not_ok_items:
-        summary_parts.append("Issues: " + ", ".join(not_ok_items))
-
-    summary = ", ".join(summary_parts) if summary_parts else "Chassis info available"
-
-    # Build details with all fields
-    details_parts = []
-
-    # Map of all keys to display labels for details
-    detail_labels = {
-        "info": "Info",
-        "smbios": "SMBIOS",
-        "DMI": "DMI",
-        "handle": "Handle",
-        "manufacturer": "Manufacturer",
-        "type": "Type",
-        "lock": "Lock",
-        "version": "Version",
-        "serialNumber": "Serial Number",
-        "assetTag": "Asset Tag",
-        "boot_upState": "Boot-up State",
-        "powerSupplyState": "Power Supply State",
-        "thermalState": "Thermal State",
-        "securityStatus": "Security Status",
-        "OEMInformation": "OEM Information",
-        "height": "Height",
-        "numberOfPowerCords": "Number of Power Cords",
-        "containedElements": "Contained Elements"
-    }
-
-    for key, label in detail_labels.items():
-        if key in section:
-            value = get_value(key)
-            if value:
-                details_parts.append(f"{label}: {value}")
-
-    details = "\n".join(details_parts) if details_parts else "No details available"
-
-    yield Result(state=state, summary=summary, details=details)
+    yield Result(state=state, summary=summary)
 
 
 check_plugin_redshift_chassis = CheckPlugin(
@@ -367,10 +495,52 @@ check_plugin_redshift_chassis = CheckPlugin(
 )
 
 
+# Map of chassis keys to inventory attribute names
+CHASSIS_INVENTORY_ATTRIBUTES = {
+    "manufacturer": "manufacturer",
+    "type": "type",
+    "version": "version",
+    "serialNumber": "serial",
+    "assetTag": "asset_tag",
+    "info": "info",
+    "smbios": "smbios",
+    "DMI": "dmi",
+    "handle": "handle",
+    "lock": "lock",
+    "OEMInformation": "oem_information",
+    "height": "height",
+    "numberOfPowerCords": "power_cords",
+    "containedElements": "contained_elements",
+}
+
+
+@instrumented
+def inventory_redshift_chassis(section) -> InventoryResult:
+    """Inventory static chassis information"""
+    if not section:
+        return
+
+    attributes = {}
+    for key, attribute in CHASSIS_INVENTORY_ATTRIBUTES.items():
+        value = section.get(key)
+        if value and str(value).strip():
+            attributes[attribute] = str(value).strip()
+
+    if attributes:
+        yield Attributes(path=["hardware", "chassis"], inventory_attributes=attributes)
+
+
+inventory_plugin_redshift_chassis = InventoryPlugin(
+    name="redshift_chassis",
+    inventory_function=inventory_redshift_chassis,
+)
+
+
 # ============================================================================
 # Uptime Section
 # ============================================================================
 
+@instrumented
 def parse_redshift_uptime(string_table):
     """Parse uptime section"""
     return parse_json_section(string_table)
@@ -382,12 +552,14 @@ agent_section_redshift_uptime = AgentSection(
 )
 
 
+@instrumented
 def discover_redshift_uptime(section) -> DiscoveryResult:
     """Discover uptime service"""
     if section:
         yield Service()
 
 
+@instrumented
 def check_redshift_uptime(section) -> CheckResult:
     """Check system uptime"""
     if not section:
@@ -409,3 +581,204 @@ check_plugin_redshift_uptime = CheckPlugin(
     discovery_function=discover_redshift_uptime,
     check_function=check_redshift_uptime,
 )
+
+
+# ============================================================================
+# API Probe Section
+# ============================================================================
+
+@instrumented
+def parse_redshift_probe(string_table):
+    """Parse liveness probe section"""
+    return parse_json_section(string_table)
+
+
+agent_section_redshift_probe = AgentSection(
+    name="redshift_probe",
+    parse_function=parse_redshift_probe,
+)
+
+
+@instrumented
+def discover_redshift_probe(section) -> DiscoveryResult:
+    """Discover API probe service"""
+    if section:
+        yield Service()
+
+
+@instrumented
+def check_redshift_probe(params: Mapping[str, Any], section) -> CheckResult:
+    """Check that the REST API answered the probe and how fast"""
+    if not section:
+        yield Result(state=State.UNKNOWN, summary="No probe data")
+        return
+
+    status = section.get("status")
+    if status == "timeout":
+        yield Result(
+            state=State.CRIT,
+            summary=f"No answer: timeout after {render.timespan(section.get('timeout', 0))}",
+        )
+        return
+    if status != "ok":
+        yield Result(state=State.CRIT, summary=f"Probe failed: {section.get('error', 'unknown error')}")
+        return
+
+    yield from check_levels_from_params(
+        section.get("rtt", 0.0),
+        levels_upper=params.get("rtt"),
+        metric_name="response_time",
+        render_func=render.timespan,
+        label="Response time",
+    )
+    if "http_status" in section:
+        yield Result(state=State.OK, notice=f"HTTP status: {section['http_status']}")
+
+
+check_plugin_redshift_probe = CheckPlugin(
+    name="redshift_probe",
+    service_name="Redshift API",
+    discovery_function=discover_redshift_probe,
+    check_function=check_redshift_probe,
+    check_default_parameters={"rtt": ("fixed", (0.5, 1.0))},
+    check_ruleset_name="redshift_probe",
+)
+
+
+# ============================================================================
+# Special Agent Section
+# ============================================================================
+
+@instrumented
+def parse_redshift_agent(string_table):
+    """Parse special agent performance section"""
+    return parse_json_section(string_table)
+
+
+agent_section_redshift_agent = AgentSection(
+    name="redshift_agent",
+    parse_function=parse_redshift_agent,
+)
+
+
+@instrumented
+def discover_redshift_agent(section) -> DiscoveryResult:
+    """Discover special agent service"""
+    if section:
+        yield Service()
+
+
+@instrumented
+def check_redshift_agent(section) -> CheckResult:
+    """Check special agent performance and load-aware scheduling"""
+    if not section:
+        yield Result(state=State.UNKNOWN, summary="No agent data")
+        return
+
+    runtime = section.get("runtime")
+    if runtime is not None:
+        yield Metric("execution_time", runtime)
+        yield Result(state=State.OK, summary=f"Runtime: {render.timespan(runtime)}")
+
+    cpu_usage = section.get("cpu_usage")
+    cpu_threshold = section.get("cpu_threshold")
+    if section.get("backoff"):
+        yield Result(
+            state=State.OK,
+            summary=f"Backing off: appliance CPU {cpu_usage:.1f}% (threshold {cpu_threshold:.1f}%)",
+        )
+    elif cpu_usage is not None and cpu_threshold is not None:
+        yield Result(
+            state=State.OK,
+            notice=f"Appliance CPU {cpu_usage:.1f}% below back-off threshold {cpu_threshold:.1f}%",
+        )
+
+    cached_sections = section.get("cached_sections")
+    if cached_sections:
+        yield Result(state=State.OK, summary=f"Served from cache: {', '.join(cached_sections)}")
+
+
+check_plugin_redshift_agent = CheckPlugin(
+    name="redshift_agent",
+    service_name="Redshift Agent",
+    discovery_function=discover_redshift_agent,
+    check_function=check_redshift_agent,
+)
+
+
+# ============================================================================
+# Fleet Rollup Section
+# ============================================================================
+
+FLEET_RESOURCE_TITLES = {"cpu": "CPU", "memory": "Memory", "disk": "Disk"}
+
+
+@instrumented
+def parse_redshift_fleet(string_table):
+    """Parse fleet rollup section"""
+    return parse_json_section(string_table)
+
+
+agent_section_redshift_fleet = AgentSection(
+    name="redshift_fleet",
+    parse_function=parse_redshift_fleet,
+)
+
+
+@instrumented
+def discover_redshift_fleet(section) -> DiscoveryResult:
+    """Discover one service per aggregated resource"""
+    for resource in (section or {}).get("resources", {}):
+        yield Service(item=FLEET_RESOURCE_TITLES.get(resource, resource))
+
+
+@instrumented
+def check_redshift_fleet(item: str, params: Mapping[str, Any], section) -> CheckResult:
+    """Check the usage distribution of a resource across the fleet"""
+    resources = (section or {}).get("resources", {})
+    data = next(
+        (data for resource, data in resources.items() if FLEET_RESOURCE_TITLES.get(resource, resource) == item),
+        None,
+    )
+    if data is None:
+        return
+
+    yield from check_levels_from_params(
+        data["p95"],
+        levels_upper=params.get("p95"),
+        metric_name="fleet_p95",
+        render_func=render_percent,
+        label="95th percentile",
+        boundaries=(0.0, 100.0),
+    )
+    yield Result(
+        state=State.OK,
+        summary=f"Median: {render_percent(data['p50'])}, Maximum: {render_percent(data['max'])}",
+    )
+    yield Metric("fleet_p50", data["p50"], boundaries=(0.0, 100.0))
+    yield Metric("fleet_max", data["max"], boundaries=(0.0, 100.0))
+    yield Result(state=State.OK, notice=f"Mean: {render_percent(data['mean'])}")
+
+    yield from check_levels_from_params(
+        data["above"],
+        levels_upper=params.get("above"),
+        metric_name="fleet_above",
+        render_func=lambda count: f"{count:.0f}",
+        label=f"Appliances above {render_percent(data['level'])}",
+    )
+    yield Result(state=State.OK, summary=f"Reporting: {data['count']} of {section['devices']}")
+    if data["top"]:
+        yield Result(
+            state=State.OK,
+            notice="Top: " + ", ".join(f"{name} {render_percent(value)}" for name, value in data["top"]),
+        )
+
+
+check_plugin_redshift_fleet = CheckPlugin(
+    name="redshift_fleet",
+    service_name="UCTM fleet %s",
+    discovery_function=discover_redshift_fleet,
+    check_function=check_redshift_fleet,
+    check_default_parameters={"p95": ("fixed", (80.0, 90.0))},
+    check_ruleset_name="redshift_fleet",
+)
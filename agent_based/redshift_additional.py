@@ -9,12 +9,14 @@ CheckMK agent based checks for Redshift Networks UCTM - Additional sections with
 """
 
 import json
-from typing import Any, Mapping
+import time
+from typing import Any, Mapping, MutableMapping
 from cmk.agent_based.v2 import (
     AgentSection,
     CheckPlugin,
     CheckResult,
     DiscoveryResult,
+    get_value_store,
     Metric,
     Result,
     Service,
@@ -22,13 +24,25 @@ from cmk.agent_based.v2 import (
     render,
 )
 
-from .redshift_common import parse_json_section
+from .redshift_common import (
+    check_cluster,
+    check_fill_rate,
+    check_levels_averaged,
+    check_levels_from_params,
+    check_usage_levels,
+    discovery_item_matches,
+    instrumented,
+    parse_json_section,
+    render_percent,
+)
+from .redshift_metrics import cpu_utilization, filesystem_usage, memory_entry, memory_usage, used_percent
 
 
 # ============================================================================
 # Processor Statistics Section
 # ============================================================================
 
+@instrumented
 def parse_redshift_processor(string_table):
     """Parse processor statistics section"""
     return parse_json_section(string_table)
@@ -40,6 +54,7 @@ agent_section_redshift_processor = AgentSection(
 )
 
 
+@instrumented
 def discover_redshift_processor(params: Mapping[str, Any], section) -> DiscoveryResult:
     """Discover processor services based on discovery parameters"""
     if not section or not isinstance(section, list):
@@ -70,8 +85,9 @@ def discover_redshift_processor(params: Mapping[str, Any], section) -> Discovery
             yield Service(item=str(cpu_id))
 
 
-def check_redshift_processor(params: Mapping[str, Any], section) -> CheckResult:
-    """Check aggregate processor statistics with configurable thresholds"""
+def _check_redshift_processor(
+    params: Mapping[str, Any], section, value_store: MutableMapping[str, Any], average_key: str
+) -> CheckResult:
     if not section or not isinstance(section, list):
         yield Result(state=State.UNKNOWN, summary="No processor data")
         return
@@ -87,69 +103,54 @@ def check_redshift_processor(params: Mapping[str, Any], section) -> CheckResult:
         yield Result(state=State.UNKNOWN, summary="No aggregate CPU data")
         return
 
+    # Entries derived from statsandstatus (agent economy mode) only carry idle
+    has_breakdown = "usr" in cpu_all
+
     try:
-        usr = float(cpu_all.get("usr", 0))
-        sys = float(cpu_all.get("sys", 0))
-        iowait = float(cpu_all.get("iowait", 0))
-        idle = float(cpu_all.get("idle", 0))
-        nice = float(cpu_all.get("nice", 0))
-        irq = float(cpu_all.get("irq", 0))
-        soft = float(cpu_all.get("soft", 0))
-        steal = float(cpu_all.get("steal", 0))
-        total_usage = 100.0 - idle
+        values = cpu_utilization(cpu_all)
+        usr, sys, iowait = values["user"], values["system"], values["wait"]
 
         # Use standard CPU metric names that integrate with existing graphs
-        yield Metric("user", usr)
-        yield Metric("system", sys)
-        yield Metric("wait", iowait)  # Standard name for iowait
-        yield Metric("util", total_usage)
+        yield from check_levels_averaged(
+            values["util"],
+            levels_upper=params.get("util"),
+            average=params.get("average"),
+            value_store=value_store,
+            key=average_key,
+            now=time.time(),
+            metric_name="util",
+            label="Total",
+        )
+        if has_breakdown:
+            yield Metric("user", usr)
+            yield Metric("system", sys)
+            yield Result(state=State.OK, summary=f"User: {usr:.1f}%, System: {sys:.1f}%")
+            # "wait" is the standard name for iowait
+            yield from check_levels_from_params(
+                iowait,
+                levels_upper=params.get("iowait"),
+                metric_name="wait",
+                render_func=render_percent,
+                label="Wait",
+            )
 
         # Additional detailed metrics
-        if nice > 0:
-            yield Metric("nice", nice)
-        if irq > 0:
-            yield Metric("interrupt", irq)
-        if soft > 0:
-            yield Metric("softirq", soft)
-        if steal > 0:
-            yield Metric("steal", steal)
-
-        # Check against configurable thresholds
-        util_levels = params.get("util", (80, 90))
-        if isinstance(util_levels, tuple) and len(util_levels) == 2:
-            warn, crit = util_levels
-            if total_usage >= crit:
-                state = State.CRIT
-            elif total_usage >= warn:
-                state = State.WARN
-            else:
-                state = State.OK
-        else:
-            state = State.OK
-
-        # Check I/O wait separately if configured
-        iowait_levels = params.get("iowait")
-        iowait_state = State.OK
-        if iowait_levels and isinstance(iowait_levels, tuple) and len(iowait_levels) == 2:
-            warn_io, crit_io = iowait_levels
-            if iowait >= crit_io:
-                iowait_state = State.CRIT
-            elif iowait >= warn_io:
-                iowait_state = State.WARN
-
-        # Use the worst state
-        final_state = State.worst(state, iowait_state)
-
-        yield Result(
-            state=final_state,
-            summary=f"Total: {total_usage:.1f}%, User: {usr:.1f}%, System: {sys:.1f}%, Wait: {iowait:.1f}%"
-        )
+        for metric_name in ("nice", "interrupt", "softirq", "steal"):
+            if values[metric_name] > 0:
+                yield Metric(metric_name, values[metric_name])
     except (ValueError, TypeError):
         yield Result(state=State.UNKNOWN, summary="Unable to parse CPU data")
 
 
-def check_redshift_processor_core(item: str, params: Mapping[str, Any], section) -> CheckResult:
-    """Check individual CPU core statistics with configurable thresholds"""
+@instrumented
+def check_redshift_processor(params: Mapping[str, Any], section) -> CheckResult:
+    """Check aggregate processor statistics with configurable thresholds"""
+    yield from _check_redshift_processor(params, section, get_value_store(), "average")
+
+
+def _check_redshift_processor_core(
+    item: str, params: Mapping[str, Any], section, value_store: MutableMapping[str, Any], average_key: str
+) -> CheckResult:
     if not section or not isinstance(section, list):
         return
 
@@ -164,67 +165,80 @@ def check_redshift_processor_core(item: str, params: Mapping[str, Any], section)
         return
 
     try:
-        usr = float(cpu_core.get("usr", 0))
-        sys = float(cpu_core.get("sys", 0))
-        iowait = float(cpu_core.get("iowait", 0))
-        idle = float(cpu_core.get("idle", 0))
-        nice = float(cpu_core.get("nice", 0))
-        irq = float(cpu_core.get("irq", 0))
-        soft = float(cpu_core.get("soft", 0))
-        steal = float(cpu_core.get("steal", 0))
-        total_usage = 100.0 - idle
+        values = cpu_utilization(cpu_core)
+        usr, sys, iowait = values["user"], values["system"], values["wait"]
 
         # Use per-core metric naming pattern following CheckMK conventions
         # Format: cpu_core_util_<num> for compatibility with standard graphs
         core_num = str(item)
-        yield Metric(f"cpu_core_util_{core_num}", total_usage)
+        yield from check_levels_averaged(
+            values["util"],
+            levels_upper=params.get("util"),
+            average=params.get("average"),
+            value_store=value_store,
+            key=average_key,
+            now=time.time(),
+            metric_name=f"cpu_core_util_{core_num}",
+            label="Total",
+        )
         yield Metric(f"cpu_core_util_user_{core_num}", usr)
         yield Metric(f"cpu_core_util_system_{core_num}", sys)
-        yield Metric(f"cpu_core_util_wait_{core_num}", iowait)
-
-        # Check against configurable thresholds
-        util_levels = params.get("util", (80, 90))
-        if isinstance(util_levels, tuple) and len(util_levels) == 2:
-            warn, crit = util_levels
-            if total_usage >= crit:
-                state = State.CRIT
-            elif total_usage >= warn:
-                state = State.WARN
-            else:
-                state = State.OK
-        else:
-            state = State.OK
-
-        # Check I/O wait separately if configured
-        iowait_levels = params.get("iowait")
-        iowait_state = State.OK
-        if iowait_levels and isinstance(iowait_levels, tuple) and len(iowait_levels) == 2:
-            warn_io, crit_io = iowait_levels
-            if iowait >= crit_io:
-                iowait_state = State.CRIT
-            elif iowait >= warn_io:
-                iowait_state = State.WARN
-
-        # Use the worst state
-        final_state = State.worst(state, iowait_state)
-
-        # Build summary with key metrics
-        summary_parts = [f"Total: {total_usage:.1f}%"]
+
+        # Only mention notable user and system shares in the summary
+        summary_parts = []
         if usr > 1.0:
             summary_parts.append(f"User: {usr:.1f}%")
         if sys > 1.0:
             summary_parts.append(f"System: {sys:.1f}%")
-        if iowait > 1.0:
-            summary_parts.append(f"Wait: {iowait:.1f}%")
-
-        yield Result(
-            state=final_state,
-            summary=", ".join(summary_parts)
+        if summary_parts:
+            yield Result(state=State.OK, summary=", ".join(summary_parts))
+
+        yield from check_levels_from_params(
+            iowait,
+            levels_upper=params.get("iowait"),
+            metric_name=f"cpu_core_util_wait_{core_num}",
+            render_func=render_percent,
+            label="Wait",
+            notice_only=iowait <= 1.0,
         )
     except (ValueError, TypeError):
         yield Result(state=State.UNKNOWN, summary="Unable to parse CPU core data")
 
 
+@instrumented
+def check_redshift_processor_core(item: str, params: Mapping[str, Any], section) -> CheckResult:
+    """Check individual CPU core statistics with configurable thresholds"""
+    yield from _check_redshift_processor_core(item, params, section, get_value_store(), "average")
+
+
+@instrumented
+def cluster_check_redshift_processor(params: Mapping[str, Any], section: Mapping[str, Any]) -> CheckResult:
+    """Check aggregate processor statistics of the best or worst cluster node"""
+    value_store = get_value_store()
+    yield from check_cluster(
+        lambda node, node_section: _check_redshift_processor(
+            params, node_section, value_store, f"average.{node}"
+        ),
+        section,
+        params.get("cluster_mode", "worst"),
+    )
+
+
+@instrumented
+def cluster_check_redshift_processor_core(
+    item: str, params: Mapping[str, Any], section: Mapping[str, Any]
+) -> CheckResult:
+    """Check a CPU core of the best or worst cluster node"""
+    value_store = get_value_store()
+    yield from check_cluster(
+        lambda node, node_section: _check_redshift_processor_core(
+            item, params, node_section, value_store, f"average.{node}"
+        ),
+        section,
+        params.get("cluster_mode", "worst"),
+    )
+
+
 check_plugin_redshift_processor = CheckPlugin(
     name="redshift_processor",
     service_name="CPU utilization",
@@ -232,7 +246,8 @@ check_plugin_redshift_processor = CheckPlugin(
     discovery_ruleset_name="redshift_processor_discovery",
     discovery_default_parameters={"aggregate": True, "individual": False},
     check_function=check_redshift_processor,
-    check_default_parameters={"util": (80, 90)},
+    cluster_check_function=cluster_check_redshift_processor,
+    check_default_parameters={"util": ("fixed", (80.0, 90.0))},
     check_ruleset_name="redshift_cpu_aggregate",
 )
 
@@ -244,7 +259,8 @@ check_plugin_redshift_processor_core = CheckPlugin(
     discovery_ruleset_name="redshift_processor_discovery",
     discovery_default_parameters={"aggregate": True, "individual": False},
     check_function=check_redshift_processor_core,
-    check_default_parameters={"util": (80, 90)},
+    cluster_check_function=cluster_check_redshift_processor_core,
+    check_default_parameters={"util": ("fixed", (80.0, 90.0))},
     check_ruleset_name="redshift_cpu_core",
 )
 
@@ -253,6 +269,7 @@ check_plugin_redshift_processor_core = CheckPlugin(
 # Memory Section
 # ============================================================================
 
+@instrumented
 def parse_redshift_memory(string_table):
     """Parse memory section"""
     return parse_json_section(string_table)
@@ -264,6 +281,7 @@ agent_section_redshift_memory = AgentSection(
 )
 
 
+@instrumented
 def discover_redshift_memory(section) -> DiscoveryResult:
     """Discover memory service"""
     if section and isinstance(section, list):
@@ -273,65 +291,60 @@ def discover_redshift_memory(section) -> DiscoveryResult:
                 break
 
 
-def check_redshift_memory(params: Mapping[str, Any], section) -> CheckResult:
-    """Check memory usage with configurable thresholds"""
+def _check_redshift_memory(
+    params: Mapping[str, Any], section, value_store: MutableMapping[str, Any], average_key: str
+) -> CheckResult:
     if not section or not isinstance(section, list):
         yield Result(state=State.UNKNOWN, summary="No memory data")
         return
 
-    mem_data = None
-    for item in section:
-        if item.get("type") == "Mem:":
-            mem_data = item
-            break
-
+    mem_data = memory_entry(section)
     if not mem_data:
         yield Result(state=State.UNKNOWN, summary="No memory data")
         return
 
     try:
-        total_bytes = int(mem_data.get("total", 0)) * 1024  # Convert KB to bytes
-        free_bytes = int(mem_data.get("free", 0)) * 1024
+        used_bytes, total_bytes, free_bytes = memory_usage(mem_data)
 
         if total_bytes == 0:
             yield Result(state=State.UNKNOWN, summary="Invalid memory data")
             return
 
-        used_bytes = total_bytes - free_bytes
-        used_percent = (used_bytes / total_bytes * 100) if total_bytes > 0 else 0
-
         # Use standard memory metric names
         yield Metric("mem_used", used_bytes)
         yield Metric("mem_total", total_bytes)
-        yield Metric("mem_used_percent", used_percent)
-
-        # Check against configurable thresholds
-        levels = params.get("levels", (80, 90))
-        if isinstance(levels, tuple) and len(levels) == 2:
-            warn, crit = levels
-            if used_percent >= crit:
-                state = State.CRIT
-            elif used_percent >= warn:
-                state = State.WARN
-            else:
-                state = State.OK
-        else:
-            state = State.OK
-
-        yield Result(
-            state=state,
-            summary=f"Usage: {used_percent:.1f}% - {render.bytes(used_bytes)} of {render.bytes(total_bytes)}"
+        yield from check_usage_levels(
+            used_percent(used_bytes, total_bytes), free_bytes, params, "mem_used_percent", value_store, average_key, time.time()
         )
+        yield Result(state=State.OK, summary=f"{render.bytes(used_bytes)} of {render.bytes(total_bytes)}")
     except (ValueError, TypeError, KeyError):
         yield Result(state=State.UNKNOWN, summary="Unable to parse memory data")
 
 
+@instrumented
+def check_redshift_memory(params: Mapping[str, Any], section) -> CheckResult:
+    """Check memory usage with configurable thresholds"""
+    yield from _check_redshift_memory(params, section, get_value_store(), "average")
+
+
+@instrumented
+def cluster_check_redshift_memory(params: Mapping[str, Any], section: Mapping[str, Any]) -> CheckResult:
+    """Check memory usage of the best or worst cluster node"""
+    value_store = get_value_store()
+    yield from check_cluster(
+        lambda node, node_section: _check_redshift_memory(params, node_section, value_store, f"average.{node}"),
+        section,
+        params.get("cluster_mode", "worst"),
+    )
+
+
 check_plugin_redshift_memory = CheckPlugin(
     name="redshift_memory",
     service_name="Memory",
     discovery_function=discover_redshift_memory,
     check_function=check_redshift_memory,
-    check_default_parameters={"levels": (80, 90)},
+    cluster_check_function=cluster_check_redshift_memory,
+    check_default_parameters={"levels": ("fixed", (80.0, 90.0))},
     check_ruleset_name="redshift_memory",
 )
 
@@ -340,6 +353,7 @@ check_plugin_redshift_memory = CheckPlugin(
 # Disk Space Section
 # ============================================================================
 
+@instrumented
 def parse_redshift_disk(string_table):
     """Parse disk space section"""
     return parse_json_section(string_table)
@@ -351,19 +365,28 @@ agent_section_redshift_disk = AgentSection(
 )
 
 
-def discover_redshift_disk(section) -> DiscoveryResult:
-    """Discover disk services"""
+@instrumented
+def discover_redshift_disk(params: Mapping[str, Any], section) -> DiscoveryResult:
+    """Discover disk services, applying mount point and filesystem filters"""
     if not section or not isinstance(section, list):
         return
 
+    # df reports no filesystem type, but names virtual filesystems by their type
+    excluded_types = set(params.get("exclude_types", []))
+
     for item in section:
         if "filesystem" in item and "mountedOn" in item:
+            if item["filesystem"] in excluded_types:
+                continue
+            if not discovery_item_matches(item["mountedOn"], params):
+                continue
             # Use mountpoint as item name
             yield Service(item=item["mountedOn"])
 
 
-def check_redshift_disk(item: str, params: Mapping[str, Any], section) -> CheckResult:
-    """Check disk space with configurable thresholds"""
+def _check_redshift_disk(
+    item: str, params: Mapping[str, Any], section, value_store: MutableMapping[str, Any], trend_key: str
+) -> CheckResult:
     if not section or not isinstance(section, list):
         return
 
@@ -377,49 +400,46 @@ def check_redshift_disk(item: str, params: Mapping[str, Any], section) -> CheckR
         return
 
     try:
-        blocks_1k = int(disk_data.get("blocks_1k", 0))
-        used = int(disk_data.get("used", 0))
-        available = int(disk_data.get("available", 0))
-
-        # Convert to bytes
-        size_bytes = blocks_1k * 1024
-        used_bytes = used * 1024
-        avail_bytes = available * 1024
-
-        used_percent = (used_bytes / size_bytes * 100) if size_bytes > 0 else 0
+        used_bytes, avail_bytes, size_bytes = filesystem_usage(disk_data)
 
         # Use standard filesystem metric names
         yield Metric("fs_used", used_bytes)
         yield Metric("fs_free", avail_bytes)
         yield Metric("fs_size", size_bytes)
-        yield Metric("fs_used_percent", used_percent)
-
-        # Check against configurable thresholds
-        levels = params.get("levels", (80, 90))
-        if isinstance(levels, tuple) and len(levels) == 2:
-            warn, crit = levels
-            if used_percent >= crit:
-                state = State.CRIT
-            elif used_percent >= warn:
-                state = State.WARN
-            else:
-                state = State.OK
-        else:
-            state = State.OK
-
-        yield Result(
-            state=state,
-            summary=f"{used_percent:.1f}% used ({render.bytes(used_bytes)} of {render.bytes(size_bytes)})"
-        )
+        yield from check_usage_levels(used_percent(used_bytes, size_bytes), avail_bytes, params, "fs_used_percent")
+        yield Result(state=State.OK, summary=f"{render.bytes(used_bytes)} of {render.bytes(size_bytes)}")
+        yield from check_fill_rate(value_store, trend_key, used_bytes, avail_bytes, params, time.time())
     except (ValueError, TypeError, KeyError):
         yield Result(state=State.UNKNOWN, summary="Unable to parse disk data")
 
 
+@instrumented
+def check_redshift_disk(item: str, params: Mapping[str, Any], section) -> CheckResult:
+    """Check disk space with configurable thresholds and fill rate forecast"""
+    yield from _check_redshift_disk(item, params, section, get_value_store(), "trend")
+
+
+@instrumented
+def cluster_check_redshift_disk(item: str, params: Mapping[str, Any], section: Mapping[str, Any]) -> CheckResult:
+    """Check disk space of the best or worst cluster node"""
+    value_store = get_value_store()
+    yield from check_cluster(
+        lambda node, node_section: _check_redshift_disk(
+            item, params, node_section, value_store, f"trend.{node}"
+        ),
+        section,
+        params.get("cluster_mode", "worst"),
+    )
+
+
 check_plugin_redshift_disk = CheckPlugin(
     name="redshift_disk",
     service_name="Filesystem %s",
     discovery_function=discover_redshift_disk,
+    discovery_ruleset_name="redshift_disk_discovery",
+    discovery_default_parameters={},
     check_function=check_redshift_disk,
-    check_default_parameters={"levels": (80, 90)},
+    cluster_check_function=cluster_check_redshift_disk,
+    check_default_parameters={"levels": ("fixed", (80.0, 90.0))},
     check_ruleset_name="redshift_disk",
 )
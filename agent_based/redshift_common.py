@@ -8,16 +8,263 @@
 Common utilities for Redshift UCTM monitoring plugin
 """
 
+import atexit
+import inspect
 import json
+import os
+import re
+import sys
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Mapping, MutableMapping
+from functools import wraps
 from typing import Any
 
+from cmk.agent_based.v2 import check_levels, CheckResult, Metric, render, Result, State
 
+
+# Environment variables enabling the plugin instrumentation: the JSON file
+# to write ("{pid}" is replaced by the process ID) and the dump interval
+INSTRUMENT_ENV = "REDSHIFT_INSTRUMENT"
+INSTRUMENT_INTERVAL_ENV = "REDSHIFT_INSTRUMENT_INTERVAL"
+
+
+class PluginStats:
+    """
+    Call statistics of instrumented plugin functions.
+
+    Records call count, cumulative and maximum duration and the number of
+    items processed (rows of a parsed section, services, results and
+    metrics yielded) per function, and writes them to a JSON file at most
+    every interval seconds.
+    """
+
+    def __init__(self, path: str, interval: float = 60.0):
+        self.path = path.replace("{pid}", str(os.getpid()))
+        self.interval = interval
+        self.functions: dict[str, dict[str, Any]] = {}
+        self.last_dump = time.monotonic()
+
+    def record(self, name: str, duration: float, items: int) -> None:
+        """Record one call of a function"""
+        entry = self.functions.setdefault(
+            name, {"calls": 0, "total_seconds": 0.0, "max_seconds": 0.0, "items": 0}
+        )
+        entry["calls"] += 1
+        entry["total_seconds"] += duration
+        entry["max_seconds"] = max(entry["max_seconds"], duration)
+        entry["items"] += items
+        if time.monotonic() - self.last_dump >= self.interval:
+            self.dump()
+
+    def dump(self) -> None:
+        """Write the statistics to the JSON file, replacing it atomically"""
+        self.last_dump = time.monotonic()
+        data = {"pid": os.getpid(), "timestamp": time.time(), "functions": self.functions}
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
+
+    def wrap(self, function: Callable) -> Callable:
+        """Return an instrumented version of a plugin function"""
+        name = function.__name__
+
+        if inspect.isgeneratorfunction(function):
+            @wraps(function)
+            def generator_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                results = list(function(*args, **kwargs))
+                self.record(name, time.perf_counter() - start, len(results))
+                yield from results
+
+            return generator_wrapper
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            result = function(*args, **kwargs)
+            self.record(name, time.perf_counter() - start, len(result) if isinstance(result, (list, dict)) else 0)
+            return result
+
+        return wrapper
+
+
+def _plugin_stats_from_env() -> PluginStats | None:
+    path = os.environ.get(INSTRUMENT_ENV)
+    if not path:
+        return None
+    try:
+        interval = float(os.environ.get(INSTRUMENT_INTERVAL_ENV, 60))
+    except ValueError:
+        interval = 60.0
+    stats = PluginStats(path, interval)
+    atexit.register(stats.dump)
+    return stats
+
+
+_PLUGIN_STATS = _plugin_stats_from_env()
+
+
+def instrumented(function: Callable) -> Callable:
+    """
+    Instrument a parse, discovery or check function if enabled.
+
+    Without the REDSHIFT_INSTRUMENT environment variable the function is
+    returned unchanged, so the instrumentation costs nothing.
+
+    Args:
+        function: Plugin function
+
+    Returns:
+        The function, or its instrumented version
+    """
+    if _PLUGIN_STATS is None:
+        return function
+    return _PLUGIN_STATS.wrap(function)
+
+
+# Parsed sections kept per parse function. Helper processes are long-lived
+# and most sections arrive unchanged from cycle to cycle and host to host,
+# so the cache must hold a whole cycle of hosts to be of any use. Besides
+# the number of entries, the resident size of each cache is bounded: the
+# raw lines used as keys plus the parsed objects, which take about five
+# times the size of their JSON. A cycle of 1,000 hosts takes about 19 MB.
+# Large payloads are never cached.
+PARSE_CACHE_SIZE = 8192
+PARSE_CACHE_MAX_BYTES = 24 * 1024 * 1024
+PARSE_CACHE_MAX_LINE = 64 * 1024
+
+
+def _read_only(*_args, **_kwargs):
+    raise TypeError("parsed sections are shared between hosts and read-only")
+
+
+class ReadOnlyDict(dict):
+    """Dictionary of a cached parsed section, which must not be modified"""
+
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __reduce__(self):
+        return (self.__class__, (dict(self),))
+
+
+class ReadOnlyList(list):
+    """List of a cached parsed section, which must not be modified"""
+
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _read_only
+    append = extend = insert = pop = remove = clear = sort = reverse = _read_only
+
+    def __reduce__(self):
+        return (self.__class__, (list(self),))
+
+
+def make_read_only(value: Any) -> Any:
+    """Recursively turn the dicts and lists of a parsed section read-only"""
+    if isinstance(value, dict):
+        return ReadOnlyDict((k, make_read_only(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return ReadOnlyList(make_read_only(v) for v in value)
+    return value
+
+
+def resident_size(value: Any, seen: set[int] | None = None) -> int:
+    """
+    Return the bytes of an object and the dicts, lists and values it holds
+
+    Objects reached more than once, such as the keys json.loads shares
+    between the dicts of a document, are counted once.
+    """
+    if seen is None:
+        seen = set()
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(resident_size(k, seen) + resident_size(v, seen) for k, v in value.items())
+    elif isinstance(value, list):
+        size += sum(resident_size(v, seen) for v in value)
+    return size
+
+
+def cached_parse(parse_function: Callable[[list], Any]) -> Callable[[list], Any]:
+    """
+    Memoize a parse function of a JSON section in a bounded LRU cache.
+
+    The cache key is the raw section line itself, so a hit always means an
+    equal payload, never merely an equal hash. The cached results are made
+    read-only as they are shared by all hosts sending the same payload.
+    Entries are evicted once the resident size of the lines and parsed
+    results exceeds PARSE_CACHE_MAX_BYTES. The wrapped function gets
+    cache_info() and cache_clear() like functools.lru_cache.
+
+    Args:
+        parse_function: Parse function taking a string table
+
+    Returns:
+        Caching parse function
+    """
+    # Raw line to parsed result and resident size of the entry
+    cache: OrderedDict = OrderedDict()
+    stats = {"hits": 0, "misses": 0, "bytes": 0}
+
+    @wraps(parse_function)
+    def wrapper(string_table: list) -> Any:
+        try:
+            raw = string_table[0][0]
+        except (IndexError, TypeError):
+            return parse_function(string_table)
+
+        if raw in cache:
+            stats["hits"] += 1
+            cache.move_to_end(raw)
+            return cache[raw][0]
+
+        stats["misses"] += 1
+        parsed = make_read_only(parse_function(string_table))
+        if len(raw) > PARSE_CACHE_MAX_LINE:
+            return parsed
+
+        size = sys.getsizeof(raw) + resident_size(parsed)
+        cache[raw] = (parsed, size)
+        stats["bytes"] += size
+        while len(cache) > PARSE_CACHE_SIZE or stats["bytes"] > PARSE_CACHE_MAX_BYTES:
+            _raw, (_parsed, evicted_size) = cache.popitem(last=False)
+            stats["bytes"] -= evicted_size
+        return parsed
+
+    def cache_info() -> dict:
+        return {
+            "hits": stats["hits"],
+            "misses": stats["misses"],
+            "size": len(cache),
+            "maxsize": PARSE_CACHE_SIZE,
+            "bytes": stats["bytes"],
+        }
+
+    def cache_clear() -> None:
+        cache.clear()
+        stats.update(hits=0, misses=0, bytes=0)
+
+    wrapper.cache_info = cache_info  # type: ignore[attr-defined]
+    wrapper.cache_clear = cache_clear  # type: ignore[attr-defined]
+    return wrapper
+
+
+@instrumented
+@cached_parse
 def parse_json_section(string_table: list) -> Any | None:
     """
     Generic JSON parser for Redshift agent sections.
 
     This handles the standard case where the special agent has already
-    cleaned up any malformed JSON from the Redshift API.
+    cleaned up any malformed JSON from the Redshift API. Results are
+    cached and read-only, see cached_parse.
 
     Args:
         string_table: CheckMK string table from agent section
@@ -31,3 +278,368 @@ def parse_json_section(string_table: list) -> Any | None:
         return json.loads(string_table[0][0])
     except (json.JSONDecodeError, IndexError):
         return None
+
+
+# Level types understood by check_levels
+_LEVEL_TYPES = ("fixed", "no_levels", "predictive")
+
+
+def render_percent(value: float) -> str:
+    """Render a percentage with one decimal, as all Redshift checks do"""
+    return f"{value:.1f}%"
+
+
+def check_levels_from_params(
+    value: float,
+    *,
+    levels_upper: Any = None,
+    levels_lower: Any = None,
+    metric_name: str | None = None,
+    render_func: Callable[[float], str] | None = None,
+    label: str | None = None,
+    boundaries: tuple[float | None, float | None] | None = None,
+    notice_only: bool = False,
+) -> CheckResult:
+    """
+    Check a value against levels taken from the check parameters.
+
+    Fixed, absolute (e.g. bytes) and predictive levels are evaluated by
+    check_levels. Besides the form specs format ("fixed", (warn, crit)),
+    ("no_levels", None) and ("predictive", ...), plain (warn, crit) tuples of
+    older rules and default parameters are accepted.
+
+    Args:
+        value: Value to check
+        levels_upper: Upper levels parameter, None if not configured
+        levels_lower: Lower levels parameter, None if not configured
+        metric_name: Name of the metric to yield, if any
+        render_func: Function rendering the value for the summary
+        label: Label prefixed to the rendered value
+        boundaries: Minimum and maximum of the metric
+        notice_only: Only show the result in the service details
+
+    Returns:
+        Result and optional Metric from check_levels
+    """
+    normalized = []
+    for levels in (levels_upper, levels_lower):
+        if not levels:
+            normalized.append(("no_levels", None))
+        elif levels[0] == "fixed":
+            warn, crit = levels[1]
+            normalized.append(("fixed", (warn, crit)))
+        elif levels[0] in _LEVEL_TYPES:
+            normalized.append((levels[0], levels[1]))
+        elif len(levels) == 2 and all(isinstance(v, (int, float)) for v in levels):
+            normalized.append(("fixed", (levels[0], levels[1])))
+        else:
+            normalized.append(("no_levels", None))
+
+    yield from check_levels(
+        value,
+        levels_upper=normalized[0],
+        levels_lower=normalized[1],
+        metric_name=metric_name,
+        render_func=render_func,
+        label=label,
+        boundaries=boundaries,
+        notice_only=notice_only,
+    )
+
+
+# Upper bound of the buckets kept for an average, whatever the polling interval
+AVERAGE_MAX_SAMPLES = 120
+
+
+def sliding_average(
+    value_store: MutableMapping[str, Any], key: str, value: float, minutes: int, now: float
+) -> float:
+    """
+    Average of a value over the last minutes, kept in the value store.
+
+    The window is split into AVERAGE_MAX_SAMPLES buckets holding the time of
+    their first sample, the sum and the count of their samples. Samples
+    falling into the newest bucket are added to it, so long windows are
+    downsampled instead of cut short, and the store stays bounded.
+
+    Args:
+        value_store: CheckMK value store of the service
+        key: Value store key, unique per value (and cluster node)
+        value: Current value
+        minutes: Length of the averaging window
+        now: Current time
+
+    Returns:
+        Mean of all samples within the window, including the current value
+    """
+    bucket_seconds = minutes * 60 / AVERAGE_MAX_SAMPLES
+    buckets = [
+        # Stores of older versions hold one (time, value) pair per sample
+        (entry[0], entry[1], entry[2] if len(entry) > 2 else 1)
+        for entry in value_store.get(key, [])
+        if now - minutes * 60 < entry[0] < now
+    ]
+    if buckets and now - buckets[-1][0] < bucket_seconds:
+        start, total, count = buckets[-1]
+        buckets[-1] = (start, total + value, count + 1)
+    else:
+        buckets.append((now, value, 1))
+    value_store[key] = buckets
+    return sum(total for _, total, _ in buckets) / sum(count for _, _, count in buckets)
+
+
+def check_levels_averaged(
+    value: float,
+    *,
+    levels_upper: Any,
+    average: int | None,
+    value_store: MutableMapping[str, Any] | None,
+    key: str,
+    now: float,
+    metric_name: str,
+    label: str,
+) -> CheckResult:
+    """
+    Check a percentage against levels, optionally applied to its average.
+
+    Without averaging this is check_levels_from_params. With an "average"
+    of N minutes the raw value is still graphed, while the levels apply to
+    the sliding average, which gets its own "<metric>_average" metric.
+
+    Args:
+        value: Current value in percent
+        levels_upper: Upper levels parameter
+        average: Averaging window in minutes, None to check the raw value
+        value_store: CheckMK value store of the service
+        key: Value store key of the value
+        now: Current time
+        metric_name: Name of the raw value metric
+        label: Label of the value
+
+    Returns:
+        Results and metrics of the raw value and the average
+    """
+    if not average or value_store is None:
+        yield from check_levels_from_params(
+            value, levels_upper=levels_upper, metric_name=metric_name, render_func=render_percent, label=label
+        )
+        return
+
+    yield from check_levels_from_params(value, metric_name=metric_name, render_func=render_percent, label=label)
+    yield from check_levels_from_params(
+        sliding_average(value_store, key, value, average, now),
+        levels_upper=levels_upper,
+        metric_name=f"{metric_name}_average",
+        render_func=render_percent,
+        label=f"{average} min average",
+    )
+
+
+def check_usage_levels(
+    used_percent: float,
+    free_bytes: float,
+    params: Mapping[str, Any],
+    metric_name: str,
+    value_store: MutableMapping[str, Any] | None = None,
+    key: str = "average",
+    now: float = 0.0,
+) -> CheckResult:
+    """
+    Check a memory or filesystem usage against its levels.
+
+    Args:
+        used_percent: Used space in percent
+        free_bytes: Free space in bytes
+        params: Check parameters with percent "levels", optional absolute
+            "levels_free" in bytes and optional "average" in minutes
+        metric_name: Name of the used percent metric
+        value_store: CheckMK value store, required for averaging
+        key: Value store key of the average
+        now: Current time, required for averaging
+
+    Returns:
+        Results and the used percent metric
+    """
+    yield from check_levels_averaged(
+        used_percent,
+        levels_upper=params.get("levels"),
+        average=params.get("average"),
+        value_store=value_store,
+        key=key,
+        now=now,
+        metric_name=metric_name,
+        label="Used",
+    )
+    if params.get("levels_free"):
+        yield from check_levels_from_params(
+            free_bytes,
+            levels_lower=params["levels_free"],
+            render_func=render.bytes,
+            label="Free",
+        )
+
+
+# Samples kept per filesystem for the fill rate. New samples are only added
+# every trend range / FS_TREND_MAX_SAMPLES seconds, so the buffer always
+# spans the whole trend range.
+FS_TREND_MAX_SAMPLES = 96
+
+# Default time range of the fill rate regression in hours
+FS_TREND_DEFAULT_RANGE = 24
+
+
+def linear_regression_slope(samples: list) -> float | None:
+    """
+    Least squares slope of (timestamp, value) samples.
+
+    Args:
+        samples: List of (timestamp, value) pairs
+
+    Returns:
+        Change of the value per second, None with too few distinct timestamps
+    """
+    count = len(samples)
+    if count < 2:
+        return None
+    mean_t = sum(t for t, _ in samples) / count
+    mean_v = sum(v for _, v in samples) / count
+    variance = sum((t - mean_t) ** 2 for t, _ in samples)
+    if variance == 0:
+        return None
+    return sum((t - mean_t) * (v - mean_v) for t, v in samples) / variance
+
+
+def check_fill_rate(
+    value_store: MutableMapping[str, Any],
+    key: str,
+    used_bytes: float,
+    free_bytes: float,
+    params: Mapping[str, Any],
+    now: float,
+) -> CheckResult:
+    """
+    Forecast when a filesystem will be full from its usage history.
+
+    The usage is kept in the value store as a bounded list of
+    (timestamp, used bytes) samples covering the "trend_range" parameter
+    (hours). The fill rate is the slope of a linear regression over them.
+
+    Args:
+        value_store: CheckMK value store of the service
+        key: Value store key, unique per filesystem (and cluster node)
+        used_bytes: Used space in bytes
+        free_bytes: Free space in bytes
+        params: Check parameters with optional "trend_range" and
+            "time_to_full" (lower levels in seconds)
+        now: Current time
+
+    Returns:
+        Growth and time until full results and metrics
+    """
+    trend_range = params.get("trend_range", FS_TREND_DEFAULT_RANGE) * 3600
+    samples = [(t, v) for t, v in value_store.get(key, []) if now - trend_range <= t < now]
+    if not samples or now - samples[-1][0] >= trend_range / FS_TREND_MAX_SAMPLES:
+        samples.append((now, used_bytes))
+        samples = samples[-FS_TREND_MAX_SAMPLES:]
+    value_store[key] = samples
+
+    # The current usage always takes part, even if it is not stored
+    points = samples if samples[-1][0] == now else samples + [(now, used_bytes)]
+    slope = linear_regression_slope(points)
+    if slope is None:
+        return
+
+    growth = slope * 86400
+    yield Metric("fs_growth", growth)
+    sign = "+" if growth >= 0 else "-"
+    yield Result(state=State.OK, notice=f"Growth: {sign}{render.bytes(abs(growth))} per day")
+
+    if slope <= 0:
+        yield Result(state=State.OK, notice="Time until full: not growing")
+        return
+
+    seconds_left = max(free_bytes, 0) / slope
+    yield Metric("trend_hoursleft", seconds_left / 3600)
+    yield from check_levels_from_params(
+        seconds_left,
+        levels_lower=params.get("time_to_full"),
+        render_func=render.timespan,
+        label="Time until full",
+        notice_only=not params.get("time_to_full"),
+    )
+
+
+def discovery_item_matches(item: str, params: Mapping[str, Any]) -> bool:
+    """
+    Apply the include and exclude regexes of a discovery rule to an item.
+
+    Regexes match from the beginning of the item, as everywhere in CheckMK.
+    Without include regexes every item is included.
+
+    Args:
+        item: Service item, e.g. interface name or mount point
+        params: Discovery parameters with optional "include" and "exclude" lists
+
+    Returns:
+        True if a service should be discovered for the item
+    """
+    include = params.get("include") or []
+    if include and not any(re.match(pattern, item) for pattern in include):
+        return False
+    return not any(re.match(pattern, item) for pattern in params.get("exclude") or [])
+
+
+# Order of states from best to worst
+_STATE_RANK = {State.OK: 0, State.WARN: 1, State.UNKNOWN: 2, State.CRIT: 3}
+
+
+def _node_state(results: list) -> State:
+    """Return the worst state of a node's check results"""
+    states = [r.state for r in results if isinstance(r, Result)]
+    return max(states, key=_STATE_RANK.__getitem__) if states else State.OK
+
+
+def check_cluster(
+    node_check: Callable[[str, Any], CheckResult],
+    section: Mapping[str, Any],
+    mode: str = "worst",
+) -> CheckResult:
+    """
+    Evaluate a check on every cluster node and report the best or worst node.
+
+    The results and metrics of the selected node are passed on unchanged,
+    the other nodes are summarized as notices.
+
+    Args:
+        node_check: Check function taking a node name and the section of that node
+        section: CheckMK cluster section, mapping node names to their sections
+        mode: "best" or "worst"
+
+    Returns:
+        Check results of the selected node
+    """
+    node_results = {}
+    for node, node_section in section.items():
+        if node_section is None:
+            continue
+        results = list(node_check(node, node_section))
+        if results:
+            node_results[node] = results
+
+    if not node_results:
+        return
+
+    select = min if mode == "best" else max
+    chosen = select(node_results, key=lambda node: _STATE_RANK[_node_state(node_results[node])])
+
+    yield Result(state=State.OK, summary=f"{'Best' if mode == 'best' else 'Worst'} node: {chosen}")
+    yield from node_results[chosen]
+
+    for node, results in node_results.items():
+        if node == chosen:
+            continue
+        summaries = [r.summary for r in results if isinstance(r, Result) and r.summary]
+        yield Result(
+            state=State.OK,
+            notice=f"[{node}] {_node_state(results).name}: {', '.join(summaries)}",
+        )
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright (C) 2025 tribe29 GmbH - License: GNU General Public License v2
+# This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
+# conditions defined in the file COPYING, which is part of this source code package.
+
+"""
+Metric values of the Redshift UCTM sections
+
+Shared by the check plugins and the OpenMetrics exporter of the special agent,
+so both compute every metric the same way. The special agent imports this
+module without CheckMK, so it must not import cmk.
+"""
+
+from collections.abc import Mapping
+from typing import Any
+
+# Byte factors of the size units used by the Redshift API
+SIZE_UNITS = {"b": 1, "kb": 1024, "mb": 1024**2, "gb": 1024**3, "tb": 1024**4}
+
+# Traffic counters of an interface and their metric names
+INTERFACE_COUNTERS = [
+    ("RX-OK", "if_in_pkts"),
+    ("TX-OK", "if_out_pkts"),
+    ("RX-ERR", "if_in_errors"),
+    ("TX-ERR", "if_out_errors"),
+    ("RX-DRP", "if_in_discards"),
+    ("TX-DRP", "if_out_discards"),
+]
+
+
+def parse_size(value: Any, default_unit: str = "kB") -> int:
+    """
+    Return the bytes of a size such as "16173828 kB" or "3747460 kB (23.0%)"
+
+    Raises ValueError for values that are no size.
+    """
+    number, *rest = str(value).split()
+    unit = (rest[0] if rest else default_unit).lower()
+    if unit not in SIZE_UNITS:
+        raise ValueError(f"Unknown size unit in {value!r}")
+    return int(float(number) * SIZE_UNITS[unit])
+
+
+def parse_percent(value: Any) -> float:
+    """Return the number of a percentage such as "15.2%" """
+    return float(str(value).rstrip("%"))
+
+
+def stats_mapping(data: Any) -> Any:
+    """Return the statsandstatus list of type and value entries as a mapping"""
+    if isinstance(data, list):
+        return {item["type"]: item["value"] for item in data if "type" in item and "value" in item}
+    return data
+
+
+def system_stats_memory(stats: Mapping[str, Any]) -> tuple[int, int] | None:
+    """Return used and total memory in bytes of the system statistics, if reported"""
+    if "Total Memory" not in stats or "Used Memory" not in stats:
+        return None
+    return parse_size(stats["Used Memory"]), parse_size(stats["Total Memory"])
+
+
+def hdd_usage(hdd: Mapping[str, Any]) -> tuple[int, int, float] | None:
+    """Return used bytes, total bytes and used percentage of the HDD usage details, if reported"""
+    if "Total Space" not in hdd or "Used Space" not in hdd or "Used Percentage" not in hdd:
+        return None
+    return (
+        parse_size(hdd["Used Space"], "MB"),
+        parse_size(hdd["Total Space"], "MB"),
+        parse_percent(hdd["Used Percentage"]),
+    )
+
+
+def interface_counters(iface_data: Mapping[str, Any]) -> dict[str, int]:
+    """Return the valid traffic counters of an interface by metric name"""
+    counters = {}
+    for key, metric_name in INTERFACE_COUNTERS:
+        try:
+            counters[metric_name] = int(iface_data[key])
+        except (KeyError, ValueError):
+            pass
+    return counters
+
+
+def cpu_utilization(entry: Mapping[str, Any]) -> dict[str, float]:
+    """Return the total utilization and the shares by mode in percent of an mpstat entry"""
+    values = {
+        mode: float(entry.get(key, 0))
+        for key, mode in [
+            ("usr", "user"),
+            ("sys", "system"),
+            ("iowait", "wait"),
+            ("nice", "nice"),
+            ("irq", "interrupt"),
+            ("soft", "softirq"),
+            ("steal", "steal"),
+        ]
+    }
+    values["util"] = 100.0 - float(entry.get("idle", 0))
+    return values
+
+
+def memory_entry(section: Any) -> Mapping[str, Any] | None:
+    """Return the "Mem:" entry of the free memory section"""
+    if not isinstance(section, list):
+        return None
+    for entry in section:
+        if entry.get("type") == "Mem:":
+            return entry
+    return None
+
+
+def memory_usage(entry: Mapping[str, Any]) -> tuple[int, int, int]:
+    """Return used, total and free memory in bytes of a "Mem:" entry"""
+    total_bytes = int(entry.get("total", 0)) * 1024
+    free_bytes = int(entry.get("free", 0)) * 1024
+    return total_bytes - free_bytes, total_bytes, free_bytes
+
+
+def filesystem_usage(entry: Mapping[str, Any]) -> tuple[int, int, int]:
+    """Return used, available and total bytes of a disk space entry"""
+    return (
+        int(entry.get("used", 0)) * 1024,
+        int(entry.get("available", 0)) * 1024,
+        int(entry.get("blocks_1k", 0)) * 1024,
+    )
+
+
+def used_percent(used: float, total: float) -> float:
+    """Return used of total in percent, 0 for an empty total"""
+    return used / total * 100 if total > 0 else 0.0
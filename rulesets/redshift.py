@@ -8,11 +8,13 @@
 WATO rulesets for Redshift Networks UCTM monitoring
 """
 
-from cmk.rulesets.v1 import Help, Title
+from cmk.rulesets.v1 import Help, Label, Title
 from cmk.rulesets.v1.form_specs import (
+    BooleanChoice,
     DefaultValue,
     DictElement,
     Dictionary,
+    Float,
     Integer,
     MultipleChoice,
     MultipleChoiceElement,
@@ -74,6 +76,34 @@ def _parameter_form() -> Dictionary:
                 ),
                 required=True,
             ),
+            "ca_file": DictElement(
+                parameter_form=String(
+                    title=Title("Pinned CA certificate file"),
+                    help_text=Help(
+                        "Path on the CheckMK server of a PEM file with the CA certificates "
+                        "that issued the appliance certificate. The certificate is then "
+                        "verified against these only, which is much cheaper than loading "
+                        "the full CA bundle. Implies certificate verification."
+                    ),
+                    custom_validate=(validators.LengthInRange(min_value=1),),
+                ),
+                required=False,
+            ),
+            "cert_fingerprint": DictElement(
+                parameter_form=String(
+                    title=Title("Pinned certificate fingerprint"),
+                    help_text=Help(
+                        "SHA-256 fingerprint of the appliance certificate, as 64 hex digits "
+                        "with or without colons. Only this certificate is accepted, which "
+                        "also works for self-signed certificates. Replaces the verification "
+                        "against CA certificates."
+                    ),
+                    custom_validate=(
+                        validators.MatchRegex(r"^([0-9A-Fa-f]{2}:?){31}[0-9A-Fa-f]{2}$"),
+                    ),
+                ),
+                required=False,
+            ),
             "timeout": DictElement(
                 parameter_form=Integer(
                     title=Title("Timeout"),
@@ -83,6 +113,233 @@ def _parameter_form() -> Dictionary:
                 ),
                 required=True,
             ),
+            "hedging": DictElement(
+                parameter_form=Dictionary(
+                    title=Title("Hedged requests"),
+                    help_text=Help(
+                        "When an endpoint has not answered within its observed 95th percentile "
+                        "latency, send a second request on a fresh connection and use whichever "
+                        "response arrives first. This cuts tail latency on devices where single "
+                        "requests occasionally stall, at the cost of some extra load."
+                    ),
+                    elements={
+                        "delay": DictElement(
+                            parameter_form=Float(
+                                title=Title("Initial hedge delay"),
+                                help_text=Help(
+                                    "Seconds to wait before hedging while too few latency "
+                                    "samples are known to compute the 95th percentile."
+                                ),
+                                unit_symbol="s",
+                                prefill=DefaultValue(1.0),
+                                custom_validate=(validators.NumberInRange(min_value=0.1, max_value=60),),
+                            ),
+                            required=True,
+                        ),
+                        "max_hedges": DictElement(
+                            parameter_form=Integer(
+                                title=Title("Maximum hedged requests per run"),
+                                help_text=Help(
+                                    "Upper limit of additional requests sent to the device "
+                                    "during one agent run."
+                                ),
+                                prefill=DefaultValue(1),
+                                custom_validate=(validators.NumberInRange(min_value=1, max_value=7),),
+                            ),
+                            required=True,
+                        ),
+                    },
+                ),
+                required=False,
+            ),
+            "economy": DictElement(
+                parameter_form=Dictionary(
+                    title=Title("Economy mode"),
+                    help_text=Help(
+                        "Build the memory and aggregate CPU sections from the system statistics "
+                        "endpoint instead of fetching the memory and processor endpoints. "
+                        "This saves two API calls per run. The detailed endpoints are only "
+                        "fetched if per-core CPU services or swap details are needed."
+                    ),
+                    elements={
+                        "per_core": DictElement(
+                            parameter_form=BooleanChoice(
+                                title=Title("Per-core CPU services"),
+                                label=Label("Fetch processor statistics for per-core services"),
+                                prefill=DefaultValue(False),
+                            ),
+                            required=True,
+                        ),
+                        "swap": DictElement(
+                            parameter_form=BooleanChoice(
+                                title=Title("Swap details"),
+                                label=Label("Fetch memory details including swap"),
+                                prefill=DefaultValue(False),
+                            ),
+                            required=True,
+                        ),
+                    },
+                ),
+                required=False,
+            ),
+            "backoff": DictElement(
+                parameter_form=Dictionary(
+                    title=Title("Back off under appliance load"),
+                    help_text=Help(
+                        "Read the system statistics first and, while the appliance reports a CPU "
+                        "usage at or above the threshold, stop fetching the expensive processor "
+                        "and HDD/Ethernet endpoints. Their last data is served from cache as "
+                        "cached agent sections instead. The agent then also sends a performance "
+                        "section showing whether it backed off."
+                    ),
+                    elements={
+                        "cpu_threshold": DictElement(
+                            parameter_form=Float(
+                                title=Title("CPU usage threshold"),
+                                unit_symbol="%",
+                                prefill=DefaultValue(90.0),
+                                custom_validate=(validators.NumberInRange(min_value=1, max_value=100),),
+                            ),
+                            required=True,
+                        ),
+                        "max_age": DictElement(
+                            parameter_form=Integer(
+                                title=Title("Maximum age of cached sections"),
+                                help_text=Help(
+                                    "While backing off, a cached section older than this is "
+                                    "fetched again anyway so data never goes stale."
+                                ),
+                                unit_symbol="s",
+                                prefill=DefaultValue(900),
+                                custom_validate=(validators.NumberInRange(min_value=60, max_value=86400),),
+                            ),
+                            required=True,
+                        ),
+                    },
+                ),
+                required=False,
+            ),
+            "fleet": DictElement(
+                parameter_form=Dictionary(
+                    title=Title("Fleet mode"),
+                    help_text=Help(
+                        "Poll all appliances of a device list instead of this host, e.g. one "
+                        "written by \"agent_redshift --discover ... --discover-format json\". "
+                        "Each appliance's data is sent as piggyback data for the host of its "
+                        "name. A rollup of the CPU, memory and disk usage across all "
+                        "appliances is sent to the fleet host."
+                    ),
+                    elements={
+                        "devices_file": DictElement(
+                            parameter_form=String(
+                                title=Title("Device list file"),
+                                help_text=Help("Path of the JSON device list on the CheckMK server."),
+                                custom_validate=(validators.LengthInRange(min_value=1),),
+                            ),
+                            required=True,
+                        ),
+                        "fleet_host": DictElement(
+                            parameter_form=String(
+                                title=Title("Fleet host"),
+                                help_text=Help("Piggyback host receiving the fleet rollup."),
+                                prefill=DefaultValue("uctm-fleet"),
+                                custom_validate=(validators.LengthInRange(min_value=1),),
+                            ),
+                            required=True,
+                        ),
+                        "workers": DictElement(
+                            parameter_form=Integer(
+                                title=Title("Appliances polled at once"),
+                                prefill=DefaultValue(16),
+                                custom_validate=(validators.NumberInRange(min_value=1, max_value=256),),
+                            ),
+                            required=True,
+                        ),
+                        "shards": DictElement(
+                            parameter_form=Integer(
+                                title=Title("Worker processes"),
+                                help_text=Help(
+                                    "Split the device list across this many processes, each "
+                                    "polling its appliances concurrently, so that decoding the "
+                                    "responses of very large fleets uses all CPU cores. 0 starts "
+                                    "one process per CPU core."
+                                ),
+                                prefill=DefaultValue(0),
+                                custom_validate=(validators.NumberInRange(min_value=0, max_value=256),),
+                            ),
+                            required=False,
+                        ),
+                        "levels": DictElement(
+                            parameter_form=Dictionary(
+                                title=Title("Fleet levels"),
+                                help_text=Help(
+                                    "Usage above which an appliance counts as above the fleet level "
+                                    "in the rollup. These thresholds apply to all appliances alike; "
+                                    "the levels of each appliance's own checks are not used."
+                                ),
+                                elements={
+                                    resource: DictElement(
+                                        parameter_form=Float(
+                                            title=title,
+                                            unit_symbol="%",
+                                            prefill=DefaultValue(80.0),
+                                            custom_validate=(
+                                                validators.NumberInRange(min_value=0, max_value=100),
+                                            ),
+                                        ),
+                                        required=True,
+                                    )
+                                    for resource, title in [
+                                        ("cpu", Title("CPU utilization")),
+                                        ("memory", Title("Memory usage")),
+                                        ("disk", Title("Filesystem usage")),
+                                    ]
+                                },
+                            ),
+                            required=False,
+                        ),
+                    },
+                ),
+                required=False,
+            ),
+            "probe": DictElement(
+                parameter_form=Dictionary(
+                    title=Title("Liveness probe only"),
+                    help_text=Help(
+                        "Instead of collecting the data sections, send a single request to "
+                        "the cheapest API endpoint with a short timeout. The agent only "
+                        "outputs whether the API answered and its round-trip time, shown in "
+                        "the \"Redshift API\" service. Use this for a second, frequently "
+                        "polled datasource program that detects an unreachable API fast."
+                    ),
+                    elements={
+                        "timeout": DictElement(
+                            parameter_form=Float(
+                                title=Title("Probe timeout"),
+                                unit_symbol="s",
+                                prefill=DefaultValue(2.0),
+                                custom_validate=(validators.NumberInRange(min_value=0.1, max_value=60),),
+                            ),
+                            required=True,
+                        ),
+                    },
+                ),
+                required=False,
+            ),
+            "share_cache": DictElement(
+                parameter_form=BooleanChoice(
+                    title=Title("Share poll results with the metrics exporter"),
+                    help_text=Help(
+                        "Store the polled sections in the agent's per-device cache. An "
+                        "OpenMetrics exporter started with \"agent_redshift --exporter\" for "
+                        "the same device then serves them on /metrics instead of polling the "
+                        "device a second time."
+                    ),
+                    label=Label("Store poll results for the exporter"),
+                    prefill=DefaultValue(False),
+                ),
+                required=False,
+            ),
             "sections": DictElement(
                 parameter_form=MultipleChoice(
                     title=Title("Sections to collect"),
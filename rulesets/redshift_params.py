@@ -11,15 +11,38 @@ WATO check parameters for Redshift Networks UCTM monitoring
 from cmk.rulesets.v1 import Help, Label, Title
 from cmk.rulesets.v1.form_specs import (
     BooleanChoice,
+    DataSize,
     DefaultValue,
     DictElement,
     Dictionary,
+    Float,
+    IECMagnitude,
     Integer,
     LevelDirection,
+    Levels,
+    List,
+    ListOfStrings,
+    MatchingScope,
+    migrate_to_float_simple_levels,
     migrate_to_integer_simple_levels,
+    migrate_to_upper_integer_levels,
+    PredictiveLevels,
+    RegularExpression,
     SimpleLevels,
+    SingleChoice,
+    SingleChoiceElement,
+    String,
+    TimeMagnitude,
+    TimeSpan,
+    validators,
+)
+from cmk.rulesets.v1.rule_specs import (
+    CheckParameters,
+    DiscoveryParameters,
+    HostAndItemCondition,
+    HostCondition,
+    Topic,
 )
-from cmk.rulesets.v1.rule_specs import CheckParameters, DiscoveryParameters, HostAndItemCondition, Topic
 
 
 # Processor Discovery Parameters
@@ -66,21 +89,133 @@ rule_spec_redshift_processor_discovery = DiscoveryParameters(
 )
 
 
+def _regex_list_element(title: Title, help_text: Help) -> DictElement:
+    return DictElement(
+        parameter_form=ListOfStrings(
+            title=title,
+            help_text=help_text,
+            string_spec=RegularExpression(predefined_help_text=MatchingScope.PREFIX),
+        ),
+        required=False,
+    )
+
+
+def _average_element() -> DictElement:
+    return DictElement(
+        parameter_form=Integer(
+            title=Title("Averaging"),
+            help_text=Help(
+                "Apply the levels to the sliding average over this many minutes instead of the "
+                "current value, to avoid alerts on short load peaks. The current value is still graphed."
+            ),
+            unit_symbol="minutes",
+            prefill=DefaultValue(15),
+            custom_validate=(validators.NumberInRange(min_value=1),),
+        ),
+        required=False,
+    )
+
+
+def _cluster_mode_element() -> DictElement:
+    return DictElement(
+        parameter_form=SingleChoice(
+            title=Title("Cluster mode"),
+            help_text=Help(
+                "When the service is assigned to a cluster host, only one node is evaluated "
+                "for the service state. The other nodes are listed in the details."
+            ),
+            elements=[
+                SingleChoiceElement(name="worst", title=Title("Worst node")),
+                SingleChoiceElement(name="best", title=Title("Best node")),
+            ],
+            prefill=DefaultValue("worst"),
+        ),
+        required=False,
+    )
+
+
+def _percent_levels(title: Title, reference_metric: str, prefill: tuple[int, int]) -> Levels:
+    return Levels(
+        title=title,
+        level_direction=LevelDirection.UPPER,
+        form_spec_template=Integer(unit_symbol="%"),
+        prefill_fixed_levels=DefaultValue(prefill),
+        predictive=PredictiveLevels(
+            reference_metric=reference_metric,
+            prefill_abs_diff=DefaultValue((10, 20)),
+        ),
+        migrate=migrate_to_upper_integer_levels,
+    )
+
+
+def _free_bytes_element() -> DictElement:
+    return DictElement(
+        parameter_form=SimpleLevels(
+            title=Title("Free space"),
+            help_text=Help("Absolute levels on the free space, in addition to the percentage levels."),
+            level_direction=LevelDirection.LOWER,
+            form_spec_template=DataSize(displayed_magnitudes=[IECMagnitude.MEBI, IECMagnitude.GIBI]),
+            prefill_fixed_levels=DefaultValue((2 * 1024**3, 1024**3)),
+            migrate=migrate_to_integer_simple_levels,
+        ),
+        required=False,
+    )
+
+
+# System Statistics Parameters
+def _parameter_form_system_stats() -> Dictionary:
+    return Dictionary(
+        title=Title("System statistics thresholds"),
+        elements={
+            "memory_levels": DictElement(
+                parameter_form=_percent_levels(Title("Memory usage"), "memory_used_percent", (90, 95)),
+                required=True,
+            ),
+            "cpu_levels": DictElement(
+                parameter_form=_percent_levels(Title("CPU usage"), "cpu_percent", (80, 90)),
+                required=True,
+            ),
+            "memory_metrics": DictElement(
+                parameter_form=SingleChoice(
+                    title=Title("Memory metrics"),
+                    help_text=Help(
+                        "System stats and the Memory service measure the same memory usage. "
+                        "By default only the Memory service records it, System stats then only "
+                        "applies its levels. If no Memory service exists, System stats always "
+                        "records the memory metrics. With predictive memory levels, System stats "
+                        "always records the used memory percentage the prediction is based on."
+                    ),
+                    elements=[
+                        SingleChoiceElement(name="memory", title=Title("Recorded by the Memory service only")),
+                        SingleChoiceElement(name="both", title=Title("Recorded by both services")),
+                    ],
+                    prefill=DefaultValue("memory"),
+                ),
+                required=False,
+            ),
+        },
+    )
+
+
+rule_spec_redshift_system_stats = CheckParameters(
+    name="redshift_system_stats",
+    title=Title("Redshift System statistics"),
+    topic=Topic.OPERATING_SYSTEM,
+    parameter_form=_parameter_form_system_stats,
+    condition=HostCondition(),
+)
+
+
 # CPU Utilization Parameters
-def _parameter_form_cpu() -> Dictionary:
+def _parameter_form_cpu(util: SimpleLevels | Levels) -> Dictionary:
     return Dictionary(
         title=Title("CPU utilization thresholds"),
         elements={
             "util": DictElement(
-                parameter_form=SimpleLevels(
-                    title=Title("Total CPU utilization"),
-                    level_direction=LevelDirection.UPPER,
-                    form_spec_template=Integer(unit_symbol="%"),
-                    prefill_fixed_levels=DefaultValue((80, 90)),
-                    migrate=migrate_to_integer_simple_levels,
-                ),
+                parameter_form=util,
                 required=True,
             ),
+            "average": _average_element(),
             "iowait": DictElement(
                 parameter_form=SimpleLevels(
                     title=Title("I/O wait percentage"),
@@ -91,16 +226,43 @@ def _parameter_form_cpu() -> Dictionary:
                 ),
                 required=False,
             ),
+            "cluster_mode": _cluster_mode_element(),
         },
     )
 
 
-rule_spec_redshift_cpu = CheckParameters(
-    name="redshift_cpu",
+def _parameter_form_cpu_aggregate() -> Dictionary:
+    return _parameter_form_cpu(_percent_levels(Title("Total CPU utilization"), "util", (80, 90)))
+
+
+def _parameter_form_cpu_core() -> Dictionary:
+    # Predictive levels need a fixed metric name, per-core metrics are named by core
+    return _parameter_form_cpu(
+        SimpleLevels(
+            title=Title("Total CPU utilization"),
+            level_direction=LevelDirection.UPPER,
+            form_spec_template=Integer(unit_symbol="%"),
+            prefill_fixed_levels=DefaultValue((80, 90)),
+            migrate=migrate_to_integer_simple_levels,
+        )
+    )
+
+
+rule_spec_redshift_cpu_aggregate = CheckParameters(
+    name="redshift_cpu_aggregate",
     title=Title("Redshift CPU utilization"),
     topic=Topic.OPERATING_SYSTEM,
-    parameter_form=_parameter_form_cpu,
-    condition=HostAndItemCondition(item_title=Title("CPU")),
+    parameter_form=_parameter_form_cpu_aggregate,
+    condition=HostCondition(),
+)
+
+
+rule_spec_redshift_cpu_core = CheckParameters(
+    name="redshift_cpu_core",
+    title=Title("Redshift CPU core utilization"),
+    topic=Topic.OPERATING_SYSTEM,
+    parameter_form=_parameter_form_cpu_core,
+    condition=HostAndItemCondition(item_title=Title("CPU core")),
 )
 
 
@@ -110,15 +272,12 @@ def _parameter_form_memory() -> Dictionary:
         title=Title("Memory usage thresholds"),
         elements={
             "levels": DictElement(
-                parameter_form=SimpleLevels(
-                    title=Title("Memory usage"),
-                    level_direction=LevelDirection.UPPER,
-                    form_spec_template=Integer(unit_symbol="%"),
-                    prefill_fixed_levels=DefaultValue((80, 90)),
-                    migrate=migrate_to_integer_simple_levels,
-                ),
+                parameter_form=_percent_levels(Title("Memory usage"), "mem_used_percent", (80, 90)),
                 required=True,
             ),
+            "average": _average_element(),
+            "levels_free": _free_bytes_element(),
+            "cluster_mode": _cluster_mode_element(),
         },
     )
 
@@ -128,7 +287,48 @@ rule_spec_redshift_memory = CheckParameters(
     title=Title("Redshift Memory usage"),
     topic=Topic.OPERATING_SYSTEM,
     parameter_form=_parameter_form_memory,
-    condition=HostAndItemCondition(item_title=Title("Memory")),
+    condition=HostCondition(),
+)
+
+
+# Filesystem Discovery Parameters
+def _parameter_form_disk_discovery() -> Dictionary:
+    return Dictionary(
+        title=Title("Filesystem discovery"),
+        help_text=Help(
+            "This rule controls for which mount points filesystem services are created. "
+            "Without a rule, every mount point reported by the device is discovered."
+        ),
+        elements={
+            "include": _regex_list_element(
+                Title("Only discover mount points matching"),
+                Help("If set, only mount points matching one of these regular expressions are discovered."),
+            ),
+            "exclude": _regex_list_element(
+                Title("Never discover mount points matching"),
+                Help("Mount points matching one of these regular expressions are not discovered."),
+            ),
+            "exclude_types": DictElement(
+                parameter_form=ListOfStrings(
+                    title=Title("Exclude filesystem types"),
+                    help_text=Help(
+                        "Filesystems reported with one of these names in the filesystem column, "
+                        "e.g. tmpfs or overlay, are not discovered."
+                    ),
+                    string_spec=String(),
+                    prefill=DefaultValue(["tmpfs", "devtmpfs", "overlay", "none"]),
+                ),
+                required=False,
+            ),
+        },
+    )
+
+
+rule_spec_redshift_disk_discovery = DiscoveryParameters(
+    name="redshift_disk_discovery",
+    title=Title("Redshift Filesystem Discovery"),
+    topic=Topic.STORAGE,
+    parameter_form=_parameter_form_disk_discovery,
 )
 
 
@@ -138,15 +338,36 @@ def _parameter_form_filesystem() -> Dictionary:
         title=Title("Filesystem usage thresholds"),
         elements={
             "levels": DictElement(
+                parameter_form=_percent_levels(Title("Filesystem usage"), "fs_used_percent", (80, 90)),
+                required=True,
+            ),
+            "levels_free": _free_bytes_element(),
+            "trend_range": DictElement(
+                parameter_form=Integer(
+                    title=Title("Time range for fill rate computation"),
+                    help_text=Help(
+                        "The fill rate is computed by linear regression over the usage "
+                        "of this time range."
+                    ),
+                    unit_symbol="hours",
+                    prefill=DefaultValue(24),
+                    custom_validate=(validators.NumberInRange(min_value=1),),
+                ),
+                required=False,
+            ),
+            "time_to_full": DictElement(
                 parameter_form=SimpleLevels(
-                    title=Title("Filesystem usage"),
-                    level_direction=LevelDirection.UPPER,
-                    form_spec_template=Integer(unit_symbol="%"),
-                    prefill_fixed_levels=DefaultValue((80, 90)),
-                    migrate=migrate_to_integer_simple_levels,
+                    title=Title("Time until filesystem is full"),
+                    level_direction=LevelDirection.LOWER,
+                    form_spec_template=TimeSpan(
+                        displayed_magnitudes=[TimeMagnitude.DAY, TimeMagnitude.HOUR],
+                    ),
+                    prefill_fixed_levels=DefaultValue((7 * 86400.0, 2 * 86400.0)),
+                    migrate=migrate_to_float_simple_levels,
                 ),
-                required=True,
+                required=False,
             ),
+            "cluster_mode": _cluster_mode_element(),
         },
     )
 
@@ -165,5 +386,154 @@ rule_spec_redshift_hdd = CheckParameters(
     title=Title("Redshift HDD aggregate usage"),
     topic=Topic.STORAGE,
     parameter_form=_parameter_form_filesystem,
-    condition=HostAndItemCondition(item_title=Title("HDD")),
+    condition=HostCondition(),
+)
+
+
+# Interface Discovery Parameters
+def _parameter_form_interfaces_discovery() -> Dictionary:
+    return Dictionary(
+        title=Title("Interface discovery"),
+        help_text=Help(
+            "This rule controls for which network interfaces services are created. "
+            "Interfaces matching an interface group are not discovered individually, "
+            "they are monitored by one aggregated service per group instead."
+        ),
+        elements={
+            "include": _regex_list_element(
+                Title("Only discover interfaces matching"),
+                Help("If set, only interfaces matching one of these regular expressions are discovered."),
+            ),
+            "exclude": _regex_list_element(
+                Title("Never discover interfaces matching"),
+                Help("Interfaces matching one of these regular expressions are not discovered, e.g. lo."),
+            ),
+            "groups": DictElement(
+                parameter_form=List(
+                    title=Title("Interface groups"),
+                    help_text=Help(
+                        "Roll up interfaces into one service per group, e.g. all VLAN sub-interfaces "
+                        "of eth0 with the pattern eth0\\.. The first matching group wins."
+                    ),
+                    element_template=Dictionary(
+                        elements={
+                            "name": DictElement(
+                                parameter_form=String(
+                                    title=Title("Group name"),
+                                    custom_validate=(validators.LengthInRange(min_value=1),),
+                                ),
+                                required=True,
+                            ),
+                            "pattern": DictElement(
+                                parameter_form=RegularExpression(
+                                    title=Title("Member interfaces"),
+                                    predefined_help_text=MatchingScope.PREFIX,
+                                ),
+                                required=True,
+                            ),
+                        },
+                    ),
+                ),
+                required=False,
+            ),
+        },
+    )
+
+
+rule_spec_redshift_interfaces_discovery = DiscoveryParameters(
+    name="redshift_interfaces_discovery",
+    title=Title("Redshift Interface Discovery"),
+    topic=Topic.NETWORKING,
+    parameter_form=_parameter_form_interfaces_discovery,
+)
+
+
+# Interface Parameters
+def _parameter_form_interfaces() -> Dictionary:
+    return Dictionary(
+        title=Title("Interface monitoring"),
+        elements={
+            "cluster_mode": _cluster_mode_element(),
+        },
+    )
+
+
+rule_spec_redshift_interfaces = CheckParameters(
+    name="redshift_interfaces",
+    title=Title("Redshift Network interfaces"),
+    topic=Topic.NETWORKING,
+    parameter_form=_parameter_form_interfaces,
+    condition=HostAndItemCondition(item_title=Title("Interface")),
+)
+
+
+# API Probe Parameters
+def _parameter_form_probe() -> Dictionary:
+    return Dictionary(
+        title=Title("API liveness probe"),
+        elements={
+            "rtt": DictElement(
+                parameter_form=SimpleLevels(
+                    title=Title("Response time"),
+                    level_direction=LevelDirection.UPPER,
+                    form_spec_template=TimeSpan(
+                        displayed_magnitudes=[TimeMagnitude.SECOND, TimeMagnitude.MILLISECOND],
+                    ),
+                    prefill_fixed_levels=DefaultValue((0.5, 1.0)),
+                    migrate=migrate_to_float_simple_levels,
+                ),
+                required=False,
+            ),
+        },
+    )
+
+
+rule_spec_redshift_probe = CheckParameters(
+    name="redshift_probe",
+    title=Title("Redshift API liveness probe"),
+    topic=Topic.NETWORKING,
+    parameter_form=_parameter_form_probe,
+    condition=HostCondition(),
+)
+
+
+# Fleet Rollup Parameters
+def _parameter_form_fleet() -> Dictionary:
+    return Dictionary(
+        title=Title("UCTM fleet usage"),
+        elements={
+            "p95": DictElement(
+                parameter_form=SimpleLevels(
+                    title=Title("95th percentile of the usage across the fleet"),
+                    level_direction=LevelDirection.UPPER,
+                    form_spec_template=Float(unit_symbol="%"),
+                    prefill_fixed_levels=DefaultValue((80.0, 90.0)),
+                    migrate=migrate_to_float_simple_levels,
+                ),
+                required=False,
+            ),
+            "above": DictElement(
+                parameter_form=SimpleLevels(
+                    title=Title("Number of appliances above the fleet level"),
+                    help_text=Help(
+                        "The level of each resource is configured in the special agent rule "
+                        "of the fleet."
+                    ),
+                    level_direction=LevelDirection.UPPER,
+                    form_spec_template=Integer(),
+                    prefill_fixed_levels=DefaultValue((1, 5)),
+                    migrate=migrate_to_integer_simple_levels,
+                ),
+                required=False,
+            ),
+        },
+    )
+
+
+rule_spec_redshift_fleet = CheckParameters(
+    name="redshift_fleet",
+    title=Title("Redshift UCTM fleet usage"),
+    topic=Topic.OPERATING_SYSTEM,
+    parameter_form=_parameter_form_fleet,
+    condition=HostAndItemCondition(item_title=Title("Resource")),
 )
@@ -18,13 +18,53 @@ from cmk.server_side_calls.v1 import (
 )
 
 
+class HedgingParams(BaseModel):
+    """Parameters for hedged requests"""
+    delay: float = 1.0
+    max_hedges: int = 1
+
+
+class EconomyParams(BaseModel):
+    """Parameters for economy mode"""
+    per_core: bool = False
+    swap: bool = False
+
+
+class BackoffParams(BaseModel):
+    """Parameters for load-aware scheduling"""
+    cpu_threshold: float = 90.0
+    max_age: int = 900
+
+
+class ProbeParams(BaseModel):
+    """Parameters for the liveness probe"""
+    timeout: float = 2.0
+
+
+class FleetParams(BaseModel):
+    """Parameters for fleet mode"""
+    devices_file: str
+    fleet_host: str = "uctm-fleet"
+    workers: int = 16
+    shards: int | None = None
+    levels: dict[str, float] | None = None
+
+
 class RedshiftParams(BaseModel):
     """Parameters for Redshift UCTM special agent"""
     host: str | None = None
     port: int = 443
     verify_ssl: str = "no_verify"
+    ca_file: str | None = None
+    cert_fingerprint: str | None = None
     timeout: int = 10
     sections: list[str] | None = None
+    hedging: HedgingParams | None = None
+    economy: EconomyParams | None = None
+    backoff: BackoffParams | None = None
+    probe: ProbeParams | None = None
+    fleet: FleetParams | None = None
+    share_cache: bool = False
 
 
 def generate_redshift_command(
@@ -48,6 +88,59 @@ def generate_redshift_command(
     if params.verify_ssl == "verify":
         args.append("--verify-ssl")
 
+    if params.ca_file:
+        args.extend(["--ca-file", params.ca_file])
+
+    if params.cert_fingerprint:
+        args.extend(["--cert-fingerprint", params.cert_fingerprint])
+
+    if params.hedging:
+        args.extend([
+            "--hedge",
+            "--hedge-delay",
+            str(params.hedging.delay),
+            "--hedge-max",
+            str(params.hedging.max_hedges),
+        ])
+
+    if params.economy:
+        args.append("--economy")
+        if params.economy.per_core:
+            args.append("--economy-per-core")
+        if params.economy.swap:
+            args.append("--economy-swap")
+
+    if params.backoff:
+        args.extend([
+            "--backoff-cpu",
+            str(params.backoff.cpu_threshold),
+            "--backoff-max-age",
+            str(params.backoff.max_age),
+        ])
+
+    if params.fleet:
+        args.extend([
+            "--devices",
+            params.fleet.devices_file,
+            "--fleet-host",
+            params.fleet.fleet_host,
+            "--fleet-workers",
+            str(params.fleet.workers),
+        ])
+        if params.fleet.shards is not None:
+            args.extend(["--fleet-shards", str(params.fleet.shards)])
+        if params.fleet.levels:
+            args.extend([
+                "--fleet-levels",
+                ",".join(f"{resource}={level}" for resource, level in params.fleet.levels.items()),
+            ])
+
+    if params.probe:
+        args.extend(["--probe", "--probe-timeout", str(params.probe.timeout)])
+
+    if params.share_cache:
+        args.append("--share-cache")
+
     # Add sections if specified
     if params.sections:
         args.append("--sections")
@@ -4,6 +4,12 @@
 Pytest configuration and shared fixtures for Redshift UCTM tests
 """
 
+import http.server
+import json
+import shutil
+import ssl
+import subprocess
+import threading
 import pytest
 import sys
 from pathlib import Path
@@ -34,6 +40,15 @@ except ImportError:
             setattr(sys.modules['cmk.agent_based.v1.register'], attr, getattr(mock_cmk, attr))
 
 
+@pytest.fixture(autouse=True)
+def value_store():
+    """Start every test with an empty value store (mocked CheckMK only)"""
+    store = getattr(sys.modules["cmk.agent_based.v2"], "_value_store", None)
+    if store is not None:
+        store.clear()
+    return store
+
+
 @pytest.fixture
 def sample_system_stats_json():
     """Sample system statistics JSON response"""
@@ -192,3 +207,94 @@ def sample_uptime_json():
     return {
         "value": "up 45 days, 12:34:56"
     }
+
+
+# ============================================================================
+# Local stand-in for a UCTM appliance
+# ============================================================================
+
+STUB_RESPONSES = {
+    "systemstatusandstatistics/statsandstatus": [
+        {"type": "Total Memory", "value": "16173828 kB"},
+        {"type": "Used Memory", "value": "3747460 kB (23.0%)"},
+        {"type": "CPU Usage", "value": "15.2%"},
+    ],
+    "ethernet/ethernetUsage": {"HDD Usage Details": {}, "Ethernet usage": []},
+    "systemdevicestats/chassisInfo": {"manufacturer": "Stub Inc.", "serialNumber": "STUB0001"},
+    "systemdevicestats/mpstat": [{"type": "mpstat", "cpu": "all", "idle": "80.0"}],
+    "systemdevicestats/freespace": [{"type": "Mem:", "total": "1024", "free": "512"}],
+    "systemdevicestats/diskspace": [{"filesystem": "/dev/sda1", "mountedOn": "/"}],
+    "systemdevicestats/uptime": {"value": "up 1 day"},
+}
+
+
+class StubUCTMServer:
+    """HTTPS server answering the Redshift REST endpoints with canned data"""
+
+    def __init__(self, certfile: Path):
+        self.responses = dict(STUB_RESPONSES)
+        self.requests = []
+        self.delay = 0.0
+        stub = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                stub.requests.append(self.path)
+                if stub.delay:
+                    threading.Event().wait(stub.delay)
+                endpoint = self.path.removeprefix("/rs/rest/")
+                if endpoint not in stub.responses:
+                    self.send_error(404)
+                    return
+                body = json.dumps(stub.responses[endpoint]).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(certfile)
+        self.server.socket = context.wrap_socket(self.server.socket, server_side=True)
+        self.host, self.port = self.server.server_address[:2]
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture(scope="session")
+def stub_certfile(tmp_path_factory):
+    """Self-signed certificate and key for the stand-in appliance"""
+    if shutil.which("openssl") is None:
+        pytest.skip("openssl is required to create a test certificate")
+    certfile = tmp_path_factory.mktemp("tls") / "stub.pem"
+    subprocess.run(
+        [
+            "openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+            "-subj", "/CN=127.0.0.1", "-addext", "subjectAltName=IP:127.0.0.1",
+            "-keyout", str(certfile), "-out", str(certfile),
+        ],
+        check=True,
+        capture_output=True,
+    )
+    return certfile
+
+
+@pytest.fixture
+def stub_uctm(stub_certfile):
+    """Running HTTPS stand-in for a UCTM appliance"""
+    with StubUCTMServer(stub_certfile) as server:
+        yield server
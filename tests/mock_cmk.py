@@ -61,6 +61,29 @@ class CheckPlugin:
             setattr(self, key, value)
 
 
+class InventoryPlugin:
+    """Inventory plugin registration"""
+    def __init__(self, name: str, **kwargs):
+        self.name = name
+        for key, value in kwargs.items():
+            setattr(self, key, value)
+
+
+class Attributes(NamedTuple):
+    """Inventory attributes"""
+    path: list
+    inventory_attributes: dict = {}
+    status_attributes: dict = {}
+
+
+class TableRow(NamedTuple):
+    """Inventory table row"""
+    path: list
+    key_columns: dict
+    inventory_columns: dict = {}
+    status_columns: dict = {}
+
+
 class HostLabel(NamedTuple):
     """Host label"""
     name: str
@@ -83,6 +106,50 @@ class render:
         """Format timespan"""
         return f"{seconds}s"
 
+    @staticmethod
+    def percent(value):
+        """Format percentage"""
+        return f"{value:.2f}%"
+
+
+def check_levels(value, *, levels_upper=None, levels_lower=None, metric_name=None,
+                 render_func=None, label=None, boundaries=None, notice_only=False):
+    """Check a value against fixed or predictive levels"""
+    render_func = render_func or (lambda v: f"{v:.2f}")
+    text = f"{label}: {render_func(value)}" if label else render_func(value)
+    state = State.OK
+
+    upper_type, upper = levels_upper or ("no_levels", None)
+    if upper_type == "predictive":
+        _metric, prediction, upper = upper
+        if prediction is not None:
+            text += f" (prediction: {render_func(prediction)})"
+    if upper_type != "no_levels" and upper is not None:
+        warn, crit = upper
+        if value >= crit:
+            state = State.CRIT
+        elif value >= warn:
+            state = State.WARN
+        if state != State.OK:
+            text += f" (warn/crit at {render_func(warn)}/{render_func(crit)})"
+
+    lower_type, lower = levels_lower or ("no_levels", None)
+    if state == State.OK and lower_type != "no_levels" and lower is not None:
+        warn, crit = lower
+        if value < crit:
+            state = State.CRIT
+        elif value < warn:
+            state = State.WARN
+        if state != State.OK:
+            text += f" (warn/crit below {render_func(warn)}/{render_func(crit)})"
+
+    if notice_only:
+        yield Result(state=state, notice=text)
+    else:
+        yield Result(state=state, summary=text)
+    if metric_name:
+        yield Metric(metric_name, value, levels=upper if upper_type == "fixed" else (), boundaries=boundaries or ())
+
 
 # Mock cmk.server_side_calls.v1
 class HostConfig:
@@ -118,3 +185,13 @@ class RuleSetType(IntEnum):
 # Type aliases used by CheckMK
 CheckResult = Generator[Result | Metric, None, None]
 DiscoveryResult = Generator[Service, None, None]
+InventoryResult = Generator[Attributes | TableRow, None, None]
+
+
+# Value store of the service being checked
+_value_store: dict = {}
+
+
+def get_value_store():
+    """Return the value store of the current service"""
+    return _value_store
@@ -5,10 +5,21 @@ Tests for the agent_redshift special agent
 """
 
 import pytest
+import asyncio
+import gzip
+import hashlib
 import json
+import pstats
 import requests
 import requests_mock
+import socket
+import ssl
 import sys
+import threading
+import time
+import tracemalloc
+import urllib.error
+import urllib.request
 import importlib.util
 
 # Import the agent module dynamically since it doesn't have .py extension
@@ -25,6 +36,54 @@ RedshiftAPI = agent_redshift.RedshiftAPI
 parse_arguments = agent_redshift.parse_arguments
 output_section = agent_redshift.output_section
 main = agent_redshift.main
+percentile = agent_redshift.percentile
+derive_memory_section = agent_redshift.derive_memory_section
+derive_processor_section = agent_redshift.derive_processor_section
+SectionCache = agent_redshift.SectionCache
+render_openmetrics = agent_redshift.render_openmetrics
+MetricsSource = agent_redshift.MetricsSource
+make_exporter_server = agent_redshift.make_exporter_server
+write_recording = agent_redshift.write_recording
+load_recording = agent_redshift.load_recording
+find_recording = agent_redshift.find_recording
+recommend_load = agent_redshift.recommend_load
+read_http_response = agent_redshift.read_http_response
+discovered_host_name = agent_redshift.discovered_host_name
+Tracer = agent_redshift.Tracer
+shared_ssl_context = agent_redshift.shared_ssl_context
+fleet_rollup = agent_redshift.fleet_rollup
+device_usage = agent_redshift.device_usage
+AsyncRedshiftAPI = agent_redshift.AsyncRedshiftAPI
+
+STATS_URL = "https://redshift.example.com:443/rs/rest/systemstatusandstatistics/statsandstatus"
+
+
+def mock_all_endpoints(m, stats):
+    """Register all endpoints and return their matchers by endpoint"""
+    base = "https://redshift.example.com:443/rs/rest/"
+    responses = {
+        "systemstatusandstatistics/statsandstatus": stats,
+        "ethernet/ethernetUsage": {"HDD Usage Details": {}},
+        "systemdevicestats/chassisInfo": {"manufacturer": "Test"},
+        "systemdevicestats/mpstat": [{"type": "mpstat", "cpu": "all", "idle": "50.0"}],
+        "systemdevicestats/freespace": [{"type": "Mem:", "total": "1", "free": "1"}],
+        "systemdevicestats/diskspace": [{"mountedOn": "/"}],
+        "systemdevicestats/uptime": {"value": "up 1 day"},
+    }
+    return {endpoint: m.post(base + endpoint, json=data) for endpoint, data in responses.items()}
+
+
+def section_data(output, header):
+    """Return the decoded data following a section header in agent output"""
+    lines = output.splitlines()
+    return json.loads(lines[lines.index(header) + 1])
+
+
+@pytest.fixture(autouse=True)
+def isolated_state_dir(tmp_path, monkeypatch):
+    """Keep agent state files out of the real temp directory"""
+    monkeypatch.setenv("OMD_ROOT", str(tmp_path))
+    return tmp_path / "tmp" / "check_mk" / "agent_redshift"
 
 
 class TestRedshiftAPI:
@@ -188,6 +247,1357 @@ class TestRedshiftAPI:
             assert result == response_data
 
 
+class TestHedging:
+    """Tests for hedged requests"""
+
+    @staticmethod
+    def _stall_first_post(api, delay, hedge_status=200):
+        """Replace _post so the first call stalls and later calls answer at once"""
+        calls = []
+
+        def fake_post(session, url):
+            calls.append(session)
+            response = requests.Response()
+            response.url = url
+            if len(calls) == 1:
+                time.sleep(delay)
+                response.status_code = 200
+                response._content = b'[{"type": "CPU Usage", "value": "slow"}]'
+            else:
+                response.status_code = hedge_status
+                response._content = b'[{"type": "CPU Usage", "value": "fast"}]'
+            response.raise_for_status()
+            return response
+
+        api._post = fake_post
+        return calls
+
+    def test_percentile(self):
+        """Test nearest-rank percentile"""
+        samples = [float(i) for i in range(1, 101)]
+
+        assert percentile(samples, 95) == 95.0
+        assert percentile(samples, 50) == 50.0
+        assert percentile([3.0], 95) == 3.0
+
+    def test_hedge_delay_uses_configured_delay_without_history(self):
+        """Test the configured delay is used until enough samples exist"""
+        api = RedshiftAPI(host="redshift.example.com", hedge=True, hedge_delay=2.5)
+
+        assert api._hedge_delay_for("test/endpoint") == 2.5
+
+    def test_hedge_delay_uses_p95_of_history(self):
+        """Test the p95 of the latency history is used as hedge delay"""
+        history = {"test/endpoint": [0.1] * 95 + [5.0] * 5}
+        api = RedshiftAPI(host="redshift.example.com", hedge=True, latency_history=history)
+
+        assert api._hedge_delay_for("test/endpoint") == 0.1
+
+    def test_hedged_request_wins(self):
+        """Test the hedged request answers when the first one stalls"""
+        api = RedshiftAPI(host="redshift.example.com", hedge=True, hedge_delay=0.05)
+        calls = self._stall_first_post(api, 0.5)
+
+        result = api.get_system_stats()
+
+        assert result == [{"type": "CPU Usage", "value": "fast"}]
+        assert api.hedges_sent == 1
+        assert len(calls) == 2
+        # The fresh connection that answered is kept for later requests
+        assert api.session is calls[1]
+
+    def test_hedged_win_does_not_raise_p95(self):
+        """Test a won hedge records its own latency, not the hedge delay included"""
+        endpoint = "systemstatusandstatistics/statsandstatus"
+        history = {endpoint: [0.05] * 100}
+        api = RedshiftAPI(host="redshift.example.com", hedge=True, hedge_max=10, latency_history=history)
+        before = api._hedge_delay_for(endpoint)
+
+        for _ in range(10):
+            self._stall_first_post(api, 0.3)
+            api.get_system_stats()
+
+        assert api.hedges_sent == 10
+        assert max(list(api.latencies[endpoint])[-10:]) < before
+        assert api._hedge_delay_for(endpoint) <= before
+
+    def test_fast_response_is_not_hedged(self):
+        """Test no hedge is sent when the first request answers in time"""
+        api = RedshiftAPI(host="redshift.example.com", hedge=True, hedge_delay=1.0)
+
+        with requests_mock.Mocker() as m:
+            m.post(STATS_URL, json=[{"type": "CPU Usage", "value": "15%"}])
+            result = api.get_system_stats()
+
+        assert result == [{"type": "CPU Usage", "value": "15%"}]
+        assert api.hedges_sent == 0
+        assert len(api.latencies["systemstatusandstatistics/statsandstatus"]) == 1
+
+    def test_hedge_budget_is_capped(self):
+        """Test no more hedges are sent than allowed per device"""
+        api = RedshiftAPI(host="redshift.example.com", hedge=True, hedge_delay=0.05, hedge_max=0)
+        calls = self._stall_first_post(api, 0.2)
+
+        result = api.get_system_stats()
+
+        assert result == [{"type": "CPU Usage", "value": "slow"}]
+        assert api.hedges_sent == 0
+        assert len(calls) == 1
+
+    def test_hedge_falls_back_when_hedge_fails(self):
+        """Test the slow response is used when the hedged request fails"""
+        api = RedshiftAPI(host="redshift.example.com", hedge=True, hedge_delay=0.05)
+        self._stall_first_post(api, 0.2, hedge_status=500)
+
+        result = api.get_system_stats()
+
+        assert result == [{"type": "CPU Usage", "value": "slow"}]
+        assert api.hedges_sent == 1
+
+    def test_main_persists_latency_history(self, isolated_state_dir):
+        """Test main stores the latency history between runs when hedging"""
+        with requests_mock.Mocker() as m:
+            m.post(STATS_URL, json=[{"type": "CPU Usage", "value": "15%"}])
+            result = main(["-H", "redshift.example.com", "--sections", "system_stats", "--hedge"])
+
+        assert result == 0
+        history_file = isolated_state_dir / "redshift.example.com_443_latency.json"
+        history = json.loads(history_file.read_text())
+        assert len(history["systemstatusandstatistics/statsandstatus"]) == 1
+
+
+class TestEconomyMode:
+    """Tests for economy mode"""
+
+    STATS = [
+        {"type": "Total Memory", "value": "16173828 kB"},
+        {"type": "Used Memory", "value": "3747460 kB (23.0%)"},
+        {"type": "CPU Usage", "value": "15.2%"},
+    ]
+
+    def test_derive_memory_section(self):
+        """Test building the memory section from statsandstatus"""
+        result = derive_memory_section(self.STATS)
+
+        assert result == [{
+            "type": "Mem:",
+            "total": "16173828",
+            "used": "3747460",
+            "free": "12426368",
+        }]
+
+    @pytest.mark.parametrize("total, used, expected", [
+        ("16 GB", "4 GB (25.0%)", ("16777216", "4194304", "12582912")),
+        ("2048 MB", "512 MB", ("2097152", "524288", "1572864")),
+        ("15.6 GB", "3.9 GB (25.0%)", ("16357785", "4089446", "12268339")),
+    ])
+    def test_derive_memory_section_units(self, total, used, expected):
+        """Test sizes in MB, GB and with decimals are converted to kB"""
+        result = derive_memory_section([
+            {"type": "Total Memory", "value": total},
+            {"type": "Used Memory", "value": used},
+        ])
+
+        assert (result[0]["total"], result[0]["used"], result[0]["free"]) == expected
+
+    def test_derive_memory_section_missing_data(self):
+        """Test the memory section is not derived from incomplete data"""
+        assert derive_memory_section([{"type": "CPU Usage", "value": "15%"}]) is None
+        assert derive_memory_section(None) is None
+        assert derive_memory_section([{"type": "Total Memory", "value": "n/a"},
+                                      {"type": "Used Memory", "value": "1 kB"}]) is None
+
+    def test_derive_processor_section(self):
+        """Test building the aggregate CPU section from statsandstatus"""
+        result = derive_processor_section(self.STATS)
+
+        assert result == [{"type": "mpstat", "cpu": "all", "idle": "84.80"}]
+
+    def test_derive_processor_section_missing_data(self):
+        """Test the CPU section is not derived from incomplete data"""
+        assert derive_processor_section([]) is None
+        assert derive_processor_section([{"type": "CPU Usage", "value": "high"}]) is None
+
+    def test_main_economy_skips_detailed_endpoints(self, capsys):
+        """Test economy mode derives sections and skips mpstat and freespace"""
+        with requests_mock.Mocker() as m:
+            matchers = mock_all_endpoints(m, self.STATS)
+            result = main(["-H", "redshift.example.com", "--economy"])
+
+        assert result == 0
+        assert matchers["systemstatusandstatistics/statsandstatus"].call_count == 1
+        assert matchers["systemdevicestats/mpstat"].call_count == 0
+        assert matchers["systemdevicestats/freespace"].call_count == 0
+        assert m.call_count == 5
+
+        output = capsys.readouterr().out
+        memory = section_data(output, "<<<redshift_memory:sep(0)>>>")
+        processor = section_data(output, "<<<redshift_processor:sep(0)>>>")
+        assert memory[0]["free"] == "12426368"
+        assert processor[0]["idle"] == "84.80"
+
+    def test_main_economy_with_details(self, capsys):
+        """Test economy mode still fetches detailed endpoints when configured"""
+        with requests_mock.Mocker() as m:
+            matchers = mock_all_endpoints(m, self.STATS)
+            main(["-H", "redshift.example.com", "--economy", "--economy-per-core", "--economy-swap"])
+
+        assert matchers["systemdevicestats/mpstat"].call_count == 1
+        assert matchers["systemdevicestats/freespace"].call_count == 1
+        assert m.call_count == 7
+
+    def test_main_economy_without_system_stats_section(self, capsys):
+        """Test statsandstatus is fetched but not output when only derived sections are enabled"""
+        with requests_mock.Mocker() as m:
+            mock_all_endpoints(m, self.STATS)
+            main(["-H", "redshift.example.com", "--economy", "--sections", "memory"])
+
+        output = capsys.readouterr().out
+        assert "<<<redshift_memory:sep(0)>>>" in output
+        assert "<<<redshift_system_stats:sep(0)>>>" not in output
+
+
+class TestLoadBackoff:
+    """Tests for load-aware scheduling"""
+
+    BUSY_STATS = [{"type": "CPU Usage", "value": "95.0%"}]
+    IDLE_STATS = [{"type": "CPU Usage", "value": "10.0%"}]
+
+    def test_section_cache_roundtrip(self, tmp_path):
+        """Test cached sections survive a save and load"""
+        cache = SectionCache(tmp_path / "cache.json")
+        cache.set("processor", [{"cpu": "all"}], timestamp=1700000000)
+        cache.save()
+
+        assert SectionCache(tmp_path / "cache.json").get("processor") == (1700000000, [{"cpu": "all"}])
+        assert SectionCache(tmp_path / "cache.json").get("disk") is None
+
+    def test_section_cache_ignores_broken_file(self, tmp_path):
+        """Test a broken cache file is treated as empty"""
+        (tmp_path / "cache.json").write_text("not json")
+
+        assert SectionCache(tmp_path / "cache.json").get("processor") is None
+
+    def test_main_below_threshold_fetches_and_caches(self, capsys, isolated_state_dir):
+        """Test heavy sections are fetched and cached while load is low"""
+        with requests_mock.Mocker() as m:
+            matchers = mock_all_endpoints(m, self.IDLE_STATS)
+            main(["-H", "redshift.example.com", "--backoff-cpu", "90"])
+
+        assert matchers["systemdevicestats/mpstat"].call_count == 1
+        assert matchers["ethernet/ethernetUsage"].call_count == 1
+
+        output = capsys.readouterr().out
+        agent = section_data(output, "<<<redshift_agent:sep(0)>>>")
+        assert agent["backoff"] is False
+        assert agent["cpu_usage"] == 10.0
+        assert agent["cached_sections"] == []
+
+        cache = SectionCache(isolated_state_dir / "redshift.example.com_443_sections.json")
+        assert cache.get("processor")[1] == [{"type": "mpstat", "cpu": "all", "idle": "50.0"}]
+
+    def test_main_under_load_serves_heavy_sections_from_cache(self, capsys, isolated_state_dir):
+        """Test heavy sections come from cache with cached headers while load is high"""
+        cache = SectionCache(isolated_state_dir / "redshift.example.com_443_sections.json")
+        now = int(time.time())
+        cache.set("processor", [{"cpu": "cached"}], timestamp=now - 60)
+        cache.set("hdd_ethernet", {"Ethernet usage": []}, timestamp=now - 60)
+        cache.save()
+
+        with requests_mock.Mocker() as m:
+            matchers = mock_all_endpoints(m, self.BUSY_STATS)
+            main(["-H", "redshift.example.com", "--backoff-cpu", "90", "--backoff-max-age", "600"])
+
+        assert matchers["systemstatusandstatistics/statsandstatus"].call_count == 1
+        assert matchers["systemdevicestats/mpstat"].call_count == 0
+        assert matchers["ethernet/ethernetUsage"].call_count == 0
+        assert matchers["systemdevicestats/freespace"].call_count == 1
+
+        output = capsys.readouterr().out
+        header = f"<<<redshift_processor:sep(0):cached({now - 60},600)>>>"
+        assert section_data(output, header) == [{"cpu": "cached"}]
+        agent = section_data(output, "<<<redshift_agent:sep(0)>>>")
+        assert agent["backoff"] is True
+        assert sorted(agent["cached_sections"]) == ["hdd_ethernet", "processor"]
+
+    def test_main_under_load_refetches_expired_cache(self, capsys, isolated_state_dir):
+        """Test heavy sections are fetched when the cache is too old or missing"""
+        cache = SectionCache(isolated_state_dir / "redshift.example.com_443_sections.json")
+        cache.set("processor", [{"cpu": "cached"}], timestamp=int(time.time()) - 3600)
+        cache.save()
+
+        with requests_mock.Mocker() as m:
+            matchers = mock_all_endpoints(m, self.BUSY_STATS)
+            main(["-H", "redshift.example.com", "--backoff-cpu", "90", "--backoff-max-age", "600"])
+
+        assert matchers["systemdevicestats/mpstat"].call_count == 1
+        assert matchers["ethernet/ethernetUsage"].call_count == 1
+        assert section_data(capsys.readouterr().out, "<<<redshift_agent:sep(0)>>>")["backoff"] is True
+
+    def test_main_under_load_with_economy_skips_only_ethernet(self, capsys, isolated_state_dir):
+        """Test a processor section derived in economy mode is not backed off"""
+        with requests_mock.Mocker() as m:
+            matchers = mock_all_endpoints(m, self.BUSY_STATS + TestEconomyMode.STATS)
+            SectionCache(isolated_state_dir / "redshift.example.com_443_sections.json").save()
+            main(["-H", "redshift.example.com", "--economy", "--backoff-cpu", "90"])
+
+        assert matchers["systemdevicestats/mpstat"].call_count == 0
+        assert matchers["ethernet/ethernetUsage"].call_count == 1
+        assert "<<<redshift_processor:sep(0)>>>" in capsys.readouterr().out
+
+    def test_main_without_backoff_has_no_agent_section(self, capsys):
+        """Test the agent section is only sent with load-aware scheduling"""
+        with requests_mock.Mocker() as m:
+            mock_all_endpoints(m, self.BUSY_STATS)
+            main(["-H", "redshift.example.com"])
+
+        assert "<<<redshift_agent" not in capsys.readouterr().out
+
+
+class TestExporter:
+    """Tests for the OpenMetrics exporter mode"""
+
+    def test_render_openmetrics(self, sample_system_stats_json, sample_hdd_ethernet_json,
+                                sample_processor_json, sample_memory_json, sample_disk_json):
+        """Test section data is rendered with the check plugin metric names"""
+        text = render_openmetrics("uctm1", {
+            "system_stats": sample_system_stats_json,
+            "hdd_ethernet": sample_hdd_ethernet_json,
+            "processor": sample_processor_json,
+            "memory": sample_memory_json,
+            "disk": sample_disk_json,
+            "uptime": {"value": "up 1 day"},
+        })
+        lines = text.splitlines()
+
+        assert lines[-1] == "# EOF"
+        assert 'cpu_percent{device="uctm1",service="System Stats"} 15.2' in lines
+        assert 'fs_used_percent{device="uctm1",service="HDD Total"} 42.3' in lines
+        assert 'cpu_core_util_user_0{device="uctm1",service="CPU Core 0"} 20.5' in lines
+        assert 'mem_total{device="uctm1",service="Memory"} 16561999872' in lines
+        assert 'fs_size{device="uctm1",service="Filesystem /var"} 104857600000' in lines
+        # The Memory service owns the memory metrics, as in the check plugins
+        assert not any(line.startswith("memory_used") for line in lines)
+
+        # Interface counters are counter families with _total samples
+        assert "# TYPE if_in_errors counter" in lines
+        assert 'if_in_errors_total{device="uctm1",service="Interface eth1"} 2' in lines
+
+        # Each metric family is announced once and its samples are contiguous
+        assert lines.count("# TYPE fs_used gauge") == 1
+        fs_used = [i for i, line in enumerate(lines) if line.startswith("fs_used{")]
+        assert fs_used == list(range(fs_used[0], fs_used[0] + len(fs_used)))
+
+    def test_render_openmetrics_escapes_labels(self):
+        """Test label values are escaped"""
+        text = render_openmetrics('dev"1', {"disk": [{"mountedOn": "/a\\b", "blocks_1k": "1", "used": "1"}]})
+
+        assert 'fs_used{device="dev\\"1",service="Filesystem /a\\\\b"} 1024' in text
+
+    def test_render_openmetrics_system_stats_memory(self, sample_system_stats_json):
+        """Test System Stats carries the memory metrics without a memory section"""
+        lines = render_openmetrics("uctm1", {"system_stats": sample_system_stats_json}).splitlines()
+
+        assert 'memory_used{device="uctm1",service="System Stats"} 3837399040' in lines
+        assert "# TYPE memory_used_percent gauge" in lines
+
+    def test_render_openmetrics_skips_broken_section(self, capsys):
+        """Test a section that cannot be converted is skipped"""
+        text = render_openmetrics("uctm1", {"processor": "garbage", "memory": [{"type": "Mem:", "total": "0"}]})
+
+        assert text == "# EOF\n"
+
+    def test_metrics_source_serves_fresh_cache(self, isolated_state_dir):
+        """Test the exporter does not poll while the shared cache is fresh"""
+        cache = SectionCache(isolated_state_dir / "redshift.example.com_443_sections.json")
+        cache.set("uptime", {"value": "up 1 day"})
+        cache.save()
+
+        with requests_mock.Mocker() as m:
+            sections = MetricsSource(parse_arguments(["-H", "redshift.example.com", "--exporter"])).sections()
+
+        assert m.call_count == 0
+        assert sections == {"uptime": {"value": "up 1 day"}}
+
+    def test_metrics_source_polls_stale_cache(self, isolated_state_dir):
+        """Test the exporter polls the device and refreshes the cache when it is stale"""
+        cache = SectionCache(isolated_state_dir / "redshift.example.com_443_sections.json")
+        cache.set("uptime", {"value": "old"}, timestamp=int(time.time()) - 3600)
+        cache.save()
+
+        with requests_mock.Mocker() as m:
+            mock_all_endpoints(m, [{"type": "CPU Usage", "value": "15%"}])
+            sections = MetricsSource(parse_arguments(["-H", "redshift.example.com", "--exporter"])).sections()
+
+        assert m.call_count == 1
+        assert sections["uptime"] == {"value": "up 1 day"}
+        cache = SectionCache(isolated_state_dir / "redshift.example.com_443_sections.json")
+        assert cache.get("uptime")[1] == {"value": "up 1 day"}
+
+    def test_metrics_source_respects_backoff(self, isolated_state_dir):
+        """Test stale sections are polled alone and sections cached while backing off are not"""
+        cache = SectionCache(isolated_state_dir / "redshift.example.com_443_sections.json")
+        old = int(time.time()) - 600
+        cache.set("system_stats", [{"type": "CPU Usage", "value": "old"}], timestamp=old)
+        cache.set("processor", [{"cpu": "all", "idle": "5.0"}], timestamp=old, max_age=900)
+        cache.set("uptime", {"value": "fresh"})
+        cache.save()
+
+        with requests_mock.Mocker() as m:
+            matchers = mock_all_endpoints(m, [{"type": "CPU Usage", "value": "95%"}])
+            sections = MetricsSource(parse_arguments(["-H", "redshift.example.com", "--exporter"])).sections()
+
+        assert m.call_count == 1
+        assert matchers["systemstatusandstatistics/statsandstatus"].call_count == 1
+        assert sections == {
+            "system_stats": [{"type": "CPU Usage", "value": "95%"}],
+            "processor": [{"cpu": "all", "idle": "5.0"}],
+            "uptime": {"value": "fresh"},
+        }
+
+    def test_backoff_marks_cached_sections_valid(self, isolated_state_dir):
+        """Test sections served while backing off stay valid for the back off maximum age"""
+        cache_file = isolated_state_dir / "redshift.example.com_443_sections.json"
+        cache = SectionCache(cache_file)
+        cache.set("processor", [{"cpu": "all", "idle": "5.0"}], timestamp=int(time.time()) - 600)
+        cache.save()
+
+        with requests_mock.Mocker() as m:
+            mock_all_endpoints(m, [{"type": "CPU Usage", "value": "95%"}])
+            main(["-H", "redshift.example.com", "--backoff-cpu", "90", "--backoff-max-age", "900"])
+
+        cache = SectionCache(cache_file)
+        assert cache.is_valid("processor", 120)
+        assert not cache.is_valid("uptime", 0)
+
+    def test_main_share_cache_feeds_exporter(self, capsys, isolated_state_dir):
+        """Test an agent run with --share-cache lets the exporter answer without polling"""
+        with requests_mock.Mocker() as m:
+            mock_all_endpoints(m, [{"type": "CPU Usage", "value": "15%"}])
+            main(["-H", "redshift.example.com", "--share-cache"])
+
+        assert "<<<redshift_agent" not in capsys.readouterr().out
+
+        with requests_mock.Mocker() as m:
+            sections = MetricsSource(parse_arguments(["-H", "redshift.example.com", "--exporter"])).sections()
+
+        assert m.call_count == 0
+        assert sections["system_stats"] == [{"type": "CPU Usage", "value": "15%"}]
+
+    def test_exporter_http_server(self, isolated_state_dir):
+        """Test /metrics is served over HTTP and other paths are not found"""
+        cache = SectionCache(isolated_state_dir / "redshift.example.com_443_sections.json")
+        cache.set("system_stats", [{"type": "CPU Usage", "value": "15%"}])
+        cache.save()
+
+        server = make_exporter_server(parse_arguments([
+            "-H", "redshift.example.com", "--exporter", "--listen-port", "0",
+        ]))
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+        try:
+            with urllib.request.urlopen(f"{base}/metrics") as response:
+                content_type = response.headers["Content-Type"]
+                body = response.read().decode("utf-8")
+            with pytest.raises(urllib.error.HTTPError) as excinfo:
+                urllib.request.urlopen(f"{base}/other")
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        assert content_type.startswith("application/openmetrics-text")
+        assert 'cpu_percent{device="redshift.example.com",service="System Stats"} 15.0' in body
+        assert excinfo.value.code == 404
+
+
+class TestRequestTiming:
+    """Tests for the phase-level request timing"""
+
+    def test_timing_against_tls_server(self, stub_uctm):
+        """Test connection phases are recorded on a new connection only"""
+        api = RedshiftAPI(host="localhost", port=stub_uctm.port, timing=True)
+
+        assert api.get_uptime() == {"value": "up 1 day"}
+        assert api.get_chassis_info()["serialNumber"] == "STUB0001"
+
+        first, second = api.timings
+        assert first["endpoint"] == "systemdevicestats/uptime"
+        assert first["status"] == 200
+        assert first["new_connection"] is True
+        assert first["connect"] > 0
+        assert first["tls"] > 0
+        assert first["total"] >= first["dns"] + first["connect"] + first["tls"]
+        assert second["new_connection"] is False
+        assert second["dns"] == second["connect"] == second["tls"] == 0
+
+    def test_no_timing_by_default(self, stub_uctm):
+        """Test nothing is recorded unless timing is enabled"""
+        api = RedshiftAPI(host="127.0.0.1", port=stub_uctm.port)
+
+        assert api.get_uptime() == {"value": "up 1 day"}
+        assert api.timings == []
+
+    def test_timing_of_failed_request(self):
+        """Test HTTP errors are recorded with their status"""
+        api = RedshiftAPI(host="redshift.example.com", timing=True)
+
+        with requests_mock.Mocker() as m:
+            m.post(STATS_URL, status_code=500)
+            assert api.get_system_stats() is None
+
+        assert api.timings[0]["status"] == 500
+
+    def test_main_writes_timing_file_and_debug(self, capsys, tmp_path):
+        """Test --timing-file appends JSON Lines and --debug prints the breakdown"""
+        timing_file = tmp_path / "timing.jsonl"
+
+        with requests_mock.Mocker() as m:
+            mock_all_endpoints(m, [{"type": "CPU Usage", "value": "15%"}])
+            for _run in range(2):
+                main([
+                    "-H", "redshift.example.com", "--sections", "system_stats,uptime",
+                    "--timing-file", str(timing_file), "--debug",
+                ])
+
+        records = [json.loads(line) for line in timing_file.read_text().splitlines()]
+        assert len(records) == 4
+        assert records[0]["device"] == "redshift.example.com"
+        assert records[0]["endpoint"] == "systemstatusandstatistics/statsandstatus"
+        assert {"dns", "connect", "tls", "ttfb", "transfer", "total"} <= set(records[0])
+
+        stderr = capsys.readouterr().err
+        assert "Timing systemdevicestats/uptime: dns=" in stderr
+
+
+def span_attributes(span):
+    """Return the attributes of an OTLP JSON span as a plain dictionary"""
+    return {item["key"]: next(iter(item["value"].values())) for item in span["attributes"]}
+
+
+class TestTracing:
+    """Tests for the OTLP JSON tracing of agent runs"""
+
+    def test_main_writes_trace(self, capsys, tmp_path):
+        """Test one trace with fetch, repair and output spans is appended per run"""
+        trace_file = tmp_path / "traces.jsonl"
+
+        with requests_mock.Mocker() as m:
+            mock_all_endpoints(m, [{"type": "CPU Usage", "value": "15%"}])
+            m.post("https://redshift.example.com:443/rs/rest/systemdevicestats/mpstat",
+                   text='[,{"type": "mpstat", "cpu": "all", "idle": "50.0"}]')
+            m.post("https://redshift.example.com:443/rs/rest/systemdevicestats/uptime", status_code=500)
+            main(["-H", "redshift.example.com", "--sections", "system_stats,processor,uptime",
+                  "--trace-file", str(trace_file)])
+        output = capsys.readouterr().out
+
+        export = json.loads(trace_file.read_text())
+        resource_spans = export["resourceSpans"][0]
+        assert {"key": "service.name", "value": {"stringValue": "agent_redshift"}} in (
+            resource_spans["resource"]["attributes"]
+        )
+        spans = {span["name"]: span for span in resource_spans["scopeSpans"][0]["spans"]}
+        root = spans["agent run"]
+        assert "parentSpanId" not in root
+        assert len({span["traceId"] for span in spans.values()}) == 1
+        assert span_attributes(root) == {
+            "redshift.device": "redshift.example.com", "redshift.port": "443", "redshift.sections": "2",
+        }
+
+        fetch = spans["fetch systemdevicestats/mpstat"]
+        assert fetch["parentSpanId"] == root["spanId"]
+        assert fetch["kind"] == agent_redshift.SPAN_KIND_CLIENT
+        assert span_attributes(fetch)["redshift.section"] == "processor"
+        assert span_attributes(fetch)["http.response.status_code"] == "200"
+        assert spans["repair json"]["parentSpanId"] == fetch["spanId"]
+        assert int(fetch["endTimeUnixNano"]) >= int(spans["repair json"]["endTimeUnixNano"])
+
+        failed = spans["fetch systemdevicestats/uptime"]
+        assert failed["status"]["code"] == agent_redshift.SPAN_STATUS_ERROR
+        assert "500" in failed["status"]["message"]
+
+        writes = [span for span in resource_spans["scopeSpans"][0]["spans"] if span["name"] == "write section"]
+        assert [span_attributes(span)["redshift.section"] for span in writes] == ["system_stats", "processor"]
+        assert output.count("<<<") == 2
+
+    def test_exception_marks_span_as_error(self):
+        """Test spans nest and record exceptions raised inside them"""
+        tracer = Tracer("uctm1")
+
+        with pytest.raises(ValueError):
+            with tracer.span("outer"):
+                with tracer.span("inner", count=3, ratio=0.5, flag=True):
+                    raise ValueError("broken")
+
+        inner, outer = tracer.spans
+        assert inner["parentSpanId"] == outer["spanId"]
+        assert inner["status"] == {"code": agent_redshift.SPAN_STATUS_ERROR, "message": "broken"}
+        assert span_attributes(inner) == {
+            "redshift.device": "uctm1", "count": "3", "ratio": 0.5, "flag": True,
+        }
+
+    def test_explicit_parent_across_threads(self):
+        """Test a span on another thread nests under the parent passed to it"""
+        tracer = Tracer("uctm-fleet")
+
+        with tracer.span("outer"):
+            parent = tracer.current_span_id()
+            worker = threading.Thread(target=self._poll, args=(tracer, parent))
+            worker.start()
+            worker.join()
+        assert tracer.current_span_id() is None
+
+        inner, device, outer = tracer.spans
+        assert device["parentSpanId"] == outer["spanId"]
+        assert inner["parentSpanId"] == device["spanId"]
+        assert span_attributes(inner)["redshift.device"] == "uctm1"
+
+    @staticmethod
+    def _poll(tracer, parent):
+        with tracer.span("poll device", parent=parent, **{"redshift.device": "uctm1"}):
+            with tracer.span("fetch"):
+                pass
+
+    def test_hedged_attempts_keep_parent(self):
+        """Test the request attempts on hedging threads nest under the fetch span"""
+        api = RedshiftAPI(host="redshift.example.com", hedge=True, hedge_delay=0.05)
+        api.tracer = Tracer("redshift.example.com")
+        TestHedging._stall_first_post(api, 0.2)
+
+        api.get_system_stats()
+        time.sleep(0.3)
+
+        fetch = next(span for span in api.tracer.spans if span["name"].startswith("fetch "))
+        attempts = [span for span in api.tracer.spans if span["name"] == "post"]
+        assert sorted(span_attributes(span)["redshift.hedged"] for span in attempts) == [False, True]
+        assert {span["parentSpanId"] for span in attempts} == {fetch["spanId"]}
+
+    def test_fleet_trace(self, capsys, stub_uctm, tmp_path):
+        """Test appliances polled in shard processes nest under the fleet run span"""
+        devices_file = tmp_path / "devices.json"
+        devices_file.write_text(json.dumps([
+            {"name": f"uctm-{index}", "host": "127.0.0.1", "port": stub_uctm.port} for index in range(2)
+        ]))
+        trace_file = tmp_path / "traces.jsonl"
+
+        main(["--devices", str(devices_file), "--sections", "uptime", "--fleet-shards", "2",
+              "--trace-file", str(trace_file)])
+        capsys.readouterr()
+
+        spans = json.loads(trace_file.read_text())["resourceSpans"][0]["scopeSpans"][0]["spans"]
+        root = next(span for span in spans if span["name"] == "fleet run")
+        polls = [span for span in spans if span["name"] == "poll device"]
+        assert sorted(span_attributes(span)["redshift.device"] for span in polls) == ["uctm-0", "uctm-1"]
+        assert {span["parentSpanId"] for span in polls} == {root["spanId"]}
+        assert len({span["traceId"] for span in spans}) == 1
+        fetches = [span for span in spans if span["name"].startswith("fetch ")]
+        assert {span["parentSpanId"] for span in fetches} == {span["spanId"] for span in polls}
+        assert {span_attributes(span)["redshift.device"] for span in fetches} == {"uctm-0", "uctm-1"}
+
+    def test_unwritable_trace_file(self, capsys, tmp_path):
+        """Test a trace file that cannot be written is reported, not raised"""
+        blocker = tmp_path / "blocker"
+        blocker.write_text("")
+        tracer = Tracer("uctm1")
+        with tracer.span("run"):
+            pass
+
+        tracer.write(blocker / "traces.jsonl")
+
+        assert "Could not write trace file" in capsys.readouterr().err
+
+
+class TestProfiling:
+    """Tests for the built-in profiling switch"""
+
+    def test_step_stats_record_parse_and_repair(self):
+        """Test parse and repair steps are accounted per endpoint while profiling"""
+        api = RedshiftAPI(host="redshift.example.com")
+        api.step_stats = {}
+
+        assert api._decode("good/endpoint", '{"a": 1}') == {"a": 1}
+        assert api._decode("bad/endpoint", '[,{"a": 1},]') == [{"a": 1}]
+
+        assert set(api.step_stats["good/endpoint"]) == {"parse"}
+        assert set(api.step_stats["bad/endpoint"]) == {"parse", "repair"}
+        assert api.step_stats["bad/endpoint"]["repair"]["calls"] == 1
+
+    def test_steps_keep_run_wide_peak(self):
+        """Test accounting a step does not reset the peak of the whole run"""
+        api = RedshiftAPI(host="redshift.example.com")
+        api.step_stats = {}
+        tracemalloc.start()
+        try:
+            block = bytearray(8 * 1024 * 1024)
+            del block
+            api._decode("good/endpoint", json.dumps(list(range(10000))))
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        assert peak >= 8 * 1024 * 1024
+        assert 0 < api.step_stats["good/endpoint"]["parse"]["peak_alloc"] < 8 * 1024 * 1024
+
+    def test_no_step_stats_without_profiling(self):
+        """Test nothing is accounted unless profiling"""
+        api = RedshiftAPI(host="redshift.example.com")
+
+        assert api._decode("good/endpoint", '{"a": 1}') == {"a": 1}
+        assert api.step_stats is None
+
+    def test_main_cpu_profile(self, capsys, tmp_path):
+        """Test --profile cpu writes a pstats file"""
+        profile_file = tmp_path / "agent.pstats"
+
+        with requests_mock.Mocker() as m:
+            mock_all_endpoints(m, [{"type": "CPU Usage", "value": "15%"}])
+            result = main(["-H", "redshift.example.com", "--profile", "cpu",
+                           "--profile-file", str(profile_file)])
+
+        assert result == 0
+        stats = pstats.Stats(str(profile_file))
+        assert any(func[2] == "collect_sections" for func in stats.stats)
+
+        captured = capsys.readouterr()
+        assert "<<<redshift_uptime:sep(0)>>>" in captured.out
+        assert "systemdevicestats/uptime" in captured.err
+        assert f"Profile written to {profile_file}" in captured.err
+
+    def test_main_mem_profile(self, capsys, tmp_path):
+        """Test --profile mem writes the top allocation sites and the step breakdown"""
+        profile_file = tmp_path / "agent.txt"
+
+        with requests_mock.Mocker() as m:
+            mock_all_endpoints(m, [{"type": "CPU Usage", "value": "15%"}])
+            m.post("https://redshift.example.com:443/rs/rest/systemdevicestats/mpstat",
+                   text='[,{"type": "mpstat", "cpu": "all", "idle": "50.0"},]')
+            result = main(["-H", "redshift.example.com", "--profile", "mem",
+                           "--profile-file", str(profile_file)])
+
+        assert result == 0
+        report = profile_file.read_text()
+        assert "Top 25 allocation sites:" in report
+        assert "Parse and repair steps:" in report
+        repair_rows = [line.split()[0] for line in report.splitlines() if line.split()[1:2] == ["repair"]]
+        assert repair_rows == ["systemdevicestats/mpstat"]
+
+
+class TestRecordReplay:
+    """Tests for recording and replaying raw API responses"""
+
+    def test_recording_roundtrip(self, tmp_path):
+        """Test a written archive loads back by endpoint"""
+        records = [
+            {"endpoint": "a/b", "status": 200, "elapsed": 0.1, "body": "[,1]"},
+            {"endpoint": "c/d", "status": 500, "elapsed": 0.2, "error": "500 Server Error"},
+        ]
+        path = write_recording(tmp_path, "uctm1", 443, records)
+
+        assert path.name.startswith("uctm1_443_") and path.name.endswith(".jsonl.gz")
+        with gzip.open(path, "rt") as f:
+            assert json.loads(f.readline())["device"] == "uctm1"
+        assert load_recording(path) == {"a/b": records[0], "c/d": records[1]}
+        assert find_recording(tmp_path) == path
+        assert find_recording(path) == path
+
+    def test_recordings_in_the_same_second_are_kept(self, monkeypatch, tmp_path):
+        """Test runs at the same time write separate archives"""
+        monkeypatch.setattr(agent_redshift.time, "time", lambda: 1700000000.25)
+        paths = [
+            write_recording(tmp_path, "uctm1", 443, [{"endpoint": "a/b", "status": 200, "body": str(run)}])
+            for run in range(3)
+        ]
+
+        assert [path.name for path in paths] == [
+            "uctm1_443_20231114-221320.250.jsonl.gz",
+            "uctm1_443_20231114-221320.250-1.jsonl.gz",
+            "uctm1_443_20231114-221320.250-2.jsonl.gz",
+        ]
+        assert [load_recording(path)["a/b"]["body"] for path in paths] == ["0", "1", "2"]
+
+    def test_load_recording_rejects_other_files(self, tmp_path):
+        """Test archives without the header are rejected"""
+        path = tmp_path / "other.jsonl.gz"
+        with gzip.open(path, "wt") as f:
+            f.write('{"endpoint": "a/b"}\n')
+
+        with pytest.raises(ValueError):
+            load_recording(path)
+
+    def test_record_then_replay(self, capsys, tmp_path):
+        """Test a replay produces the same agent output without contacting the device"""
+        with requests_mock.Mocker() as m:
+            mock_all_endpoints(m, [{"type": "CPU Usage", "value": "15%"}])
+            m.post("https://redshift.example.com:443/rs/rest/systemdevicestats/mpstat",
+                   text='[,{"type": "mpstat", "cpu": "all", "idle": "50.0"},]')
+            m.post("https://redshift.example.com:443/rs/rest/systemdevicestats/uptime", status_code=500)
+            main(["-H", "redshift.example.com", "--record", str(tmp_path)])
+        recorded_output = capsys.readouterr().out
+
+        records = load_recording(find_recording(tmp_path))
+        assert records["systemdevicestats/mpstat"]["body"].startswith("[,")
+        assert records["systemdevicestats/uptime"]["status"] == 500
+        assert "error" in records["systemdevicestats/uptime"]
+
+        with requests_mock.Mocker() as m:
+            main(["-H", "redshift.example.com", "--replay", str(tmp_path)])
+            assert m.call_count == 0
+        replayed_output = capsys.readouterr().out
+
+        assert replayed_output == recorded_output
+        assert "<<<redshift_uptime" not in replayed_output
+
+    def test_replay_leaves_state_untouched(self, capsys, isolated_state_dir, tmp_path):
+        """Test a replay neither reads nor writes the state files of the device"""
+        write_recording(tmp_path / "recordings", "redshift.example.com", 443, [
+            {"endpoint": "systemdevicestats/uptime", "status": 200, "elapsed": 0.2, "body": '{"value": "up"}'},
+        ])
+        isolated_state_dir.mkdir(parents=True)
+        sections_file = isolated_state_dir / "redshift.example.com_443_sections.json"
+        sections_file.write_text(json.dumps({"uptime": {"timestamp": time.time(), "data": {"value": "live"}}}))
+
+        main(["-H", "redshift.example.com", "--sections", "uptime", "--replay", str(tmp_path / "recordings"),
+              "--hedge", "--share-cache", "--backoff-cpu", "0"])
+
+        assert '{"value": "up"}' in capsys.readouterr().out
+        assert [path.name for path in isolated_state_dir.iterdir()] == [sections_file.name]
+        assert json.loads(sections_file.read_text())["uptime"]["data"] == {"value": "live"}
+
+    def test_replay_with_original_latency(self, capsys, tmp_path):
+        """Test recorded latencies are reproduced on request"""
+        write_recording(tmp_path, "redshift.example.com", 443, [
+            {"endpoint": "systemdevicestats/uptime", "status": 200, "elapsed": 0.2, "body": '{"value": "up"}'},
+        ])
+
+        start = time.monotonic()
+        main(["-H", "redshift.example.com", "--sections", "uptime", "--replay", str(tmp_path),
+              "--replay-latency", "original"])
+        elapsed = time.monotonic() - start
+
+        assert elapsed >= 0.2
+        assert '{"value": "up"}' in capsys.readouterr().out
+
+    def test_replay_missing_recording(self, capsys, tmp_path):
+        """Test a replay without an archive outputs no sections"""
+        main(["-H", "redshift.example.com", "--replay", str(tmp_path)])
+
+        captured = capsys.readouterr()
+        assert captured.out == ""
+        assert "No recording found" in captured.err
+
+
+def certificate_fingerprint(certfile):
+    """Return the SHA-256 fingerprint of the certificate in a PEM file"""
+    pem = certfile.read_text()
+    start = pem.index("-----BEGIN CERTIFICATE-----")
+    end = pem.index("-----END CERTIFICATE-----") + len("-----END CERTIFICATE-----")
+    return hashlib.sha256(ssl.PEM_cert_to_DER_cert(pem[start:end])).hexdigest()
+
+
+class TestTLSContext:
+    """Tests for the shared TLS context, CA pinning and certificate fingerprints"""
+
+    def test_context_shared_per_trust_configuration(self, stub_certfile):
+        """Test clients with the same trust configuration share one context"""
+        unverified = RedshiftAPI(host="uctm1").ssl_context
+        assert RedshiftAPI(host="uctm2", port=8443).ssl_context is unverified
+        assert unverified.verify_mode == ssl.CERT_NONE
+
+        pinned = RedshiftAPI(host="uctm1", ca_file=str(stub_certfile))
+        assert pinned.verify_ssl is True
+        assert pinned.ssl_context is shared_ssl_context(True, str(stub_certfile))
+        assert pinned.ssl_context is not unverified
+        assert pinned.ssl_context.verify_mode == ssl.CERT_REQUIRED
+
+    def test_pinned_ca_file(self, stub_uctm, stub_certfile):
+        """Test the pinned CA verifies the appliance and is the only CA loaded"""
+        api = RedshiftAPI(host="127.0.0.1", port=stub_uctm.port, ca_file=str(stub_certfile))
+
+        assert api.get_uptime() == {"value": "up 1 day"}
+        assert RedshiftAPI(host="127.0.0.1", port=stub_uctm.port, ca_file=str(stub_certfile)).get_uptime()
+        assert api.ssl_context.cert_store_stats()["x509_ca"] == 1
+        assert RedshiftAPI(host="127.0.0.1", port=stub_uctm.port, verify_ssl=True).get_uptime() is None
+
+    def test_certificate_fingerprint(self, stub_uctm, stub_certfile):
+        """Test only the certificate with the pinned fingerprint is accepted"""
+        fingerprint = certificate_fingerprint(stub_certfile)
+        with_colons = ":".join(fingerprint[i:i + 2] for i in range(0, 64, 2)).upper()
+
+        api = RedshiftAPI(host="127.0.0.1", port=stub_uctm.port, verify_ssl=True, fingerprint=with_colons)
+        assert api.verify_ssl is False
+        assert api.get_uptime() == {"value": "up 1 day"}
+
+        wrong = RedshiftAPI(host="127.0.0.1", port=stub_uctm.port, fingerprint="0" * 64)
+        assert wrong.get_uptime() is None
+
+        with pytest.raises(ValueError):
+            RedshiftAPI(host="127.0.0.1", fingerprint="not-a-fingerprint")
+
+    def test_session_resumption(self, stub_uctm):
+        """Test new connections to the same appliance resume the TLS session"""
+        context = RedshiftAPI(host="127.0.0.1").ssl_context
+        handshakes, resumed = context.handshakes, context.resumed
+
+        for _client in range(3):
+            assert RedshiftAPI(host="127.0.0.1", port=stub_uctm.port).get_uptime() == {"value": "up 1 day"}
+
+        assert context.handshakes - handshakes == 3
+        assert context.resumed - resumed == 2
+
+    def test_main_with_fingerprint(self, capsys, stub_uctm, stub_certfile):
+        """Test --cert-fingerprint is used by the agent"""
+        main([
+            "-H", "127.0.0.1", "-p", str(stub_uctm.port), "--sections", "uptime",
+            "--cert-fingerprint", certificate_fingerprint(stub_certfile),
+        ])
+
+        assert "<<<redshift_uptime:sep(0)>>>" in capsys.readouterr().out
+
+
+class TestProbe:
+    """Tests for the liveness probe mode"""
+
+    def test_probe_against_tls_server(self, capsys, stub_uctm):
+        """Test --probe sends one request and outputs only the probe section"""
+        main(["-H", "127.0.0.1", "-p", str(stub_uctm.port), "--probe"])
+
+        output = capsys.readouterr().out
+        probe = section_data(output, "<<<redshift_probe:sep(0)>>>")
+        assert stub_uctm.requests == ["/rs/rest/systemdevicestats/uptime"]
+        assert probe["status"] == "ok"
+        assert probe["http_status"] == 200
+        assert probe["timeout"] == 2.0
+        assert 0 < probe["rtt"] < 2.0
+        assert output.count("<<<") == 1
+
+    def test_probe_timeout(self, stub_uctm):
+        """Test a slow API is reported as a timeout instead of raising"""
+        stub_uctm.delay = 1.0
+        api = RedshiftAPI(host="127.0.0.1", port=stub_uctm.port, timeout=0.2)
+
+        probe = api.probe()
+
+        assert probe["status"] == "timeout"
+        assert probe["timeout"] == 0.2
+        assert probe["rtt"] < 1.0
+
+    def test_probe_http_error(self):
+        """Test HTTP errors are reported with their status"""
+        api = RedshiftAPI(host="redshift.example.com")
+
+        with requests_mock.Mocker() as m:
+            m.post("https://redshift.example.com:443/rs/rest/systemdevicestats/uptime", status_code=503)
+            probe = api.probe()
+
+        assert probe["status"] == "error"
+        assert probe["http_status"] == 503
+        assert "503" in probe["error"]
+
+    def test_probe_connection_error(self):
+        """Test unreachable devices are reported as errors"""
+        api = RedshiftAPI(host="redshift.example.com")
+
+        with requests_mock.Mocker() as m:
+            m.post("https://redshift.example.com:443/rs/rest/systemdevicestats/uptime",
+                   exc=requests.exceptions.ConnectionError("refused"))
+            probe = api.probe()
+
+        assert probe["status"] == "error"
+        assert "http_status" not in probe
+        assert probe["error"] == "refused"
+
+
+class TestLoadTest:
+    """Tests for the load test mode"""
+
+    def test_load_test_against_tls_server(self, capsys, stub_uctm, tmp_path):
+        """Test the ramp runs every step and recommends a concurrency"""
+        report_file = tmp_path / "report.json"
+
+        result = main([
+            "-H", "127.0.0.1", "-p", str(stub_uctm.port), "--sections", "uptime,chassis",
+            "--load-test", "--load-test-steps", "1,2,4", "--load-test-requests", "3",
+            "--load-test-report", str(report_file),
+        ])
+
+        assert result == 0
+        report = json.loads(report_file.read_text())
+        assert report["endpoints"] == ["systemdevicestats/chassisInfo", "systemdevicestats/uptime"]
+        assert [step["concurrency"] for step in report["steps"]] == [1, 2, 4]
+        assert [step["requests"] for step in report["steps"]] == [3, 6, 12]
+        assert len(stub_uctm.requests) == 21
+        assert all(step["healthy"] and step["errors"] == 0 for step in report["steps"])
+        assert report["recommendation"]["max_concurrency"] in (1, 2, 4)
+        assert report["recommendation"]["min_interval"] >= 1
+
+        output = capsys.readouterr().out
+        assert "Recommended maximum concurrency:" in output
+        assert "<<<" not in output
+
+    def test_load_test_stops_at_overload(self, capsys, stub_uctm):
+        """Test the ramp stops at the first step over the error limit"""
+        del stub_uctm.responses["systemdevicestats/chassisInfo"]
+
+        result = main([
+            "-H", "127.0.0.1", "-p", str(stub_uctm.port), "--sections", "uptime,chassis",
+            "--load-test", "--load-test-steps", "1,2", "--load-test-requests", "2",
+        ])
+
+        assert result == 1
+        output = capsys.readouterr().out
+        assert "50.00" in output
+        assert "overload" in output
+        assert len(stub_uctm.requests) == 2
+
+    def test_recommend_load_at_the_knee(self):
+        """Test the lowest concurrency close to the best throughput is recommended"""
+        steps = [
+            {"concurrency": 1, "throughput": 10.0, "p95": 0.1, "healthy": True},
+            {"concurrency": 2, "throughput": 19.0, "p95": 0.11, "healthy": True},
+            {"concurrency": 4, "throughput": 20.0, "p95": 0.2, "healthy": True},
+            {"concurrency": 8, "throughput": 12.0, "p95": 3.0, "healthy": False},
+        ]
+
+        recommendation = recommend_load(steps, 7)
+
+        assert recommendation["max_concurrency"] == 2
+        # 7 requests at 10% of 19 requests per second
+        assert recommendation["min_interval"] == 4
+        assert recommend_load(steps[3:], 7)["max_concurrency"] is None
+
+
+class TestSubnetDiscovery:
+    """Tests for the subnet discovery"""
+
+    def test_discover_against_tls_server(self, capsys, stub_uctm):
+        """Test only the address with an appliance is reported"""
+        main(["--discover", "127.0.0.0/30", "-p", str(stub_uctm.port), "--discover-format", "json"])
+
+        devices = json.loads(capsys.readouterr().out)
+        assert devices == [
+            {"name": "uctm-stub0001", "host": "127.0.0.1", "port": stub_uctm.port, "serial": "STUB0001"},
+        ]
+        assert stub_uctm.requests == ["/rs/rest/systemdevicestats/chassisInfo"]
+
+    def test_discover_csv_and_table(self, capsys, stub_uctm):
+        """Test the CheckMK host import and table formats"""
+        main(["--discover", "127.0.0.1/32", "-p", str(stub_uctm.port), "--discover-format", "csv"])
+        assert capsys.readouterr().out.splitlines() == [
+            "host_name,ipaddress,alias",
+            "uctm-stub0001,127.0.0.1,Stub Inc. STUB0001",
+        ]
+
+        main(["--discover", "127.0.0.1/32", "-p", str(stub_uctm.port)])
+        table = capsys.readouterr().out.splitlines()
+        assert table[0].startswith("Address")
+        assert "STUB0001" in table[1]
+
+    def test_discover_skips_other_servers(self, capsys, stub_uctm):
+        """Test HTTPS servers without the endpoint and silent listeners are skipped"""
+        del stub_uctm.responses["systemdevicestats/chassisInfo"]
+        main(["--discover", "127.0.0.1", "-p", str(stub_uctm.port), "--discover-format", "json"])
+        assert json.loads(capsys.readouterr().out) == []
+
+        with socket.socket() as listener:
+            listener.bind(("127.0.0.1", 0))
+            listener.listen()
+            start = time.monotonic()
+            main([
+                "--discover", "127.0.0.1", "-p", str(listener.getsockname()[1]),
+                "--discover-timeout", "0.2", "--discover-format", "json",
+            ])
+            assert time.monotonic() - start < 2
+        assert json.loads(capsys.readouterr().out) == []
+
+    def test_read_chunked_response(self):
+        """Test chunked bodies are reassembled"""
+        async def read():
+            reader = asyncio.StreamReader()
+            reader.feed_data(
+                b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n"
+                b"6\r\n[,{\"a\"\r\n5\r\n: 1}]\r\n0\r\n\r\n"
+            )
+            reader.feed_eof()
+            return await read_http_response(reader)
+
+        assert asyncio.run(read()) == (200, b'[,{"a": 1}]')
+
+    def test_parse_discover_arguments(self, capsys):
+        """Test discovery needs no host and rejects invalid networks with a usage error"""
+        args = parse_arguments(["--discover", "10.1.0.0/30, 192.168.1.7/24,"])
+
+        assert args.host is None
+        assert args.discover == ["10.1.0.0/30", "192.168.1.0/24"]
+        for networks in ("10.0.0.0/33", "uctm.example.com", ","):
+            with pytest.raises(SystemExit) as excinfo:
+                parse_arguments(["--discover", networks])
+            assert excinfo.value.code == 2
+            assert "argument --discover" in capsys.readouterr().err
+
+    def test_discovered_host_name(self):
+        """Test host names are derived from the serial or the address"""
+        assert discovered_host_name("10.0.0.1", "AB 12/3") == "uctm-ab-12-3"
+        assert discovered_host_name("10.0.0.1", "") == "uctm-10-0-0-1"
+
+
+class TestAsyncRedshiftAPI:
+    """Tests for the asynchronous API client"""
+
+    def test_endpoints_share_connections(self, stub_uctm):
+        """Test concurrent requests are answered and reuse the open connections"""
+        stub_uctm.responses["systemdevicestats/ifconfig/eth0"] = {"Iface": "eth0"}
+
+        async def fetch():
+            async with AsyncRedshiftAPI(host="127.0.0.1", port=stub_uctm.port, max_connections=2) as api:
+                results = await asyncio.gather(
+                    api.get_system_stats(), api.get_hdd_ethernet_usage(), api.get_chassis_info(),
+                    api.get_processor_stats(), api.get_free_memory(), api.get_disk_space(),
+                    api.get_uptime(), api.get_ifconfig("eth0"),
+                )
+                results.append(await api.get_uptime())
+                return results, api.connections_opened
+
+        results, connections = asyncio.run(fetch())
+
+        assert results[2] == {"manufacturer": "Stub Inc.", "serialNumber": "STUB0001"}
+        assert results[6] == results[8] == {"value": "up 1 day"}
+        assert results[7] == {"Iface": "eth0"}
+        assert None not in results
+        assert len(stub_uctm.requests) == 9
+        assert connections == 2
+
+    def test_per_call_timeout_and_errors(self, capsys, stub_uctm):
+        """Test a slow call times out alone and HTTP errors return None"""
+        async def fetch():
+            async with AsyncRedshiftAPI(host="127.0.0.1", port=stub_uctm.port, timeout=5) as api:
+                assert await api.get_ifconfig("eth9") is None
+                stub_uctm.delay = 0.5
+                start = time.monotonic()
+                assert await api.get_uptime(timeout=0.1) is None
+                assert time.monotonic() - start < 0.4
+                return await api.get_uptime()
+
+        assert asyncio.run(fetch()) == {"value": "up 1 day"}
+        assert "ifconfig/eth9: HTTP status 404" in capsys.readouterr().err
+
+    def test_certificate_fingerprint(self, stub_uctm, stub_certfile):
+        """Test the pinned certificate fingerprint is enforced"""
+        async def fetch(fingerprint):
+            async with AsyncRedshiftAPI(host="127.0.0.1", port=stub_uctm.port, fingerprint=fingerprint) as api:
+                return await api.get_uptime()
+
+        assert asyncio.run(fetch(certificate_fingerprint(stub_certfile))) == {"value": "up 1 day"}
+        assert asyncio.run(fetch("0" * 64)) is None
+
+    def test_close_delimited_body(self, stub_certfile):
+        """Test a body ending with the connection is read completely and the connection is not reused"""
+        body = json.dumps([{"cpu": str(core), "idle": "50.0"} for core in range(20000)]).encode()
+
+        async def fetch():
+            async def answer(reader, writer):
+                await reader.readuntil(b"\r\n\r\n")
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n\r\n")
+                for start in range(0, len(body), 4096):
+                    writer.write(body[start:start + 4096])
+                    await writer.drain()
+                    await asyncio.sleep(0)
+                writer.close()
+
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(stub_certfile)
+            server = await asyncio.start_server(answer, "127.0.0.1", 0, ssl=context)
+            port = server.sockets[0].getsockname()[1]
+            try:
+                async with AsyncRedshiftAPI(host="127.0.0.1", port=port) as api:
+                    results = [await api.get_processor_stats(), await api.get_processor_stats()]
+                    return results, api.connections_opened, len(api._idle)
+            finally:
+                server.close()
+
+        results, connections, idle = asyncio.run(fetch())
+
+        assert results[0] == results[1] == json.loads(body)
+        assert connections == 2
+        assert idle == 0
+
+    def test_read_close_delimited_response(self):
+        """Test reading a close-delimited body waits for the end of the stream"""
+        async def read():
+            reader = asyncio.StreamReader()
+            reader.feed_data(b"HTTP/1.1 200 OK\r\nConnection: close\r\n\r\n" + b"a" * 100)
+            asyncio.get_running_loop().call_later(0.05, lambda: (reader.feed_data(b"b" * 100), reader.feed_eof()))
+            return await agent_redshift.read_http_message(reader)
+
+        status, headers, body = asyncio.run(read())
+        assert (status, body) == (200, b"a" * 100 + b"b" * 100)
+        assert not agent_redshift.keeps_connection(headers)
+        assert agent_redshift.keeps_connection({"content-length": "2"})
+
+    def test_repairs_json(self):
+        """Test the malformed JSON of the Redshift API is repaired"""
+        api = AsyncRedshiftAPI(host="127.0.0.1")
+        assert api._decode("systemdevicestats/mpstat", '[,{"cpu": "all",}]') == [{"cpu": "all"}]
+
+
+FLEET_USAGES = {
+    "uctm-a": {"cpu": 10.0, "memory": 50.0},
+    "uctm-b": {"cpu": 90.0, "memory": 85.0, "disk": 95.0},
+    "uctm-c": {"cpu": 50.0, "disk": 20.0},
+}
+FLEET_LEVELS = {"cpu": 80.0, "memory": 80.0, "disk": 80.0}
+
+
+class TestFleet:
+    """Tests for fleet mode and its rollup"""
+
+    def test_fleet_rollup(self, monkeypatch):
+        """Test the aggregates of the pure Python rollup"""
+        monkeypatch.setattr(agent_redshift, "np", None)
+
+        rollup = fleet_rollup(FLEET_USAGES, FLEET_LEVELS, devices=4, top=2)
+
+        assert rollup["devices"] == 4
+        assert rollup["responding"] == 3
+        assert rollup["resources"]["cpu"] == {
+            "p50": 50.0, "p95": 86.0, "mean": 50.0, "max": 90.0, "count": 3,
+            "level": 80.0, "above": 1, "top": [["uctm-b", 90.0], ["uctm-c", 50.0]],
+        }
+        assert rollup["resources"]["disk"]["count"] == 2
+        assert rollup["resources"]["memory"]["top"] == [["uctm-b", 85.0], ["uctm-a", 50.0]]
+        assert fleet_rollup({}, FLEET_LEVELS)["resources"] == {}
+
+    def test_numpy_matches_python(self, monkeypatch):
+        """Test the vectorised rollup gives the same results as the fallback"""
+        pytest.importorskip("numpy")
+        usages = {
+            f"uctm-{index}": {
+                resource: float((index * 37 + offset * 11) % 100)
+                for offset, resource in enumerate(("cpu", "memory", "disk"))
+                if (index + offset) % 7
+            }
+            for index in range(200)
+        }
+        usages["uctm-none"] = {}
+
+        vectorised = fleet_rollup(usages, FLEET_LEVELS)
+        monkeypatch.setattr(agent_redshift, "np", None)
+
+        assert vectorised == fleet_rollup(usages, FLEET_LEVELS)
+
+    def test_device_usage(self, sample_system_stats_json, sample_disk_json):
+        """Test usages are taken from the section metrics"""
+        usage = device_usage({
+            "system_stats": sample_system_stats_json,
+            "processor": [{"type": "mpstat", "cpu": "all", "idle": "75.0"}],
+            "disk": sample_disk_json,
+        })
+
+        assert usage["cpu"] == 25.0
+        assert 0 < usage["memory"] < 100
+        assert usage["disk"] == max(
+            float(entry["used"]) / float(entry["blocks_1k"]) * 100 for entry in sample_disk_json
+        )
+
+    def test_main_fleet_piggyback(self, capsys, stub_uctm, tmp_path):
+        """Test appliances are output as piggyback hosts in list order with the rollup"""
+        with socket.socket() as closed:
+            closed.bind(("127.0.0.1", 0))
+            closed_port = closed.getsockname()[1]
+        devices_file = tmp_path / "devices.json"
+        devices_file.write_text(json.dumps([
+            {"name": "uctm-down", "host": "127.0.0.1", "port": closed_port},
+            {"name": "uctm-stub", "host": "127.0.0.1", "port": stub_uctm.port, "serial": "STUB0001"},
+        ]))
+
+        main(["--devices", str(devices_file), "--sections", "processor,memory,uptime",
+              "--fleet-levels", "cpu=10,memory=90"])
+        output = capsys.readouterr().out
+
+        headers = [line for line in output.splitlines() if line.startswith("<<<<")]
+        assert headers == [
+            "<<<<uctm-down>>>>", "<<<<>>>>", "<<<<uctm-stub>>>>", "<<<<>>>>", "<<<<uctm-fleet>>>>", "<<<<>>>>",
+        ]
+        assert output.index("<<<redshift_uptime:sep(0)>>>") > output.index("<<<<uctm-stub>>>>")
+        rollup = section_data(output, "<<<redshift_fleet:sep(0)>>>")
+        assert rollup["devices"] == 2
+        assert rollup["responding"] == 1
+        assert rollup["resources"]["cpu"]["max"] == 20.0
+        assert rollup["resources"]["cpu"]["above"] == 1
+        assert rollup["resources"]["memory"]["above"] == 0
+
+    def test_main_fleet_sharded(self, capsys, stub_uctm, tmp_path):
+        """Test shard processes give the same ordered output as polling in one process"""
+        with socket.socket() as closed:
+            closed.bind(("127.0.0.1", 0))
+            closed_port = closed.getsockname()[1]
+        devices_file = tmp_path / "devices.json"
+        devices_file.write_text(json.dumps([
+            {"name": f"uctm-{index}", "host": "127.0.0.1", "port": closed_port if index % 3 else stub_uctm.port}
+            for index in range(7)
+        ]))
+        args = ["--devices", str(devices_file), "--sections", "processor,memory,uptime"]
+
+        main(args)
+        unsharded = capsys.readouterr().out
+        main(args + ["--fleet-shards", "3"])
+        sharded = capsys.readouterr().out
+
+        assert sharded == unsharded
+        assert section_data(sharded, "<<<redshift_fleet:sep(0)>>>")["responding"] == 3
+        assert len(stub_uctm.requests) == 2 * 3 * 3
+
+    def test_poll_device_renders_on_the_worker(self, stub_uctm):
+        """Test a polled appliance comes back as finished text and a small usage dict"""
+        args = parse_arguments(["--devices", "devices.json", "--sections", "processor,uptime"])
+        device = {"name": "uctm-stub", "host": "127.0.0.1", "port": stub_uctm.port}
+
+        text, usage = agent_redshift.poll_device(args, device)
+
+        assert text.startswith("<<<<uctm-stub>>>>\n<<<redshift_processor:sep(0)>>>\n")
+        assert text.endswith("<<<<>>>>\n")
+        assert usage == {"cpu": 20.0}
+        assert agent_redshift.render_device(device, []) == ("<<<<uctm-stub>>>>\n<<<<>>>>\n", None)
+
+    def test_fleet_shard_count(self, monkeypatch):
+        """Test shards default to the CPU cores and never exceed the devices"""
+        monkeypatch.setattr(agent_redshift.os, "cpu_count", lambda: 8)
+
+        assert agent_redshift.fleet_shard_count(0, 100) == 8
+        assert agent_redshift.fleet_shard_count(4, 100) == 4
+        assert agent_redshift.fleet_shard_count(0, 3) == 3
+        assert agent_redshift.fleet_shard_count(1, 0) == 1
+
+    def test_parse_fleet_arguments(self):
+        """Test fleet mode needs no host and validates its levels"""
+        args = parse_arguments(["--devices", "devices.json", "--fleet-levels", "disk=95"])
+
+        assert args.host is None
+        assert args.fleet_levels == {"disk": 95.0}
+        assert parse_arguments(["--devices", "devices.json"]).fleet_levels == FLEET_LEVELS
+        with pytest.raises(SystemExit):
+            parse_arguments(["--devices", "devices.json", "--fleet-levels", "gpu=80"])
+
+    def test_main_fleet_invalid_device_list(self, capsys, tmp_path):
+        """Test an unreadable or malformed device list is reported with a non-zero exit"""
+        devices_file = tmp_path / "devices.json"
+        cases = [
+            (None, "Could not read device list"),
+            ("[{", "Could not read device list"),
+            ('{"host": "10.0.0.1"}', "is no JSON list"),
+            ('[{"host": "10.0.0.1"}, {"name": "uctm2"}]', "Entry 1 of device list"),
+            ('[{"host": "10.0.0.1", "port": "https"}]', "has an invalid port"),
+        ]
+        for content, message in cases:
+            if content is not None:
+                devices_file.write_text(content)
+
+            assert main(["--devices", str(devices_file)]) == 1
+
+            captured = capsys.readouterr()
+            assert message in captured.err
+            assert captured.out == ""
+
+
 class TestParseArguments:
     """Tests for command-line argument parsing"""
 
@@ -199,6 +1609,11 @@ class TestParseArguments:
         assert args.port == 443
         assert args.verify_ssl is False
         assert args.timeout == 10
+        assert args.hedge is False
+        assert args.hedge_delay == 1.0
+        assert args.hedge_max == 1
+        assert args.probe is False
+        assert args.probe_timeout == 2.0
 
     def test_parse_all_args(self):
         """Test parsing all arguments"""
@@ -250,6 +1665,14 @@ class TestOutputSection:
         assert lines[0] == "<<<redshift_test_section:sep(0)>>>"
         assert json.loads(lines[1]) == data
 
+    def test_output_section_cached(self, capsys):
+        """Test outputting a section with a cached header"""
+        output_section("test_section", {"key": "value"}, cached=(1700000000, 600))
+
+        lines = capsys.readouterr().out.strip().split('\n')
+
+        assert lines[0] == "<<<redshift_test_section:sep(0):cached(1700000000,600)>>>"
+
     def test_output_section_list(self, capsys):
         """Test outputting a section with list data"""
         data = [{"type": "A"}, {"type": "B"}]
@@ -5,7 +5,7 @@ Tests for redshift.py main plugin
 """
 
 import json
-from cmk.agent_based.v2 import Result, Metric, State, Service
+from cmk.agent_based.v2 import Attributes, Result, Metric, State, Service, TableRow
 
 from agent_based.redshift import (
     parse_redshift_system_stats,
@@ -16,14 +16,33 @@ from agent_based.redshift import (
     check_redshift_hdd,
     discover_redshift_interfaces,
     check_redshift_interfaces,
+    cluster_check_redshift_interfaces,
+    discover_redshift_interface_groups,
+    check_redshift_interface_groups,
     parse_redshift_chassis,
     discover_redshift_chassis,
     check_redshift_chassis,
+    inventory_redshift_chassis,
+    inventory_redshift_interfaces,
     parse_redshift_uptime,
     discover_redshift_uptime,
     check_redshift_uptime,
+    parse_redshift_probe,
+    discover_redshift_probe,
+    check_redshift_probe,
+    check_plugin_redshift_probe,
+    parse_redshift_fleet,
+    discover_redshift_fleet,
+    check_redshift_fleet,
+    check_plugin_redshift_fleet,
+    parse_redshift_agent,
+    discover_redshift_agent,
+    check_redshift_agent,
+    check_plugin_redshift_system_stats,
 )
 
+SYSTEM_STATS_PARAMS = check_plugin_redshift_system_stats.check_default_parameters
+
 
 # ============================================================================
 # System Statistics Tests
@@ -56,20 +75,20 @@ class TestSystemStats:
     def test_discover_system_stats_with_data(self):
         """Test discovery with valid data"""
         section = {"Total Memory": "16173828 kB"}
-        services = list(discover_redshift_system_stats(section))
+        services = list(discover_redshift_system_stats(section, None))
 
         assert len(services) == 1
         assert isinstance(services[0], Service)
 
     def test_discover_system_stats_no_data(self):
         """Test discovery with no data"""
-        services = list(discover_redshift_system_stats(None))
+        services = list(discover_redshift_system_stats(None, None))
 
         assert len(services) == 0
 
     def test_check_system_stats_no_data(self):
         """Test check with no data"""
-        results = list(check_redshift_system_stats(None))
+        results = list(check_redshift_system_stats(SYSTEM_STATS_PARAMS, None, None))
 
         assert len(results) == 1
         assert isinstance(results[0], Result)
@@ -81,7 +100,7 @@ class TestSystemStats:
             "Total Memory": "16173828 kB",
             "Used Memory": "3747460 kB (23.0%)",
         }
-        results = list(check_redshift_system_stats(section))
+        results = list(check_redshift_system_stats(SYSTEM_STATS_PARAMS, section, None))
 
         # Find metrics and results
         metrics = [r for r in results if isinstance(r, Metric)]
@@ -102,7 +121,7 @@ class TestSystemStats:
             "Total Memory": "16173828 kB",
             "Used Memory": "14556446 kB (90.0%)",  # Slightly over 90% usage
         }
-        results = list(check_redshift_system_stats(section))
+        results = list(check_redshift_system_stats(SYSTEM_STATS_PARAMS, section, None))
 
         result_objs = [r for r in results if isinstance(r, Result)]
         memory_result = [r for r in result_objs if "Memory:" in r.summary][0]
@@ -115,7 +134,7 @@ class TestSystemStats:
             "Total Memory": "16173828 kB",
             "Used Memory": "15365239 kB (95.0%)",  # 95% usage
         }
-        results = list(check_redshift_system_stats(section))
+        results = list(check_redshift_system_stats(SYSTEM_STATS_PARAMS, section, None))
 
         result_objs = [r for r in results if isinstance(r, Result)]
         memory_result = [r for r in result_objs if "Memory:" in r.summary][0]
@@ -127,7 +146,7 @@ class TestSystemStats:
         section = {
             "CPU Usage": "45.5%",
         }
-        results = list(check_redshift_system_stats(section))
+        results = list(check_redshift_system_stats(SYSTEM_STATS_PARAMS, section, None))
 
         metrics = [r for r in results if isinstance(r, Metric)]
         result_objs = [r for r in results if isinstance(r, Result)]
@@ -145,7 +164,7 @@ class TestSystemStats:
         section = {
             "CPU Usage": "85.0%",
         }
-        results = list(check_redshift_system_stats(section))
+        results = list(check_redshift_system_stats(SYSTEM_STATS_PARAMS, section, None))
 
         result_objs = [r for r in results if isinstance(r, Result)]
         cpu_result = [r for r in result_objs if "CPU:" in r.summary][0]
@@ -157,19 +176,47 @@ class TestSystemStats:
         section = {
             "CPU Usage": "95.0%",
         }
-        results = list(check_redshift_system_stats(section))
+        results = list(check_redshift_system_stats(SYSTEM_STATS_PARAMS, section, None))
 
         result_objs = [r for r in results if isinstance(r, Result)]
         cpu_result = [r for r in result_objs if "CPU:" in r.summary][0]
 
         assert cpu_result.state == State.CRIT
 
+    def test_check_system_stats_memory_owned_by_memory_service(self, sample_memory_json):
+        """Test that memory metrics are left to the Memory service"""
+        section = {"Total Memory": "16173828 kB", "Used Memory": "15365239 kB (95.0%)"}
+        results = list(check_redshift_system_stats(SYSTEM_STATS_PARAMS, section, sample_memory_json))
+
+        assert not [r for r in results if isinstance(r, Metric)]
+        memory_result = [r for r in results if isinstance(r, Result) and "Memory:" in r.summary][0]
+        assert memory_result.state == State.CRIT
+        assert Result(state=State.OK, notice="Memory metrics are recorded by the Memory service") in results
+
+    def test_check_system_stats_predictive_memory_levels(self, sample_memory_json):
+        """Test that predictive memory levels keep the metric they are predicted from"""
+        section = {"Total Memory": "16173828 kB", "Used Memory": "3747460 kB (23.0%)"}
+        params = dict(SYSTEM_STATS_PARAMS, memory_levels=("predictive", ("memory_used_percent", 20.0, (50, 60))))
+        results = list(check_redshift_system_stats(params, section, sample_memory_json))
+
+        metrics = [r.name for r in results if isinstance(r, Metric)]
+        assert metrics == ["memory_used_percent"]
+
+    def test_check_system_stats_memory_metrics_both(self, sample_memory_json):
+        """Test that both services record memory metrics if configured"""
+        section = {"Total Memory": "16173828 kB", "Used Memory": "3747460 kB (23.0%)"}
+        params = dict(SYSTEM_STATS_PARAMS, memory_metrics="both")
+        results = list(check_redshift_system_stats(params, section, sample_memory_json))
+
+        metrics = [r.name for r in results if isinstance(r, Metric)]
+        assert metrics == ["memory_used", "memory_total", "memory_used_percent"]
+
     def test_check_system_stats_license_info(self):
         """Test check includes license information"""
         section = {
             "Days To Expire": "365 days",
         }
-        results = list(check_redshift_system_stats(section))
+        results = list(check_redshift_system_stats(SYSTEM_STATS_PARAMS, section, None))
 
         result_objs = [r for r in results if isinstance(r, Result)]
         license_result = [r for r in result_objs if "License:" in r.summary][0]
@@ -254,16 +301,54 @@ class TestHDDEthernet:
 
     def test_discover_interfaces(self, sample_hdd_ethernet_json):
         """Test interface discovery"""
-        services = list(discover_redshift_interfaces(sample_hdd_ethernet_json))
+        services = list(discover_redshift_interfaces({}, sample_hdd_ethernet_json))
 
         assert len(services) == 2
         items = [s.item for s in services]
         assert "eth0" in items
         assert "eth1" in items
 
+    def test_discover_interfaces_filtered(self, sample_hdd_ethernet_json):
+        """Test interface discovery with include and exclude regexes"""
+        section = dict(sample_hdd_ethernet_json)
+        section["Ethernet usage"] = sample_hdd_ethernet_json["Ethernet usage"] + [{"Iface": "lo"}]
+
+        services = list(discover_redshift_interfaces({"exclude": ["lo$"]}, section))
+        assert [s.item for s in services] == ["eth0", "eth1"]
+
+        services = list(discover_redshift_interfaces({"include": ["eth1"]}, section))
+        assert [s.item for s in services] == ["eth1"]
+
+    def test_discover_interface_groups(self, sample_hdd_ethernet_json):
+        """Test that grouped interfaces are discovered as one group service"""
+        section = dict(sample_hdd_ethernet_json)
+        section["Ethernet usage"] = sample_hdd_ethernet_json["Ethernet usage"] + [
+            {"Iface": f"eth0.{vlan}", "RX-OK": "10", "TX-OK": "20"} for vlan in range(100, 103)
+        ]
+        params = {"groups": [{"name": "VLANs", "pattern": r"eth0\."}, {"name": "Unused", "pattern": "bond"}]}
+
+        assert [s.item for s in discover_redshift_interfaces(params, section)] == ["eth0", "eth1"]
+        assert list(discover_redshift_interface_groups(params, section)) == [
+            Service(item="VLANs", parameters={"pattern": r"eth0\."})
+        ]
+
+    def test_check_interface_group(self, sample_hdd_ethernet_json):
+        """Test that an interface group sums the counters of its members"""
+        results = list(check_redshift_interface_groups("All", {"pattern": "eth"}, sample_hdd_ethernet_json))
+
+        assert results[0] == Result(state=State.OK, summary="Members: 2", details="Members: eth0, eth1")
+        assert Metric("if_in_pkts", 1234567 + 987654) in results
+        assert Metric("if_in_errors", 2) in results
+
+    def test_check_interface_group_vanished(self, sample_hdd_ethernet_json):
+        """Test an interface group without members"""
+        results = list(check_redshift_interface_groups("Bonds", {"pattern": "bond"}, sample_hdd_ethernet_json))
+
+        assert results == [Result(state=State.UNKNOWN, summary="No member interfaces found")]
+
     def test_check_interface_eth0(self, sample_hdd_ethernet_json):
         """Test checking eth0 interface"""
-        results = list(check_redshift_interfaces("eth0", sample_hdd_ethernet_json))
+        results = list(check_redshift_interfaces("eth0", {}, sample_hdd_ethernet_json))
 
         metrics = [r for r in results if isinstance(r, Metric)]
         result_objs = [r for r in results if isinstance(r, Result)]
@@ -277,10 +362,52 @@ class TestHDDEthernet:
 
     def test_check_interface_not_found(self, sample_hdd_ethernet_json):
         """Test checking non-existent interface"""
-        results = list(check_redshift_interfaces("eth99", sample_hdd_ethernet_json))
+        results = list(check_redshift_interfaces("eth99", {}, sample_hdd_ethernet_json))
 
         assert len(results) == 0
 
+    def test_cluster_check_interface(self, sample_hdd_ethernet_json):
+        """Test interface cluster check reports the selected node"""
+        section = {"uctm-a": sample_hdd_ethernet_json, "uctm-b": sample_hdd_ethernet_json}
+        results = list(cluster_check_redshift_interfaces("eth0", {"cluster_mode": "best"}, section))
+
+        assert results[0] == Result(state=State.OK, summary="Best node: uctm-a")
+        assert any(isinstance(r, Metric) and r.name == "if_in_pkts" for r in results)
+        assert results[-1].notice.startswith("[uctm-b] OK: ")
+
+    def test_inventory_interfaces(self, sample_hdd_ethernet_json):
+        """Test inventory of static interface attributes"""
+        results = list(inventory_redshift_interfaces(sample_hdd_ethernet_json))
+
+        assert results[:2] == [
+            TableRow(
+                path=["networking", "interfaces"],
+                key_columns={"index": 1},
+                inventory_columns={"description": "eth0", "mtu": 1500},
+            ),
+            TableRow(
+                path=["networking", "addresses"],
+                key_columns={"address": "192.168.1.100", "device": "eth0"},
+                inventory_columns={"type": "IPv4"},
+            ),
+        ]
+        assert len(results) == 4
+
+    def test_inventory_interfaces_without_address(self):
+        """Test interfaces without an IP address get no address row"""
+        section = {"Ethernet usage": [{"Met": "0"}, {"Iface": "lo", "IPAddress": "n/a", "Met": "-"}]}
+
+        results = list(inventory_redshift_interfaces(section))
+
+        assert results == [
+            TableRow(
+                path=["networking", "interfaces"],
+                key_columns={"index": 2},
+                inventory_columns={"description": "lo"},
+            ),
+        ]
+        assert list(inventory_redshift_interfaces(None)) == []
+
 
 # ============================================================================
 # Chassis Information Tests
@@ -310,7 +437,9 @@ class TestChassis:
         result_objs = [r for r in results if isinstance(r, Result)]
         assert len(result_objs) == 1
         assert result_objs[0].state == State.OK
-        assert "Dell Inc." in result_objs[0].summary
+        assert result_objs[0].summary == (
+            "Boot-up State: Safe, Power Supply State: Safe, Thermal State: Safe, Security Status: None"
+        )
 
     def test_check_chassis_critical_state(self):
         """Test chassis check with critical state"""
@@ -327,7 +456,33 @@ class TestChassis:
 
         result_objs = [r for r in results if isinstance(r, Result)]
         assert result_objs[0].state == State.CRIT
-        assert "powerSupplyState" in result_objs[0].summary
+        assert "Power Supply State: Critical (expected Safe)" in result_objs[0].summary
+
+    def test_check_chassis_without_states(self):
+        """Test chassis check with only static information"""
+        results = list(check_redshift_chassis({"manufacturer": "Dell Inc."}))
+
+        assert results == [Result(state=State.OK, summary="No chassis state available")]
+
+    def test_inventory_chassis(self, sample_chassis_json):
+        """Test chassis inventory attributes"""
+        results = list(inventory_redshift_chassis(sample_chassis_json))
+
+        assert results == [Attributes(
+            path=["hardware", "chassis"],
+            inventory_attributes={
+                "manufacturer": "Dell Inc.",
+                "type": "Rack Mount",
+                "version": "1.0",
+                "serial": "ABC123XYZ",
+                "info": "Chassis Information",
+            },
+        )]
+
+    def test_inventory_chassis_no_data(self):
+        """Test chassis inventory without data"""
+        assert list(inventory_redshift_chassis(None)) == []
+        assert list(inventory_redshift_chassis({"thermalState": "Safe"})) == []
 
 
 # ============================================================================
@@ -375,3 +530,178 @@ class TestUptime:
         result_objs = [r for r in results if isinstance(r, Result)]
         assert result_objs[0].state == State.OK
         assert "10 days" in result_objs[0].summary
+
+
+# ============================================================================
+# API Probe Tests
+# ============================================================================
+
+class TestProbe:
+    """Tests for the API liveness probe check"""
+
+    PARAMS = check_plugin_redshift_probe.check_default_parameters
+
+    def test_parse_and_discover_probe(self):
+        """Test the probe section is parsed and discovered"""
+        section = parse_redshift_probe([['{"status": "ok", "rtt": 0.05, "http_status": 200}']])
+
+        assert section["rtt"] == 0.05
+        assert len(list(discover_redshift_probe(section))) == 1
+        assert list(discover_redshift_probe(None)) == []
+
+    def test_check_probe_ok(self):
+        """Test a fast answer is OK with a response time metric"""
+        section = {"status": "ok", "rtt": 0.05, "http_status": 200, "timeout": 2.0}
+        results = list(check_redshift_probe(self.PARAMS, section))
+
+        metrics = [r for r in results if isinstance(r, Metric)]
+        assert metrics[0].name == "response_time"
+        assert metrics[0].value == 0.05
+        assert all(r.state == State.OK for r in results if isinstance(r, Result))
+        assert results[-1].notice == "HTTP status: 200"
+
+    def test_check_probe_slow(self):
+        """Test a slow answer is compared against the response time levels"""
+        section = {"status": "ok", "rtt": 1.5, "http_status": 200, "timeout": 2.0}
+        results = list(check_redshift_probe(self.PARAMS, section))
+
+        assert results[0].state == State.CRIT
+        assert "Response time" in results[0].summary
+
+    def test_check_probe_timeout(self):
+        """Test a timed out probe is CRIT"""
+        section = {"status": "timeout", "rtt": 2.0, "timeout": 2.0, "error": "Read timed out"}
+        results = list(check_redshift_probe(self.PARAMS, section))
+
+        assert len(results) == 1
+        assert results[0].state == State.CRIT
+        assert "timeout after" in results[0].summary
+
+    def test_check_probe_error(self):
+        """Test a failed probe is CRIT with the error"""
+        section = {"status": "error", "rtt": 0.01, "http_status": 503, "error": "503 Server Error"}
+        results = list(check_redshift_probe(self.PARAMS, section))
+
+        assert results[0].state == State.CRIT
+        assert "503 Server Error" in results[0].summary
+
+    def test_check_probe_no_data(self):
+        """Test probe check without data"""
+        results = list(check_redshift_probe(self.PARAMS, None))
+
+        assert results[0].state == State.UNKNOWN
+
+
+# ============================================================================
+# Fleet Rollup Tests
+# ============================================================================
+
+FLEET_SECTION = {
+    "devices": 4,
+    "responding": 3,
+    "resources": {
+        "cpu": {
+            "p50": 50.0, "p95": 86.0, "mean": 50.0, "max": 90.0, "count": 3,
+            "level": 80.0, "above": 1, "top": [["uctm-b", 90.0], ["uctm-c", 50.0]],
+        },
+        "disk": {
+            "p50": 57.5, "p95": 91.25, "mean": 57.5, "max": 95.0, "count": 2,
+            "level": 80.0, "above": 1, "top": [["uctm-b", 95.0]],
+        },
+    },
+}
+
+
+class TestFleet:
+    """Tests for the fleet rollup check"""
+
+    PARAMS = check_plugin_redshift_fleet.check_default_parameters
+
+    def test_parse_and_discover_fleet(self):
+        """Test one service is discovered per aggregated resource"""
+        section = parse_redshift_fleet([[json.dumps(FLEET_SECTION)]])
+
+        assert list(discover_redshift_fleet(section)) == [Service(item="CPU"), Service(item="Disk")]
+        assert list(discover_redshift_fleet(None)) == []
+
+    def test_check_fleet(self):
+        """Test the percentile levels, counts and top offenders"""
+        results = list(check_redshift_fleet("CPU", self.PARAMS, FLEET_SECTION))
+
+        result_objs = [r for r in results if isinstance(r, Result)]
+        metrics = {m.name: m.value for m in results if isinstance(m, Metric)}
+        assert result_objs[0].state == State.WARN
+        assert "95th percentile: 86.0%" in result_objs[0].summary
+        assert metrics == {"fleet_p95": 86.0, "fleet_p50": 50.0, "fleet_max": 90.0, "fleet_above": 1}
+        assert any(r.summary == "Reporting: 3 of 4" for r in result_objs)
+        assert result_objs[-1].notice == "Top: uctm-b 90.0%, uctm-c 50.0%"
+
+    def test_check_fleet_above_levels(self):
+        """Test levels on the number of appliances above the fleet level"""
+        results = list(check_redshift_fleet("Disk", {"above": ("fixed", (1, 2))}, FLEET_SECTION))
+
+        above = [r for r in results if isinstance(r, Result) and "Appliances above 80.0%" in r.summary]
+        assert above[0].state == State.WARN
+
+    def test_check_fleet_missing_item(self):
+        """Test resources without data yield nothing"""
+        assert list(check_redshift_fleet("Memory", self.PARAMS, FLEET_SECTION)) == []
+
+
+# ============================================================================
+# Special Agent Tests
+# ============================================================================
+
+class TestAgent:
+    """Tests for the special agent performance section"""
+
+    def test_parse_agent(self):
+        """Test parsing agent data"""
+        section = parse_redshift_agent([[json.dumps({"runtime": 1.5, "backoff": False})]])
+
+        assert section == {"runtime": 1.5, "backoff": False}
+
+    def test_discover_agent(self):
+        """Test discovery with and without data"""
+        assert len(list(discover_redshift_agent({"runtime": 1.5}))) == 1
+        assert len(list(discover_redshift_agent(None))) == 0
+
+    def test_check_agent_no_data(self):
+        """Test check with no data"""
+        results = list(check_redshift_agent(None))
+
+        assert results[0].state == State.UNKNOWN
+
+    def test_check_agent_not_backing_off(self):
+        """Test check while the appliance load is below the threshold"""
+        section = {
+            "runtime": 1.5,
+            "backoff": False,
+            "cpu_usage": 20.0,
+            "cpu_threshold": 90.0,
+            "cached_sections": [],
+        }
+        results = list(check_redshift_agent(section))
+
+        metrics = [r for r in results if isinstance(r, Metric)]
+        result_objs = [r for r in results if isinstance(r, Result)]
+
+        assert metrics == [Metric("execution_time", 1.5)]
+        assert all(r.state == State.OK for r in result_objs)
+        assert not any("Backing off" in r.summary for r in result_objs)
+
+    def test_check_agent_backing_off(self):
+        """Test check while the agent backs off"""
+        section = {
+            "runtime": 0.8,
+            "backoff": True,
+            "cpu_usage": 95.0,
+            "cpu_threshold": 90.0,
+            "cached_sections": ["processor", "hdd_ethernet"],
+        }
+        results = list(check_redshift_agent(section))
+
+        summaries = [r.summary for r in results if isinstance(r, Result)]
+
+        assert "Backing off: appliance CPU 95.0% (threshold 90.0%)" in summaries
+        assert "Served from cache: processor, hdd_ethernet" in summaries
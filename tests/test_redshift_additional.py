@@ -6,6 +6,7 @@ Tests for redshift_additional.py
 
 import pytest
 import json
+import time
 from cmk.agent_based.v2 import Result, Metric, State, Service
 
 from agent_based.redshift_additional import (
@@ -16,9 +17,11 @@ from agent_based.redshift_additional import (
     parse_redshift_memory,
     discover_redshift_memory,
     check_redshift_memory,
+    cluster_check_redshift_memory,
     parse_redshift_disk,
     discover_redshift_disk,
     check_redshift_disk,
+    cluster_check_redshift_disk,
 )
 
 
@@ -89,6 +92,19 @@ class TestProcessor:
         assert result_objs[0].state == State.OK
         assert "Total:" in result_objs[0].summary
 
+    def test_check_processor_derived_entry(self):
+        """Test processor check with an entry derived from system stats"""
+        section = [{"type": "mpstat", "cpu": "all", "idle": "84.80"}]
+        params = {"util": (80, 90)}
+        results = list(check_redshift_processor(params, section))
+
+        metrics = [r for r in results if isinstance(r, Metric)]
+        result_objs = [r for r in results if isinstance(r, Result)]
+
+        assert [m.name for m in metrics] == ["util"]
+        assert result_objs[0].state == State.OK
+        assert result_objs[0].summary == "Total: 15.2%"
+
     def test_check_processor_warn(self):
         """Test processor check with warning level"""
         section = [
@@ -152,8 +168,20 @@ class TestProcessor:
         params = {"util": (80, 90), "iowait": (20, 30)}
         results = list(check_redshift_processor(params, section))
 
-        result_objs = [r for r in results if isinstance(r, Result)]
-        assert result_objs[0].state == State.WARN
+        wait_result = [r for r in results if isinstance(r, Result) and r.summary.startswith("Wait:")][0]
+        assert wait_result.state == State.WARN
+
+    def test_check_processor_average(self, value_store):
+        """Test that the levels apply to the average with the average parameter"""
+        if value_store is None:
+            pytest.skip("requires the mocked value store")
+        section = [{"type": "mpstat", "cpu": "all", "idle": "5.0"}]  # 95% usage
+        value_store["average"] = [(time.time() - 60, 15.0)]
+        results = list(check_redshift_processor({"util": (80, 90), "average": 5}, section))
+
+        metrics = {m.name: m.value for m in results if isinstance(m, Metric)}
+        assert metrics == {"util": 95.0, "util_average": 55.0}
+        assert all(r.state == State.OK for r in results if isinstance(r, Result))
 
     def test_check_processor_core_ok(self, sample_processor_json):
         """Test individual core check"""
@@ -259,6 +287,20 @@ class TestMemory:
         result_objs = [r for r in results if isinstance(r, Result)]
         assert result_objs[0].state == State.CRIT
 
+    def test_cluster_check_memory(self, sample_memory_json):
+        """Test memory cluster check in worst and best node mode"""
+        standby = [dict(sample_memory_json[0], used="15000000", free="1173828")]
+        section = {"uctm-a": sample_memory_json, "uctm-b": standby}
+
+        worst = list(cluster_check_redshift_memory({"levels": (80, 90)}, section))
+        assert worst[0] == Result(state=State.OK, summary="Worst node: uctm-b")
+        assert [r for r in worst[1:] if isinstance(r, Result)][0].state == State.CRIT
+
+        params = {"levels": (80, 90), "cluster_mode": "best"}
+        best = list(cluster_check_redshift_memory(params, section))
+        assert best[0] == Result(state=State.OK, summary="Best node: uctm-a")
+        assert [r for r in best[1:] if isinstance(r, Result)][0].state == State.OK
+
 
 # ============================================================================
 # Disk Space Tests
@@ -278,7 +320,7 @@ class TestDisk:
 
     def test_discover_disk(self, sample_disk_json):
         """Test disk discovery"""
-        services = list(discover_redshift_disk(sample_disk_json))
+        services = list(discover_redshift_disk({}, sample_disk_json))
 
         assert len(services) == 2
         items = [s.item for s in services]
@@ -287,10 +329,26 @@ class TestDisk:
 
     def test_discover_disk_no_data(self):
         """Test disk discovery with no data"""
-        services = list(discover_redshift_disk(None))
+        services = list(discover_redshift_disk({}, None))
 
         assert len(services) == 0
 
+    def test_discover_disk_filters(self, sample_disk_json):
+        """Test disk discovery with mount point and filesystem type filters"""
+        section = sample_disk_json + [
+            dict(sample_disk_json[0], filesystem="tmpfs", mountedOn="/dev/shm"),
+            dict(sample_disk_json[0], filesystem="overlay", mountedOn="/var/lib/docker/overlay2/abc/merged"),
+        ]
+
+        params = {"exclude_types": ["tmpfs", "overlay"]}
+        assert [s.item for s in discover_redshift_disk(params, section)] == ["/", "/var"]
+
+        params = {"exclude": ["/var"]}
+        assert [s.item for s in discover_redshift_disk(params, section)] == ["/", "/dev/shm"]
+
+        params = {"include": ["/$", "/dev"]}
+        assert [s.item for s in discover_redshift_disk(params, section)] == ["/", "/dev/shm"]
+
     def test_check_disk_ok(self, sample_disk_json):
         """Test disk check with normal usage"""
         params = {"levels": (80, 90)}
@@ -344,6 +402,24 @@ class TestDisk:
         result_objs = [r for r in results if isinstance(r, Result)]
         assert result_objs[0].state == State.CRIT
 
+    def test_cluster_check_disk(self, sample_disk_json):
+        """Test disk cluster check with the mount point on one node only"""
+        section = {"uctm-a": sample_disk_json, "uctm-b": sample_disk_json[1:]}
+        results = list(cluster_check_redshift_disk("/", {"levels": (80, 90)}, section))
+
+        assert results[0] == Result(state=State.OK, summary="Worst node: uctm-a")
+        assert not [r for r in results if isinstance(r, Result) and r.notice.startswith("[uctm-b]")]
+
+    def test_check_disk_fill_rate(self, sample_disk_json, value_store):
+        """Test that the disk check forecasts from the value store history"""
+        if value_store is None:
+            pytest.skip("requires the mocked value store")
+        value_store["trend"] = [(time.time() - 3600, 20 * 1024**3)]
+        results = list(check_redshift_disk("/", {"levels": (80, 90)}, sample_disk_json))
+
+        assert any(isinstance(r, Metric) and r.name == "fs_growth" for r in results)
+        assert len(value_store["trend"]) == 2
+
     def test_check_disk_not_found(self, sample_disk_json):
         """Test checking non-existent mount point"""
         params = {"levels": (80, 90)}
@@ -5,8 +5,29 @@ Tests for redshift_common.py
 """
 
 import pytest
+import gc
+import inspect
 import json
-from agent_based.redshift_common import parse_json_section
+import time
+import tracemalloc
+from cmk.agent_based.v2 import Metric, Result, State
+
+from agent_based import redshift_common
+from agent_based.redshift_common import (
+    AVERAGE_MAX_SAMPLES,
+    check_cluster,
+    check_fill_rate,
+    check_levels_averaged,
+    check_levels_from_params,
+    check_usage_levels,
+    FS_TREND_MAX_SAMPLES,
+    instrumented,
+    linear_regression_slope,
+    parse_json_section,
+    PARSE_CACHE_MAX_LINE,
+    PluginStats,
+    sliding_average,
+)
 
 
 class TestParseJsonSection:
@@ -81,4 +102,385 @@ class TestParseJsonSection:
         result = parse_json_section(string_table)
 
         assert result == data
-        assert result["message"] == "Hello 世界 🌍"
\ No newline at end of file
+        assert result["message"] == "Hello 世界 🌍"
+
+
+def _fake_node_check(_node, node_section):
+    """Yield a result with the state stored in the node section"""
+    yield Result(state=node_section["state"], summary=node_section["summary"])
+    yield Metric("value", node_section["value"])
+
+
+class TestCheckCluster:
+    """Tests for the check_cluster function"""
+
+    SECTION = {
+        "uctm-a": {"state": State.OK, "summary": "Usage: 40%", "value": 40},
+        "uctm-b": {"state": State.CRIT, "summary": "Usage: 95%", "value": 95},
+    }
+
+    def test_worst_node(self):
+        """Test that the worst node determines the results"""
+        results = list(check_cluster(_fake_node_check, self.SECTION, "worst"))
+
+        assert results[0] == Result(state=State.OK, summary="Worst node: uctm-b")
+        assert results[1].state == State.CRIT
+        assert Metric("value", 95) in results
+        assert results[-1] == Result(state=State.OK, notice="[uctm-a] OK: Usage: 40%")
+
+    def test_best_node(self):
+        """Test that the best node determines the results"""
+        results = list(check_cluster(_fake_node_check, self.SECTION, "best"))
+
+        assert results[0] == Result(state=State.OK, summary="Best node: uctm-a")
+        assert results[1].state == State.OK
+        assert Metric("value", 40) in results
+        assert results[-1] == Result(state=State.OK, notice="[uctm-b] CRIT: Usage: 95%")
+
+    def test_nodes_without_data_are_skipped(self):
+        """Test that nodes without section or results are ignored"""
+        section = {"uctm-a": None, "uctm-b": self.SECTION["uctm-b"]}
+        results = list(check_cluster(_fake_node_check, section))
+
+        assert results[0] == Result(state=State.OK, summary="Worst node: uctm-b")
+        assert len(results) == 3
+
+    def test_no_node_data(self):
+        """Test that an empty cluster section yields nothing"""
+        assert list(check_cluster(_fake_node_check, {"uctm-a": None})) == []
+
+
+class TestLevels:
+    """Tests for the levels engine"""
+
+    @pytest.mark.parametrize("levels, expected", [
+        (None, ("no_levels", None)),
+        ((80, 90), ("fixed", (80, 90))),
+        (("fixed", (80.0, 90.0)), ("fixed", (80.0, 90.0))),
+        (("no_levels", None), ("no_levels", None)),
+        (("predictive", ("util", 42.0, (52.0, 62.0))), ("predictive", ("util", 42.0, (52.0, 62.0)))),
+        (("bogus",), ("no_levels", None)),
+    ])
+    def test_levels_formats(self, monkeypatch, levels, expected):
+        """Test normalization of the supported levels formats"""
+        calls = []
+        monkeypatch.setattr(redshift_common, "check_levels", lambda value, **kwargs: calls.append(kwargs) or [])
+
+        list(check_levels_from_params(50.0, levels_upper=levels, levels_lower=levels))
+
+        assert calls[0]["levels_upper"] == expected
+        assert calls[0]["levels_lower"] == expected
+
+    def test_levels_from_lists(self):
+        """Test levels stored as lists, as in JSON rule values, are accepted"""
+        results = list(check_levels_from_params(85.0, levels_upper=["fixed", [80, 90]]))
+
+        assert results[0].state == State.WARN
+
+    def test_check_levels_from_params(self):
+        """Test fixed upper levels with metric"""
+        results = list(check_levels_from_params(
+            85.0, levels_upper=(80, 90), metric_name="util", label="Total"
+        ))
+
+        assert results[0].state == State.WARN
+        assert results[0].summary.startswith("Total: 85.00")
+        assert results[1].name == "util"
+
+    def test_check_usage_levels_free_bytes(self):
+        """Test absolute levels on free bytes next to percentage levels"""
+        params = {"levels": ("fixed", (80.0, 90.0)), "levels_free": ("fixed", (2048, 1024))}
+        results = list(check_usage_levels(50.0, 1500, params, "fs_used_percent"))
+
+        result_objs = [r for r in results if isinstance(r, Result)]
+        assert [r.state for r in result_objs] == [State.OK, State.WARN]
+        assert Metric("fs_used_percent", 50.0, levels=(80.0, 90.0)) in results
+
+
+GiB = 1024**3
+DAY = 86400
+
+
+class TestFillRate:
+    """Tests for the filesystem fill rate forecast"""
+
+    def test_linear_regression_slope(self):
+        """Test the least squares slope"""
+        assert linear_regression_slope([(0, 1.0), (10, 21.0), (20, 41.0)]) == 2.0
+        assert linear_regression_slope([(0, 1.0)]) is None
+        assert linear_regression_slope([(5, 1.0), (5, 2.0)]) is None
+
+    def test_first_sample(self):
+        """Test that a single sample only initializes the history"""
+        store = {}
+        assert list(check_fill_rate(store, "trend", 10 * GiB, 90 * GiB, {}, 1000.0)) == []
+        assert store == {"trend": [(1000.0, 10 * GiB)]}
+
+    def test_growth_and_time_until_full(self):
+        """Test growth per day and time until full from the history"""
+        now = 10 * DAY
+        store = {"trend": [(now - DAY / 2, 9 * GiB)]}
+        params = {"time_to_full": ("fixed", (30 * DAY, 7 * DAY))}
+
+        results = list(check_fill_rate(store, "trend", 10 * GiB, 9 * GiB, params, now))
+
+        assert Metric("fs_growth", 2 * GiB) in results
+        assert Metric("trend_hoursleft", 4.5 * 24) in results
+        time_left = [r for r in results if isinstance(r, Result) and r.summary.startswith("Time until full")][0]
+        assert time_left.state == State.CRIT
+
+    def test_shrinking(self):
+        """Test that a shrinking filesystem has no time until full"""
+        store = {"trend": [(0.0, 10 * GiB)]}
+        results = list(check_fill_rate(store, "trend", 9 * GiB, 91 * GiB, {}, float(DAY)))
+
+        assert Metric("fs_growth", -GiB) in results
+        assert Result(state=State.OK, notice="Time until full: not growing") in results
+        assert not [r for r in results if isinstance(r, Metric) and r.name == "trend_hoursleft"]
+
+    def test_history_is_bounded(self):
+        """Test that the history covers the trend range with a bounded sample count"""
+        store = {}
+        params = {"trend_range": 1}
+        for minute in range(600):
+            list(check_fill_rate(store, "trend", minute * 1024, GiB, params, minute * 60.0))
+
+        samples = store["trend"]
+        assert len(samples) <= FS_TREND_MAX_SAMPLES
+        assert samples[-1][0] - samples[0][0] <= 3600
+        assert samples[0][0] >= 599 * 60 - 3600
+
+
+class TestAveraging:
+    """Tests for levels on sliding averages"""
+
+    def test_sliding_average_window(self):
+        """Test that only samples within the window are averaged"""
+        store = {"average": [(0.0, 100.0), (400.0, 50.0), (500.0, 70.0)]}
+
+        assert sliding_average(store, "average", 90.0, 5, 600.0) == 70.0
+        assert store["average"] == [(400.0, 50.0, 1), (500.0, 70.0, 1), (600.0, 90.0, 1)]
+
+    def test_long_window_is_downsampled(self):
+        """Test that a window longer than the bucket limit averages all its samples"""
+        store = {}
+        minutes = 24 * 60
+        for minute in range(minutes):
+            average = sliding_average(store, "average", 100.0 if minute < 120 else 0.0, minutes, 60.0 * minute)
+
+        assert len(store["average"]) <= AVERAGE_MAX_SAMPLES + 1
+        assert average == pytest.approx(120 / minutes * 100)
+
+    def test_levels_apply_to_average(self):
+        """Test that a short peak is graphed but does not alert"""
+        store = {"average": [(60.0 * minute, 20.0) for minute in range(1, 10)]}
+        results = list(check_levels_averaged(
+            95.0, levels_upper=(80, 90), average=10, value_store=store, key="average",
+            now=600.0, metric_name="util", label="Total",
+        ))
+
+        assert Metric("util", 95.0) in results
+        assert [r.state for r in results if isinstance(r, Result)] == [State.OK, State.OK]
+        assert Metric("util_average", 27.5, levels=(80, 90)) in results
+
+    def test_without_average(self):
+        """Test that levels apply to the raw value without averaging"""
+        results = list(check_levels_averaged(
+            95.0, levels_upper=(80, 90), average=None, value_store={}, key="average",
+            now=600.0, metric_name="util", label="Total",
+        ))
+
+        assert results[0].state == State.CRIT
+        assert len(results) == 2
+
+
+class TestParseCache:
+    """Tests for the parse cache of JSON sections"""
+
+    @pytest.fixture(autouse=True)
+    def empty_cache(self):
+        parse_json_section.cache_clear()
+
+    def test_hit_returns_same_object(self):
+        """Test that an unchanged payload is parsed only once"""
+        raw = json.dumps([{"mountedOn": "/", "used": "42"}])
+
+        first = parse_json_section([[raw]])
+        second = parse_json_section([[raw[:]]])
+
+        assert first is second
+        info = parse_json_section.cache_info()
+        assert (info["hits"], info["misses"], info["size"]) == (1, 1, 1)
+
+    def test_parsed_section_is_read_only(self):
+        """Test that cached sections can not be modified"""
+        section = parse_json_section([[json.dumps({"Ethernet usage": [{"Iface": "eth0"}]})]])
+
+        with pytest.raises(TypeError):
+            section["Ethernet usage"] = []
+        with pytest.raises(TypeError):
+            section["Ethernet usage"].append({"Iface": "eth1"})
+        with pytest.raises(TypeError):
+            section["Ethernet usage"][0]["Iface"] = "eth1"
+        assert dict(section) == {"Ethernet usage": [{"Iface": "eth0"}]}
+        assert isinstance(section["Ethernet usage"], list)
+
+    def test_large_payloads_are_not_cached(self):
+        """Test that payloads above the line limit are parsed every time"""
+        raw = json.dumps(["x" * PARSE_CACHE_MAX_LINE])
+        parse_json_section([[raw]])
+        parse_json_section([[raw]])
+
+        info = parse_json_section.cache_info()
+        assert (info["hits"], info["misses"], info["size"]) == (0, 2, 0)
+
+    def test_resident_size_stays_bounded(self, monkeypatch):
+        """Test that the parsed sections held by the cache stay within the byte limit"""
+        monkeypatch.setattr(redshift_common, "PARSE_CACHE_MAX_BYTES", 1024 * 1024)
+
+        def payload(host):
+            return json.dumps([
+                {"filesystem": f"/dev/sda{disk}", "blocks_1k": str(host * disk), "used": "42",
+                 "available": "1000", "use_percent": "4%", "mountedOn": f"/data/{host}/{disk}"}
+                for disk in range(40)
+            ])
+
+        gc.collect()
+        tracemalloc.start()
+        try:
+            baseline = tracemalloc.get_traced_memory()[0]
+            raw_bytes = 0
+            for host in range(400):
+                raw = payload(host)
+                raw_bytes += len(raw)
+                parse_json_section([[raw]])
+            del raw
+            gc.collect()
+            resident = tracemalloc.get_traced_memory()[0] - baseline
+        finally:
+            tracemalloc.stop()
+
+        info = parse_json_section.cache_info()
+        assert raw_bytes > 2 * redshift_common.PARSE_CACHE_MAX_BYTES
+        assert info["bytes"] <= redshift_common.PARSE_CACHE_MAX_BYTES
+        assert redshift_common.PARSE_CACHE_MAX_BYTES / 2 < resident <= redshift_common.PARSE_CACHE_MAX_BYTES
+
+    def test_hash_collision_is_not_a_hit(self):
+        """Test that payloads with equal length and hash still get their own parse"""
+        class Colliding(str):
+            def __hash__(self):
+                return 42
+
+        first = parse_json_section([[Colliding('{"host": 1}')]])
+        second = parse_json_section([[Colliding('{"host": 2}')]])
+
+        assert (first, second) == ({"host": 1}, {"host": 2})
+        assert parse_json_section.cache_info()["hits"] == 0
+
+    def test_invalid_json_is_cached_as_none(self):
+        """Test that unparsable payloads are cached as well"""
+        assert parse_json_section([["{invalid"]]) is None
+        assert parse_json_section([["{invalid"]]) is None
+        assert parse_json_section.cache_info()["hits"] == 1
+
+
+def _simulated_host_sections(host: int, cycle: int) -> list:
+    """Raw section lines of one host in one check cycle"""
+    chassis = {
+        "Manufacturer": "Redshift Networks", "Product Name": "UCTM-5000",
+        "Serial Number": f"RSN{host:06d}", "Power Supply State": "Safe",
+        "Thermal State": "Safe", "Security Status": "None", "Boot-up State": "Safe",
+    }
+    disk = [
+        {"filesystem": f"/dev/sda{n}", "blocks_1k": "51474912", "used": str(21789456 + host),
+         "available": "29685456", "use_percent": "42%", "mountedOn": f"/mnt/data{n}"}
+        for n in range(20)
+    ]
+    processor = [
+        {"type": "mpstat", "cpu": str(core), "usr": f"{(host + cycle + core) % 90}.5", "sys": "3.1",
+         "iowait": "0.2", "idle": "60.0"}
+        for core in range(8)
+    ]
+    uptime = {"uptime": f"{host + cycle * 60} seconds"}
+    return [json.dumps(chassis), json.dumps(disk), json.dumps(processor), json.dumps(uptime)]
+
+
+@pytest.mark.slow
+class TestParseCacheBenchmark:
+    """Benchmark of the parse cache over a simulated 1,000 host check cycle"""
+
+    HOSTS = 1000
+
+    def _cycle(self, parse_function, cycle: int) -> float:
+        lines = [line for host in range(self.HOSTS) for line in _simulated_host_sections(host, cycle)]
+        start = time.process_time()
+        for line in lines:
+            parse_function([[line]])
+        return time.process_time() - start
+
+    def test_benchmark_cycle(self, capsys):
+        """Parse a second cycle with and without cache and report the CPU saved"""
+        parse_json_section.cache_clear()
+        self._cycle(parse_json_section, cycle=0)
+
+        uncached = self._cycle(inspect.unwrap(parse_json_section), cycle=1)
+        cached = self._cycle(parse_json_section, cycle=1)
+        info = parse_json_section.cache_info()
+
+        with capsys.disabled():
+            print(
+                f"\n{self.HOSTS} hosts: uncached {uncached * 1000:.1f} ms, cached {cached * 1000:.1f} ms "
+                f"CPU, {info['hits']} hits, {info['misses']} misses"
+            )
+        # Chassis and disk are unchanged from cycle 0, some processor
+        # payloads repeat across hosts, uptime changes every cycle
+        assert info["hits"] >= 2 * self.HOSTS
+        assert info["hits"] + info["misses"] == 8 * self.HOSTS
+        assert cached < uncached
+
+
+class TestInstrumentation:
+    """Tests for the opt-in plugin instrumentation"""
+
+    def test_disabled_by_default(self, monkeypatch):
+        """Test that functions are not wrapped without the environment variable"""
+        monkeypatch.setattr(redshift_common, "_PLUGIN_STATS", None)
+
+        def check_something(section):
+            yield Result(state=State.OK, summary="fine")
+
+        assert instrumented(check_something) is check_something
+
+    def test_records_calls_and_items(self, tmp_path):
+        """Test call counts, durations and items of generator and plain functions"""
+        stats = PluginStats(str(tmp_path / "stats.json"), interval=3600)
+
+        @stats.wrap
+        def check_something(section):
+            yield from (Result(state=State.OK, summary=value) for value in section)
+
+        @stats.wrap
+        def parse_something(string_table):
+            return [row[0] for row in string_table]
+
+        assert list(check_something(["a", "b", "c"])) == [
+            Result(state=State.OK, summary=value) for value in "abc"
+        ]
+        list(check_something(["d"]))
+        assert parse_something([["x"], ["y"]]) == ["x", "y"]
+        assert check_something.__name__ == "check_something"
+
+        check = stats.functions["check_something"]
+        assert (check["calls"], check["items"]) == (2, 4)
+        assert 0 <= check["max_seconds"] <= check["total_seconds"]
+        assert stats.functions["parse_something"]["items"] == 2
+        assert not (tmp_path / "stats.json").exists()
+
+    def test_periodic_dump(self, tmp_path):
+        """Test that the statistics are written once the interval has passed"""
+        stats = PluginStats(str(tmp_path / "stats-{pid}.json"), interval=0)
+        stats.wrap(lambda string_table: string_table)([["x"]])
+
+        data = json.loads(next(tmp_path.glob("stats-*.json")).read_text())
+        assert data["functions"]["<lambda>"]["calls"] == 1
+        assert str(data["pid"]) in stats.path
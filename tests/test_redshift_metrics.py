@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for redshift_metrics.py
+"""
+
+import pytest
+
+from agent_based.redshift_metrics import (
+    cpu_utilization,
+    hdd_usage,
+    interface_counters,
+    memory_entry,
+    parse_size,
+    stats_mapping,
+    system_stats_memory,
+)
+
+
+class TestMetricValues:
+    """Tests for the metric values shared by the check plugins and the exporter"""
+
+    def test_parse_size_units(self):
+        """Test sizes are converted by their own unit, falling back to the default"""
+        assert parse_size("3747460 kB (23.0%)") == 3747460 * 1024
+        assert parse_size("1238542 MB") == 1238542 * 1024**2
+        assert parse_size("2 GB", "MB") == 2 * 1024**3
+        assert parse_size("1238542", "MB") == 1238542 * 1024**2
+        with pytest.raises(ValueError):
+            parse_size("12 parsecs")
+
+    def test_system_stats_memory(self):
+        """Test memory of the system statistics list"""
+        stats = stats_mapping([
+            {"type": "Total Memory", "value": "16173828 kB"},
+            {"type": "Used Memory", "value": "3747460 kB (23.0%)"},
+        ])
+
+        assert system_stats_memory(stats) == (3747460 * 1024, 16173828 * 1024)
+        assert system_stats_memory({}) is None
+
+    def test_hdd_usage(self):
+        """Test HDD sizes are reported in MB"""
+        hdd = {"Total Space": "1000 MB", "Used Space": "250 MB", "Used Percentage": "25.0%"}
+
+        assert hdd_usage(hdd) == (250 * 1024**2, 1000 * 1024**2, 25.0)
+        assert hdd_usage({"Total Space": "1000 MB"}) is None
+
+    def test_cpu_and_counters(self):
+        """Test CPU shares and interface counters skip missing or invalid values"""
+        values = cpu_utilization({"cpu": "all", "usr": "20.5", "idle": "70.0"})
+        assert values["util"] == 30.0
+        assert values["user"] == 20.5
+        assert values["steal"] == 0.0
+
+        assert interface_counters({"RX-OK": "10", "TX-OK": "x"}) == {"if_in_pkts": 10}
+        assert memory_entry([{"type": "Swap:"}, {"type": "Mem:", "total": "1"}]) == {"type": "Mem:", "total": "1"}
+        assert memory_entry(None) is None
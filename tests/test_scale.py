@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Scale and memory budget tests for the parse and check functions
+
+The fixtures are generated at the size of the largest appliances seen in
+the field: 512 cores, 5,000 interfaces, 1,000 mounts and a 10 MB system
+statistics payload. Every parse_redshift_* and check_redshift_* function must
+stay within an upper bound of time and tracemalloc peak, so that quadratic
+behaviour or memory blow-ups fail here instead of on a monitoring server.
+"""
+
+import inspect
+import json
+import time
+import tracemalloc
+
+import pytest
+
+from agent_based import redshift, redshift_additional
+from agent_based.redshift_common import parse_json_section
+
+pytestmark = pytest.mark.slow
+
+CORES = 512
+INTERFACES = 5000
+MOUNTS = 1000
+SYSTEM_STATS_BYTES = 10 * 1024 * 1024
+FLEET_DEVICES = 1000
+
+# Items checked per item-based plugin, spread evenly over all items
+SAMPLED_ITEMS = 200
+
+# Upper bounds, generous enough for slow CI runners but far below what a
+# quadratic algorithm needs at these sizes
+PARSE_SECONDS_PER_MB = 1.0
+PARSE_PEAK_PER_PAYLOAD_BYTE = 12
+CHECK_SECONDS = 0.5
+CHECK_SECONDS_PER_ITEM = 0.005
+CHECK_PEAK_BYTES = 4 * 1024 * 1024
+
+# Item checks that aggregate over the whole section get the budget of a
+# check without item per item
+SECTION_WIDE_CHECKS = {"interface_groups"}
+
+
+def _system_stats():
+    stats = [
+        {"type": "Total Memory", "value": "16173828 kB"},
+        {"type": "Used Memory", "value": "3747460 kB (23.0%)"},
+        {"type": "CPU Usage", "value": "15.2%"},
+        {"type": "Days To Expire", "value": "365 days"},
+    ]
+    size = len(json.dumps(stats))
+    port = 0
+    while size < SYSTEM_STATS_BYTES:
+        entry = {"type": f"Port {port} Status", "value": f"up, {port * 7919 % 100000} calls, {port % 97} errors"}
+        stats.append(entry)
+        size += len(json.dumps(entry)) + 2
+        port += 1
+    return stats
+
+
+def _hdd_ethernet():
+    return {
+        "HDD Usage Details": {"Total Space": "1238542 MB", "Used Space": "523456 MB", "Used Percentage": "42.3%"},
+        "Ethernet usage": [
+            {
+                "Iface": f"eth{index // 100}.{index % 100}",
+                "Met": "1500",
+                "IPAddress": f"10.{index // 65536}.{index // 256 % 256}.{index % 256}",
+                "RX-OK": str(index * 1000),
+                "TX-OK": str(index * 900),
+                "RX-ERR": str(index % 3),
+                "TX-ERR": "0",
+                "RX-DRP": str(index % 5),
+                "TX-DRP": "0",
+            }
+            for index in range(INTERFACES)
+        ],
+    }
+
+
+def _processor():
+    cores = [{"type": "mpstat", "cpu": "all", "usr": "15.2", "sys": "5.3", "iowait": "2.1", "idle": "77.4"}]
+    cores.extend(
+        {
+            "type": "mpstat", "cpu": str(core), "usr": f"{core % 90}.5", "sys": "3.1",
+            "iowait": f"{core % 4}.2", "idle": f"{96 - core % 90 * 0.9:.1f}", "nice": "0.1",
+        }
+        for core in range(CORES)
+    )
+    return cores
+
+
+def _disk():
+    return [
+        {
+            "filesystem": f"/dev/mapper/vg{mount // 100}-lv{mount}",
+            "blocks_1k": str(51474912 + mount),
+            "used": str(21789456 + mount * 1000),
+            "available": str(29685456 - mount * 1000),
+            "use_percent": "42%",
+            "mountedOn": f"/data/{mount}",
+        }
+        for mount in range(MOUNTS)
+    ]
+
+
+def _fleet():
+    top = [[f"uctm-{device}", 99.0 - device] for device in range(5)]
+    return {
+        "devices": FLEET_DEVICES,
+        "responding": FLEET_DEVICES,
+        "resources": {
+            resource: {"p50": 40.0, "p95": 85.0, "mean": 42.0, "max": 99.0, "count": FLEET_DEVICES,
+                       "level": 80.0, "above": 60, "top": top}
+            for resource in ("cpu", "memory", "disk")
+        },
+    }
+
+
+PAYLOADS = {
+    "system_stats": _system_stats(),
+    "hdd_ethernet": _hdd_ethernet(),
+    "chassis": {"manufacturer": "Dell Inc.", "serialNumber": "ABC123XYZ", "thermalState": "Safe",
+                "powerSupplyState": "Safe", "boot_upState": "Safe", "securityStatus": "None"},
+    "uptime": {"value": "up 45 days, 3:24:15"},
+    "probe": {"endpoint": "systemdevicestats/uptime", "timeout": 2.0, "status": "ok", "http_status": 200,
+              "rtt": 0.05},
+    "agent": {"runtime": 1.5, "backoff": False, "cpu_usage": 20.0, "cpu_threshold": 90.0, "cached_sections": []},
+    "fleet": _fleet(),
+    "processor": _processor(),
+    "memory": [{"type": "Mem:", "total": "16173828", "used": "3747460", "free": "12426368"},
+               {"type": "Swap:", "total": "8388604", "used": "0", "free": "8388604"}],
+    "disk": _disk(),
+}
+STRING_TABLES = {name: [[json.dumps(payload)]] for name, payload in PAYLOADS.items()}
+
+MODULES = (redshift, redshift_additional)
+
+
+def _plugin_function(prefix: str, name: str):
+    for module in MODULES:
+        function = getattr(module, f"{prefix}_redshift_{name}", None)
+        if function is not None:
+            return function
+    raise LookupError(f"{prefix}_redshift_{name}")
+
+
+def _parsed(name: str):
+    return _plugin_function("parse", name)(STRING_TABLES[name])
+
+
+def _every_nth(items):
+    return items[::max(1, len(items) // SAMPLED_ITEMS)]
+
+
+# Arguments of each check function: a parsed section and the items to check
+# (None for checks without item)
+CHECK_CASES = {
+    "system_stats": lambda: ((_parsed("system_stats"), _parsed("memory")), None),
+    "hdd": lambda: ((_parsed("hdd_ethernet"),), None),
+    "interfaces": lambda: (
+        (_parsed("hdd_ethernet"),),
+        _every_nth([interface["Iface"] for interface in PAYLOADS["hdd_ethernet"]["Ethernet usage"]]),
+    ),
+    "interface_groups": lambda: ((_parsed("hdd_ethernet"),), [f"eth{port}" for port in range(0, 50, 5)]),
+    "chassis": lambda: ((_parsed("chassis"),), None),
+    "uptime": lambda: ((_parsed("uptime"),), None),
+    "probe": lambda: ((_parsed("probe"),), None),
+    "agent": lambda: ((_parsed("agent"),), None),
+    "fleet": lambda: ((_parsed("fleet"),), ["CPU", "Memory", "Disk"]),
+    "processor": lambda: ((_parsed("processor"),), None),
+    "processor_core": lambda: ((_parsed("processor"),), _every_nth([str(core) for core in range(CORES)])),
+    "memory": lambda: ((_parsed("memory"),), None),
+    "disk": lambda: ((_parsed("disk"),), _every_nth([f"/data/{mount}" for mount in range(MOUNTS)])),
+}
+
+
+def _check_call(name: str, sections, item):
+    """Return a function running the check of name once for item"""
+    function = _plugin_function("check", name)
+    plugin = next(
+        getattr(module, f"check_plugin_redshift_{name}") for module in MODULES
+        if hasattr(module, f"check_plugin_redshift_{name}")
+    )
+    params = dict(plugin.kwargs.get("check_default_parameters") or {}) if hasattr(plugin, "kwargs") else {}
+    if name == "interface_groups":
+        params = {"pattern": rf"{item}\."}
+    parameters = inspect.signature(function).parameters
+    args = []
+    if "item" in parameters:
+        args.append(item)
+    if "params" in parameters:
+        args.append(params)
+    args.extend(sections)
+    return lambda: list(function(*args))
+
+
+def _measure(call):
+    """Return the duration and tracemalloc peak of a call"""
+    start = time.perf_counter()
+    call()
+    duration = time.perf_counter() - start
+    tracemalloc.start()
+    try:
+        call()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return duration, peak
+
+
+@pytest.fixture(autouse=True)
+def uncached():
+    """Measure real parsing, not parse cache hits"""
+    parse_json_section.cache_clear()
+    yield
+    parse_json_section.cache_clear()
+
+
+def _functions(prefix: str):
+    return sorted(
+        name[len(prefix) + len("_redshift_"):]
+        for module in MODULES
+        for name, value in vars(module).items()
+        if name.startswith(f"{prefix}_redshift_") and callable(value)
+    )
+
+
+def test_every_function_has_a_scale_case():
+    """Test new parse and check functions cannot skip the scale suite"""
+    assert set(_functions("parse")) <= set(STRING_TABLES)
+    assert set(_functions("check")) == set(CHECK_CASES)
+
+
+@pytest.mark.parametrize("name", _functions("parse"))
+def test_parse_budget(name):
+    """Test parse time and memory stay linear in the payload size"""
+    string_table = STRING_TABLES[name]
+    payload_bytes = len(string_table[0][0])
+    parse_function = _plugin_function("parse", name)
+
+    def parse():
+        parse_json_section.cache_clear()
+        assert parse_function(string_table)
+
+    duration, peak = _measure(parse)
+
+    assert duration <= max(0.05, PARSE_SECONDS_PER_MB * payload_bytes / 2**20)
+    assert peak <= max(2**20, PARSE_PEAK_PER_PAYLOAD_BYTE * payload_bytes)
+
+
+@pytest.mark.parametrize("name", sorted(CHECK_CASES))
+def test_check_budget(name):
+    """Test check time per item and memory stay bounded on the largest sections"""
+    sections, items = CHECK_CASES[name]()
+    calls = [_check_call(name, sections, item) for item in (items or [None])]
+
+    def check_all():
+        for call in calls:
+            assert call()
+
+    duration, peak = _measure(check_all)
+
+    per_item = items and name not in SECTION_WIDE_CHECKS
+    assert duration / len(calls) <= (CHECK_SECONDS_PER_ITEM if per_item else CHECK_SECONDS)
+    assert peak <= CHECK_PEAK_BYTES
@@ -8,6 +8,10 @@ import pytest
 from pydantic import ValidationError
 
 from server_side_calls.redshift import (
+    BackoffParams,
+    EconomyParams,
+    HedgingParams,
+    ProbeParams,
     RedshiftParams,
     generate_redshift_command,
 )
@@ -189,3 +193,106 @@ class TestGenerateRedshiftCommand:
         assert "--verify-ssl" in args
         assert "--sections" in args
         assert "system_stats,chassis" in args
+
+    def test_generate_command_with_hedging(self):
+        """Test command generation with hedged requests enabled"""
+        params = RedshiftParams(hedging=HedgingParams(delay=0.5, max_hedges=2))
+        host_config = MockHostConfig()
+
+        commands = list(generate_redshift_command(params, host_config))
+
+        args = commands[0].command_arguments
+        assert "--hedge" in args
+        assert args[args.index("--hedge-delay") + 1] == "0.5"
+        assert args[args.index("--hedge-max") + 1] == "2"
+
+    def test_generate_command_without_hedging(self):
+        """Test command generation without hedged requests"""
+        params = RedshiftParams()
+        host_config = MockHostConfig()
+
+        commands = list(generate_redshift_command(params, host_config))
+
+        assert "--hedge" not in commands[0].command_arguments
+
+    def test_generate_command_with_economy(self):
+        """Test command generation with economy mode"""
+        params = RedshiftParams(economy=EconomyParams(per_core=True))
+        host_config = MockHostConfig()
+
+        commands = list(generate_redshift_command(params, host_config))
+
+        args = commands[0].command_arguments
+        assert "--economy" in args
+        assert "--economy-per-core" in args
+        assert "--economy-swap" not in args
+
+    def test_generate_command_with_backoff(self):
+        """Test command generation with load-aware scheduling"""
+        params = RedshiftParams(backoff=BackoffParams(cpu_threshold=85.0, max_age=600))
+        host_config = MockHostConfig()
+
+        commands = list(generate_redshift_command(params, host_config))
+
+        args = commands[0].command_arguments
+        assert args[args.index("--backoff-cpu") + 1] == "85.0"
+        assert args[args.index("--backoff-max-age") + 1] == "600"
+
+    def test_generate_command_with_pinned_certificate(self):
+        """Test command generation with a pinned CA file and fingerprint"""
+        params = RedshiftParams(ca_file="/omd/sites/mon/etc/uctm-ca.pem", cert_fingerprint="ab:cd")
+        host_config = MockHostConfig()
+
+        commands = list(generate_redshift_command(params, host_config))
+
+        args = commands[0].command_arguments
+        assert args[args.index("--ca-file") + 1] == "/omd/sites/mon/etc/uctm-ca.pem"
+        assert args[args.index("--cert-fingerprint") + 1] == "ab:cd"
+
+    def test_generate_command_with_fleet(self):
+        """Test command generation for fleet mode"""
+        params = RedshiftParams.model_validate({
+            "fleet": {"devices_file": "/omd/sites/mon/etc/uctm.json", "fleet_host": "dc1-fleet",
+                      "workers": 8, "levels": {"cpu": 85.0, "disk": 90.0}},
+        })
+        host_config = MockHostConfig()
+
+        commands = list(generate_redshift_command(params, host_config))
+
+        args = commands[0].command_arguments
+        assert args[args.index("--devices") + 1] == "/omd/sites/mon/etc/uctm.json"
+        assert args[args.index("--fleet-host") + 1] == "dc1-fleet"
+        assert args[args.index("--fleet-workers") + 1] == "8"
+        assert "--fleet-shards" not in args
+        assert args[args.index("--fleet-levels") + 1] == "cpu=85.0,disk=90.0"
+
+        params = RedshiftParams.model_validate({"fleet": {"devices_file": "/tmp/uctm.json", "shards": 0}})
+        args = list(generate_redshift_command(params, host_config))[0].command_arguments
+        assert args[args.index("--fleet-shards") + 1] == "0"
+
+    def test_generate_command_with_probe(self):
+        """Test command generation for the liveness probe"""
+        params = RedshiftParams.model_validate({"probe": {"timeout": 1.5}})
+        host_config = MockHostConfig()
+
+        commands = list(generate_redshift_command(params, host_config))
+
+        args = commands[0].command_arguments
+        assert params.probe == ProbeParams(timeout=1.5)
+        assert args[args.index("--probe-timeout") + 1] == "1.5"
+        assert "--probe" in args
+        assert "--probe" not in list(
+            generate_redshift_command(RedshiftParams(), host_config)
+        )[0].command_arguments
+
+    def test_generate_command_with_share_cache(self):
+        """Test command generation with cache sharing for the exporter"""
+        params = RedshiftParams(share_cache=True)
+        host_config = MockHostConfig()
+
+        commands = list(generate_redshift_command(params, host_config))
+
+        assert "--share-cache" in commands[0].command_arguments
+        assert "--share-cache" not in list(
+            generate_redshift_command(RedshiftParams(), host_config)
+        )[0].command_arguments